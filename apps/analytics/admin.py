@@ -3,7 +3,9 @@ from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 import json
 
-from .models import Event, Session, FeatureFlag, EventAggregate, DeviceInfo, LocationInfo
+from .models import (
+    Event, Session, FeatureFlag, EventAggregate, SessionAggregate, RollupCubeRow, DeviceInfo, LocationInfo
+)
 
 
 class JSONFieldPrettifyMixin:
@@ -86,7 +88,7 @@ class SessionAdmin(admin.ModelAdmin):
     list_display = ('distinct_id', 'start_time', 'end_time', 'duration_display', 'events_count', 'get_device_id', 'get_country', 'app_check_result')
     list_filter = ('device__os_name', 'device__app_version', 'location__country', 'device__is_simulator', 'device__is_rooted_device', 'device__is_vpn_enabled', 'app_check_result')
     search_fields = ('distinct_id', 'device__device_id', 'location__city', 'location__country')
-    readonly_fields = ('id', 'duration', 'events_count')
+    readonly_fields = ('id', 'duration', 'events_count', 'last_event_at')
     date_hierarchy = 'start_time'
     raw_id_fields = ('device', 'location', 'user')
     
@@ -102,7 +104,7 @@ class SessionAdmin(admin.ModelAdmin):
     
     fieldsets = (
         (None, {
-            'fields': ('id', 'distinct_id', 'start_time', 'end_time', 'duration', 'events_count')
+            'fields': ('id', 'distinct_id', 'start_time', 'end_time', 'duration', 'events_count', 'last_event_at')
         }),
         ('Device Information', {
             'fields': ('device',)
@@ -159,4 +161,18 @@ class EventAggregateAdmin(admin.ModelAdmin, JSONFieldPrettifyMixin):
     def properties_pretty(self, obj):
         """Display the JSON properties in a readable format."""
         return self.prettify_json_field(obj, 'properties')
-    properties_pretty.short_description = 'Properties' 
\ No newline at end of file
+    properties_pretty.short_description = 'Properties' 
+
+
+@admin.register(SessionAggregate)
+class SessionAggregateAdmin(admin.ModelAdmin):
+    list_display = ('date', 'os_name', 'app_version', 'sessions', 'total_duration', 'total_events')
+    list_filter = ('os_name', 'date')
+    date_hierarchy = 'date'
+
+
+@admin.register(RollupCubeRow)
+class RollupCubeRowAdmin(admin.ModelAdmin):
+    list_display = ('cube', 'date', 'hour', 'event_type', 'os_name', 'app_version', 'country', 'is_simulator', 'count')
+    list_filter = ('cube', 'date')
+    date_hierarchy = 'date'
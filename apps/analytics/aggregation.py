@@ -0,0 +1,342 @@
+"""
+Incremental event aggregation into EventAggregate.
+
+Hourly rows are maintained from a watermark on Event.created_at: each run
+finds the (event_type, hour) buckets that received events since the last
+run, including late-arriving events with old timestamps, and recomputes
+only those hours with a single GROUP BY over timestamp ranges. Daily rows
+are derived from the hourly rows instead of rescanning raw events.
+
+Every row stores a HyperLogLog sketch of its distinct_ids, so unique
+users over any range of hours, days and event types are answered by
+merging sketches (see estimate_unique_users).
+
+Each run that writes rows publishes a new aggregates version in the
+shared cache; query results computed from aggregates are cached under
+that version, so they are invalidated exactly when the rows change.
+"""
+import logging
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .hll import HyperLogLog
+from .models import AggregationCheckpoint, Event, EventAggregate
+from .utils import get_tracking_setting
+
+logger = logging.getLogger(__name__)
+
+HOURLY_CHECKPOINT = 'event_aggregate_hourly'
+HOUR = timedelta(hours=1)
+
+VERSION_CACHE_KEY = 'analytics:aggregates:version'
+
+
+def get_aggregates_version():
+    """
+    Token that changes whenever aggregate rows are written.
+    """
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        # Another process may have set it first; use whichever won
+        if not cache.add(VERSION_CACHE_KEY, version, timeout=None):
+            version = cache.get(VERSION_CACHE_KEY, version)
+    return version
+
+
+def bump_aggregates_version():
+    """
+    Invalidate every cached result computed from aggregates.
+    """
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def get_checkpoint(name, default):
+    checkpoint = AggregationCheckpoint.objects.filter(name=name).first()
+    return checkpoint.position if checkpoint else default
+
+
+def set_checkpoint(name, position):
+    AggregationCheckpoint.objects.update_or_create(name=name, defaults={'position': position})
+
+
+def hour_range_filter(hours, field='timestamp'):
+    """
+    Build an OR of half-open [hour, hour + 1h) ranges that can use the timestamp index.
+    """
+    condition = Q()
+    for hour in sorted(hours):
+        condition |= Q(**{f'{field}__gte': hour, f'{field}__lt': hour + HOUR})
+    return condition
+
+
+def hour_floor(value):
+    return timezone.localtime(value).replace(minute=0, second=0, microsecond=0)
+
+
+def hour_ceil(value):
+    floor = hour_floor(value)
+    return floor if floor == value else floor + HOUR
+
+
+def hourly_rows_between(start, end, rows=None):
+    """
+    Filter hourly aggregate rows whose bucket lies in [start, end).
+
+    Args:
+        start (datetime): Aware datetime aligned to the hour
+        end (datetime): Aware datetime aligned to the hour
+        rows (QuerySet, optional): Rows with date and hour columns to
+            filter, EventAggregate by default
+    """
+    start = timezone.localtime(start)
+    end = timezone.localtime(end)
+    rows = EventAggregate.objects.all() if rows is None else rows
+    return rows.filter(
+        Q(hour__isnull=False),
+        Q(date__gt=start.date()) | Q(date=start.date(), hour__gte=start.hour),
+        Q(date__lt=end.date()) | Q(date=end.date(), hour__lt=end.hour),
+    )
+
+
+def aggregated_until():
+    """
+    Start of the hour up to which hourly aggregates are complete.
+    """
+    position = get_checkpoint(HOURLY_CHECKPOINT, None)
+    if position is None:
+        return None
+    return timezone.localtime(position).replace(minute=0, second=0, microsecond=0)
+
+
+def find_dirty_hours(since, until):
+    """
+    Return the hour buckets that received events created in (since, until].
+
+    created_at is stamped when a row is built, not when its transaction
+    commits, so the scan reaches AGGREGATION_RESCAN_SECONDS further back:
+    rows committed up to that long after they were stamped are picked up
+    by a later run instead of falling behind the checkpoint for good.
+    Recomputing an hour is idempotent, so re-scanning costs only time.
+    """
+    rescan = timedelta(seconds=get_tracking_setting('AGGREGATION_RESCAN_SECONDS', 900))
+    return set(
+        Event.objects.filter(created_at__gt=since - rescan, created_at__lte=until)
+        .annotate(bucket=TruncHour('timestamp'))
+        .values_list('bucket', flat=True)
+        .distinct()
+    )
+
+
+def aggregate_hours(hours):
+    """
+    Recompute the hourly aggregates for the given hour buckets.
+
+    Args:
+        hours (iterable): Aware datetimes truncated to the hour
+
+    Returns:
+        int: Number of hourly rows written
+    """
+    hours = set(hours)
+    if not hours:
+        return 0
+
+    # One row per (event_type, hour, user) gives counts, exact uniques and sketches
+    rows = (
+        Event.objects.filter(hour_range_filter(hours))
+        .annotate(bucket=TruncHour('timestamp'))
+        .values_list('event_type', 'bucket', 'distinct_id')
+        .annotate(count=Count('id'))
+    )
+    counts = Counter()
+    sketches = defaultdict(HyperLogLog)
+    users = Counter()
+    for event_type, bucket, distinct_id, count in rows:
+        key = (event_type, bucket)
+        counts[key] += count
+        users[key] += 1
+        sketches[key].add(distinct_id)
+
+    aggregates = [
+        EventAggregate(
+            event_type=event_type,
+            date=bucket.date(),
+            hour=bucket.hour,
+            count=count,
+            unique_users=users[(event_type, bucket)],
+            users_sketch=sketches[(event_type, bucket)].to_bytes(),
+        ) for (event_type, bucket), count in counts.items()
+    ]
+
+    EventAggregate.objects.bulk_create(
+        aggregates,
+        update_conflicts=True,
+        unique_fields=['event_type', 'date', 'hour'],
+        update_fields=['count', 'unique_users', 'users_sketch'],
+    )
+    if aggregates:
+        bump_aggregates_version()
+    return len(aggregates)
+
+
+def rollup_days(dates):
+    """
+    Rebuild the daily aggregates for the given dates from their hourly rows.
+
+    Counts are summed and unique users are estimated by merging the
+    hourly sketches, so no raw events are read.
+    """
+    written = 0
+    for date in sorted(set(dates)):
+        counts = Counter()
+        sketches = defaultdict(HyperLogLog)
+        hourly = EventAggregate.objects.filter(date=date, hour__isnull=False) \
+            .values_list('event_type', 'count', 'users_sketch')
+        for event_type, count, sketch in hourly:
+            counts[event_type] += count
+            if sketch:
+                sketches[event_type].merge(HyperLogLog.from_bytes(sketch))
+
+        # hour IS NULL never conflicts in the unique constraint, so replace the rows
+        with transaction.atomic():
+            EventAggregate.objects.filter(date=date, hour__isnull=True).delete()
+            EventAggregate.objects.bulk_create([
+                EventAggregate(
+                    event_type=event_type,
+                    date=date,
+                    hour=None,  # None indicates a daily aggregate
+                    count=count,
+                    unique_users=sketches[event_type].count(),
+                    users_sketch=sketches[event_type].to_bytes(),
+                ) for event_type, count in counts.items()
+            ])
+        written += len(counts)
+    if dates:
+        bump_aggregates_version()
+    return written
+
+
+def aggregated_counts(start, end, event_type=None):
+    """
+    Sum aggregated event counts per event type over [start, end).
+
+    Whole days are read from their daily row when it exists, the
+    remaining hours from hourly rows, so long ranges touch few rows.
+
+    Args:
+        start (datetime): Aware datetime aligned to the hour
+        end (datetime): Aware datetime aligned to the hour
+        event_type (str, optional): Restrict to this event type
+
+    Returns:
+        Counter: Event count per event type
+    """
+    start = timezone.localtime(start)
+    end = timezone.localtime(end)
+    rows = EventAggregate.objects.all()
+    if event_type:
+        rows = rows.filter(event_type=event_type)
+
+    counts = Counter()
+    first_full_day = start.date() if start.time() == time.min else start.date() + timedelta(days=1)
+    daily = rows.filter(hour__isnull=True, date__gte=first_full_day, date__lt=end.date())
+    covered_days = set(daily.values_list('date', flat=True).distinct())
+    if covered_days:
+        counts.update(dict(
+            daily.values('event_type').annotate(total=Sum('count')).values_list('event_type', 'total')
+        ))
+
+    hourly = hourly_rows_between(start, end).exclude(date__in=covered_days)
+    if event_type:
+        hourly = hourly.filter(event_type=event_type)
+    counts.update(dict(
+        hourly.values('event_type').annotate(total=Sum('count')).values_list('event_type', 'total')
+    ))
+    return counts
+
+
+def estimate_unique_users(start, end, event_types=None):
+    """
+    Estimate distinct users with events in [start, end) by merging sketches.
+
+    Whole days use their daily row when it exists; the remaining time is
+    covered by hourly rows, so the range is effectively rounded out to
+    whole hours. The result carries the sketch's relative standard error
+    (about 1.6%).
+
+    Args:
+        start (datetime): Range start (aware)
+        end (datetime): Range end, exclusive (aware)
+        event_types (list, optional): Restrict to these event types
+
+    Returns:
+        HyperLogLog: Merged sketch; call count() for the estimate
+    """
+    rows = EventAggregate.objects.filter(users_sketch__isnull=False)
+    if event_types:
+        rows = rows.filter(event_type__in=event_types)
+
+    start = timezone.localtime(start)
+    end = timezone.localtime(end)
+    first_full_day = start.date() if start.time() == time.min else start.date() + timedelta(days=1)
+
+    sketch = HyperLogLog()
+    daily = rows.filter(hour__isnull=True, date__gte=first_full_day, date__lt=end.date()) \
+        .values_list('date', 'users_sketch')
+    covered_days = set()
+    for date, data in daily:
+        covered_days.add(date)
+        sketch.merge(HyperLogLog.from_bytes(data))
+
+    start_hour = start.replace(minute=0, second=0, microsecond=0)
+    hourly = rows.filter(hour__isnull=False, date__gte=start.date(), date__lte=end.date()) \
+        .exclude(date__in=covered_days) \
+        .values_list('date', 'hour', 'users_sketch')
+    for date, hour, data in hourly:
+        bucket = timezone.make_aware(datetime.combine(date, time(hour)))
+        if start_hour <= bucket < end:
+            sketch.merge(HyperLogLog.from_bytes(data))
+
+    return sketch
+
+
+def aggregate_new_events():
+    """
+    Bring hourly aggregates up to date with events created since the last run.
+
+    Events created within AGGREGATION_LAG_SECONDS are left for the next
+    run, and each run re-scans AGGREGATION_RESCAN_SECONDS behind the
+    checkpoint (see find_dirty_hours), so transactions that commit late
+    are not skipped. Completed days touched by late-arriving events get
+    their daily rows rebuilt.
+
+    Returns:
+        dict: Summary of the run
+    """
+    now = timezone.now()
+    until = now - timedelta(seconds=get_tracking_setting('AGGREGATION_LAG_SECONDS', 60))
+    # First run: start where the former hourly job would have
+    default_since = (now - HOUR).replace(minute=0, second=0, microsecond=0)
+    since = get_checkpoint(HOURLY_CHECKPOINT, default_since)
+    if until <= since:
+        return {'hours': 0, 'rows': 0, 'days': 0}
+
+    hours = find_dirty_hours(since, until)
+    rows = aggregate_hours(hours)
+
+    today = timezone.localdate(now)
+    late_days = {hour.date() for hour in hours if hour.date() < today}
+    days = rollup_days(late_days) if late_days else 0
+
+    set_checkpoint(HOURLY_CHECKPOINT, until)
+    if hours:
+        logger.info(f"Aggregated {len(hours)} hours ({rows} rows) from events created up to {until}")
+    return {'hours': len(hours), 'rows': rows, 'days': days}
@@ -0,0 +1,250 @@
+"""
+Native async capture endpoints for ASGI deployments.
+
+These views mirror capture, batch_capture and session_start in views.py
+without the DRF request/serializer stack: the body is decoded once,
+validated against the compiled schemas in validation.py and, in buffered
+mode, appended to the Redis stream with the asyncio client. A worker
+process therefore never parks a thread on Postgres or Redis and can hold
+thousands of concurrent SDK connections. Decompressing, decoding and
+validating a body is CPU-bound, so it runs in a worker thread and only
+the awaits stay on the event loop.
+
+They are routed instead of the DRF views when EVENT_TRACKING['ASYNC_INGESTION']
+is enabled. Requests are authenticated with JWTAuthentication like the
+API default, so tokens of deleted or inactive users are refused. Session
+cookies are not accepted: the views are CSRF-exempt and SDKs always send
+a bearer token.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework.exceptions import APIException, AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .buffer import BufferFull, async_enqueue_events, is_buffered_mode
+from .parsers import EventStream, parse_batch_body
+from .serializers import SessionSerializer
+from .throttling import async_check_ingest_limits
+from .utils import bulk_create_events, create_session, get_client_ip
+from .validation import (
+    stream_progress, stream_summary, validate_batch, validate_event, validate_session, validate_stream
+)
+
+jwt_authentication = JWTAuthentication()
+
+
+def authentication_error(request):
+    """
+    Return a 401 response unless the request carries a valid access token.
+
+    The token's user is loaded from the database, so this runs through
+    sync_to_async.
+    """
+    try:
+        if jwt_authentication.authenticate(request) is not None:
+            return None
+        body = {'detail': 'Authentication credentials were not provided.'}
+    except AuthenticationFailed as e:
+        # simplejwt details are already {'detail': ..., 'code': ...}, as DRF renders them
+        body = e.detail if isinstance(e.detail, dict) else {'detail': e.detail}
+    response = JsonResponse(body, status=401)
+    response['WWW-Authenticate'] = jwt_authentication.authenticate_header(request)
+    return response
+
+
+def parse_body(request):
+    """
+    Decode a JSON request body; returns (data, error response).
+    """
+    try:
+        return json.loads(request.body), None
+    except (ValueError, UnicodeDecodeError) as e:
+        return None, JsonResponse({'detail': f'JSON parse error - {e}'}, status=400)
+
+
+def decode_and_validate(request, validate):
+    """
+    Decode a JSON body and validate it; returns (cleaned data, error response).
+
+    Runs in a worker thread, off the event loop.
+    """
+    data, error = parse_body(request)
+    if error:
+        return None, error
+    cleaned, errors = validate(data)
+    if errors:
+        return None, JsonResponse(errors, status=400)
+    return cleaned, None
+
+
+def decode_batch(request):
+    """
+    Decode and validate a /batch/ body; returns (events, error response).
+
+    JSON bodies are decoded and validated here, in a worker thread. NDJSON
+    and msgpack uploads are returned as an EventStream that
+    capture_event_stream decodes chunk by chunk.
+    """
+    try:
+        data = parse_batch_body(
+            request, request.META.get('CONTENT_TYPE'), request.headers.get('Content-Encoding', '')
+        )
+    except APIException as e:
+        return None, JsonResponse({'detail': e.detail}, status=e.status_code)
+    if isinstance(data, EventStream):
+        return data, None
+    batch, errors = validate_batch(data)
+    if errors:
+        return None, JsonResponse(errors, status=400)
+    return batch, None
+
+
+def buffer_full_response(progress=None):
+    response = JsonResponse({'error': 'Event buffer is full, retry later', **(progress or {})}, status=503)
+    response['Retry-After'] = '30'
+    return response
+
+
+def throttled_response(throttled):
+    response = JsonResponse({'error': throttled.message}, status=throttled.status_code)
+    response['Retry-After'] = str(throttled.retry_after)
+    return response
+
+
+async def store_events(events_data):
+    """
+    Hand validated events to the buffer, or write them directly in sync mode.
+    """
+    if is_buffered_mode():
+        await async_enqueue_events(events_data)
+    else:
+        await sync_to_async(bulk_create_events)(events_data)
+
+
+@csrf_exempt
+@require_POST
+async def capture(request):
+    """
+    Public endpoint to capture events from mobile apps.
+    """
+    error = await sync_to_async(authentication_error)(request)
+    if error:
+        return error
+    # The IP bucket is charged before the body is even parsed
+    client_ip = get_client_ip(request)
+    throttled = await async_check_ingest_limits('capture', client_ip)
+    if throttled:
+        return throttled_response(throttled)
+    event_data, error = await sync_to_async(decode_and_validate, thread_sensitive=False)(request, validate_event)
+    if error:
+        return error
+
+    throttled = await async_check_ingest_limits('capture', None, [event_data['device_id']])
+    if throttled:
+        return throttled_response(throttled)
+    if not event_data.get('ip_address'):
+        event_data['ip_address'] = client_ip
+
+    try:
+        await store_events([event_data])
+    except BufferFull:
+        return buffer_full_response()
+    return JsonResponse({'status': 'success'}, status=202)
+
+
+@csrf_exempt
+@require_POST
+async def batch_capture(request):
+    """
+    Public endpoint to capture multiple events at once.
+    """
+    error = await sync_to_async(authentication_error)(request)
+    if error:
+        return error
+    throttled = await async_check_ingest_limits('batch', get_client_ip(request))
+    if throttled:
+        return throttled_response(throttled)
+    batch, error = await sync_to_async(decode_batch, thread_sensitive=False)(request)
+    if error:
+        return error
+    if isinstance(batch, EventStream):
+        # Device ids are only known while decoding, so streams are limited per IP
+        return await capture_event_stream(batch)
+
+    throttled = await async_check_ingest_limits(
+        'batch', None, [event['device_id'] for event in batch]
+    )
+    if throttled:
+        return throttled_response(throttled)
+
+    try:
+        await store_events(batch)
+    except BufferFull:
+        return buffer_full_response()
+    return JsonResponse({'status': 'success', 'event_count': len(batch)}, status=202)
+
+
+async def capture_event_stream(events):
+    """
+    Validate and store a streamed upload one MAX_BATCH_SIZE chunk at a time.
+
+    Like the DRF view, a failure part-way through reports stream_progress.
+    Each chunk is decoded and validated in a worker thread.
+    """
+    stored = 0
+    resume_from = 0
+    rejected = {}
+    chunks = validate_stream(events)
+    next_chunk = sync_to_async(next, thread_sensitive=False)
+    try:
+        while True:
+            chunk = await next_chunk(chunks, None)
+            if chunk is None:
+                break
+            batch, errors, consumed = chunk
+            if batch:
+                try:
+                    await store_events(batch)
+                except BufferFull:
+                    return buffer_full_response(stream_progress(stored, resume_from))
+                stored += len(batch)
+            rejected.update(errors)
+            resume_from = consumed
+    except APIException as e:
+        return JsonResponse({'detail': e.detail, **stream_progress(stored, resume_from)}, status=e.status_code)
+
+    payload, status_code = stream_summary(stored, rejected)
+    return JsonResponse(payload, status=status_code)
+
+
+def start_session(session_data):
+    session = create_session(session_data)
+    return SessionSerializer(session).data
+
+
+@csrf_exempt
+@require_POST
+async def session_start(request):
+    """
+    Endpoint to start a new session.
+    """
+    error = await sync_to_async(authentication_error)(request)
+    if error:
+        return error
+    session_data, error = await sync_to_async(decode_and_validate, thread_sensitive=False)(
+        request, validate_session
+    )
+    if error:
+        return error
+    if not session_data.get('ip_address'):
+        session_data['ip_address'] = get_client_ip(request)
+    session_data['start_time'] = timezone.now()
+
+    # The session id is returned to the client, so this write stays synchronous
+    payload = await sync_to_async(start_session)(session_data)
+    return JsonResponse(payload, status=201)
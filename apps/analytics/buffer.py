@@ -0,0 +1,291 @@
+"""
+Write-behind ingestion buffer.
+
+When EVENT_TRACKING['INGESTION_MODE'] is 'buffered', the capture endpoints
+append validated payloads to a Redis stream and return immediately. The
+flush_event_buffer task drains the stream in large chunks through
+bulk_create_events.
+
+Delivery is at-least-once: entries are read through a consumer group and
+only acknowledged after the database transaction commits. Entries left
+pending by a crashed flusher are reclaimed after BUFFER_CLAIM_IDLE_SECONDS.
+Every payload carries an event_id (assigned here when the client did not
+send one), so a redelivered entry is dropped by the dedup window in
+bulk_create_events instead of being stored twice.
+
+The async capture views append through async_enqueue_events, which uses a
+pooled redis.asyncio client so the event loop never blocks on Redis.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+import weakref
+from datetime import date, datetime
+
+import redis.asyncio
+from django.conf import settings
+from django.db import OperationalError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django_redis import get_redis_connection
+from redis.exceptions import ResponseError
+
+from .utils import bulk_create_events, get_tracking_setting
+
+logger = logging.getLogger(__name__)
+
+CONSUMER_GROUP = 'event-flushers'
+
+# Appends all payloads only if the stream stays under the length limit,
+# so the backpressure check and the write share one round-trip
+ENQUEUE_SCRIPT = """
+local limit = tonumber(ARGV[1])
+if limit > 0 and redis.call('XLEN', KEYS[1]) + #ARGV - 1 > limit then
+    return -1
+end
+for i = 2, #ARGV do
+    redis.call('XADD', KEYS[1], '*', 'e', ARGV[i])
+end
+return #ARGV - 1
+"""
+
+
+class BufferFull(Exception):
+    """
+    Raised when the buffer is at capacity and the client should retry later.
+    """
+
+
+def is_buffered_mode():
+    """
+    Whether the capture endpoints should write to the buffer.
+    """
+    return get_tracking_setting('INGESTION_MODE', 'sync') == 'buffered'
+
+
+def get_stream_key():
+    return get_tracking_setting('BUFFER_STREAM_KEY', 'analytics:event_buffer')
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if hasattr(value, 'pk'):
+        # Model instances such as the validated session
+        return str(value.pk)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def serialize_event(event_data):
+    """
+    Encode a validated event payload for the stream.
+
+    Args:
+        event_data (dict): Validated event data as produced by EventSerializer
+
+    Returns:
+        str: JSON payload that always contains an event_id and a timestamp
+    """
+    payload = dict(event_data)
+    if not payload.get('event_id'):
+        payload['event_id'] = uuid.uuid4()
+    # Fixed at enqueue so a redelivered entry has the same (id, timestamp) key
+    if not payload.get('timestamp'):
+        payload['timestamp'] = timezone.now()
+    return json.dumps(payload, default=_encode_value)
+
+
+def deserialize_event(raw):
+    """
+    Decode a stream payload back into the format accepted by bulk_create_events.
+    """
+    event_data = json.loads(raw)
+    if event_data.get('timestamp'):
+        event_data['timestamp'] = parse_datetime(event_data['timestamp'])
+    return event_data
+
+
+def enqueue_events(events_data):
+    """
+    Append validated events to the buffer in a single Redis round-trip.
+
+    Args:
+        events_data (list): Validated event dictionaries
+
+    Returns:
+        int: Number of events appended
+
+    Raises:
+        BufferFull: If appending would exceed BUFFER_MAX_LENGTH
+    """
+    if not events_data:
+        return 0
+
+    conn = get_redis_connection('default')
+    script = conn.register_script(ENQUEUE_SCRIPT)
+    limit = get_tracking_setting('BUFFER_MAX_LENGTH', 1000000)
+    result = script(
+        keys=[get_stream_key()],
+        args=[limit] + [serialize_event(event_data) for event_data in events_data]
+    )
+    if result < 0:
+        raise BufferFull(f"Event buffer is at capacity ({limit} events)")
+    return result
+
+
+# redis.asyncio connections belong to the loop that opened them
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_redis():
+    """
+    Pooled asyncio Redis client for the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        # A blocking pool queues callers when every connection is busy instead
+        # of failing, so bursts beyond the pool size wait rather than error
+        pool = redis.asyncio.BlockingConnectionPool.from_url(
+            settings.CACHES['default']['LOCATION'],
+            max_connections=get_tracking_setting('BUFFER_REDIS_MAX_CONNECTIONS', 100),
+            timeout=10,
+        )
+        client = redis.asyncio.Redis(connection_pool=pool)
+        _async_clients[loop] = client
+    return client
+
+
+async def async_enqueue_events(events_data):
+    """
+    Async counterpart of enqueue_events for the ASGI capture views.
+
+    Raises:
+        BufferFull: If appending would exceed BUFFER_MAX_LENGTH
+    """
+    if not events_data:
+        return 0
+
+    script = get_async_redis().register_script(ENQUEUE_SCRIPT)
+    limit = get_tracking_setting('BUFFER_MAX_LENGTH', 1000000)
+    result = await script(
+        keys=[get_stream_key()],
+        args=[limit] + [serialize_event(event_data) for event_data in events_data]
+    )
+    if result < 0:
+        raise BufferFull(f"Event buffer is at capacity ({limit} events)")
+    return result
+
+
+def get_buffer_length():
+    """
+    Number of entries currently held in the buffer, including unacknowledged ones.
+    """
+    return get_redis_connection('default').xlen(get_stream_key())
+
+
+def _ensure_consumer_group(conn, key):
+    try:
+        conn.xgroup_create(key, CONSUMER_GROUP, id='0', mkstream=True)
+    except ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def _consumer_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _read_chunk(conn, key, consumer, count):
+    """
+    Return the next chunk of entries, preferring stale entries from dead flushers.
+    """
+    min_idle_ms = get_tracking_setting('BUFFER_CLAIM_IDLE_SECONDS', 300) * 1000
+    claimed = conn.xautoclaim(key, CONSUMER_GROUP, consumer, min_idle_ms, count=count)
+    # Entries trimmed while pending come back without fields
+    stale = [(entry_id, fields) for entry_id, fields in claimed[1] if fields] if claimed else []
+    if stale:
+        return stale
+
+    response = conn.xreadgroup(CONSUMER_GROUP, consumer, {key: '>'}, count=count)
+    if not response:
+        return []
+    return response[0][1]
+
+
+def _write_entries(conn, key, entries):
+    """
+    Store a chunk of entries, isolating payloads that cannot be written.
+
+    Payloads that fail on their own are moved to a dead-letter list so one
+    malformed entry cannot block the stream.
+
+    Returns:
+        list: The created events
+    """
+    try:
+        return bulk_create_events([deserialize_event(fields[b'e']) for _, fields in entries])
+    except OperationalError:
+        # The database is unavailable; leave the entries pending for a retry
+        raise
+    except Exception:
+        logger.exception(f"Bulk flush of {len(entries)} buffered events failed, retrying one by one")
+
+    events = []
+    for entry_id, fields in entries:
+        try:
+            events.extend(bulk_create_events([deserialize_event(fields[b'e'])]))
+        except OperationalError:
+            raise
+        except Exception:
+            logger.exception(f"Moving buffered event {entry_id!r} to the dead-letter list")
+            conn.rpush(f"{key}:dead", fields[b'e'])
+    return events
+
+
+def flush_buffer(chunk_size=None, max_chunks=None):
+    """
+    Drain the buffer into the database.
+
+    Args:
+        chunk_size (int, optional): Entries per bulk write. Defaults to
+            EVENT_TRACKING['BUFFER_FLUSH_CHUNK_SIZE'].
+        max_chunks (int, optional): Stop after this many chunks so a single
+            run cannot monopolise a worker.
+
+    Returns:
+        tuple: (number of entries drained, ids of the events created)
+    """
+    chunk_size = chunk_size or get_tracking_setting('BUFFER_FLUSH_CHUNK_SIZE', 5000)
+    conn = get_redis_connection('default')
+    key = get_stream_key()
+    consumer = _consumer_name()
+    _ensure_consumer_group(conn, key)
+
+    drained = 0
+    created_ids = []
+    chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        entries = _read_chunk(conn, key, consumer, chunk_size)
+        if not entries:
+            break
+
+        events = _write_entries(conn, key, entries)
+
+        # Acknowledge only after the rows are committed
+        entry_ids = [entry_id for entry_id, _ in entries]
+        pipe = conn.pipeline(transaction=False)
+        pipe.xack(key, CONSUMER_GROUP, *entry_ids)
+        pipe.xdel(key, *entry_ids)
+        pipe.execute()
+
+        drained += len(entries)
+        created_ids.extend(str(event.id) for event in events)
+        chunks += 1
+
+    return drained, created_ids
@@ -0,0 +1,283 @@
+"""
+PostgreSQL COPY loader for events.
+
+Multi-row INSERTs spend most of their time parsing SQL and binding
+parameters. COPY FROM STDIN streams rows in PostgreSQL's text format
+instead, so a single connection is limited by index maintenance rather
+than by statement overhead.
+
+copy_events takes Event instances or plain dicts whose foreign keys
+(device_id, location_id, session_id, user_id) are already resolved and
+streams them in a single COPY without materialising the whole payload;
+rows are encoded lazily as PostgreSQL reads the stream. With ignore_conflicts the
+rows are copied into a temporary staging table first and moved over with
+INSERT ... SELECT ... ON CONFLICT DO NOTHING, since COPY itself cannot
+skip duplicates. copy_new_events does the same and returns the ids that
+were actually inserted; insert_new_events is its multi-row INSERT
+counterpart for small batches.
+
+On other databases copy_events falls back to bulk_create, so callers
+need no vendor checks.
+
+PostgreSQL cannot store NUL in text or jsonb, whether it arrives by COPY
+or INSERT, so the capture schemas reject it (and lone surrogates, which
+are not valid UTF-8) before events reach this module.
+"""
+import io
+from operator import attrgetter
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, models, transaction
+from django.utils import timezone
+
+from .models import Event
+
+COPY_CHUNK_SIZE = 5000
+COPY_BUFFER_SIZE = 1024 * 1024
+
+TABLE = Event._meta.db_table
+STAGING = f'{TABLE}_copy_staging'
+FIELDS = Event._meta.concrete_fields
+PK = Event._meta.pk
+COLUMNS = ', '.join(f'"{field.column}"' for field in FIELDS)
+
+# COPY text format escapes
+_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+_json_encoder = DjangoJSONEncoder(separators=(',', ':'))
+
+
+def _encode_text(value):
+    return '\\N' if value is None else value.translate(_ESCAPES)
+
+
+def _encode_plain(value):
+    # Numbers and UUIDs never contain characters that need escaping
+    return '\\N' if value is None else str(value)
+
+
+def _encode_bool(value):
+    if value is None:
+        return '\\N'
+    return 't' if value else 'f'
+
+
+def _encode_datetime(value):
+    return '\\N' if value is None else value.isoformat()
+
+
+def _encode_json(value):
+    if value is None:
+        return '\\N'
+    return _json_encoder.encode(value).translate(_ESCAPES)
+
+
+def _encoder(field):
+    if isinstance(field, models.JSONField):
+        return _encode_json
+    if isinstance(field, models.BooleanField):
+        return _encode_bool
+    if isinstance(field, models.DateField):
+        return _encode_datetime
+    if isinstance(field, (models.CharField, models.TextField, models.GenericIPAddressField)):
+        return _encode_text
+    target = field.target_field if field.is_relation else field
+    if isinstance(target, (models.CharField, models.TextField)):
+        return _encode_text
+    return _encode_plain
+
+
+def encode_rows(events, chunk_size=COPY_CHUNK_SIZE):
+    """
+    Encode events in the COPY text format.
+
+    Args:
+        events (iterable): Event instances, or dicts keyed by field attname
+            (e.g. 'device_id'); missing keys take the field default
+        chunk_size (int): Rows per yielded chunk
+
+    Returns:
+        iterator: UTF-8 encoded chunks of tab-separated lines
+    """
+    get_values = attrgetter(*(field.attname for field in FIELDS))
+    defaults = [(field.attname, field.get_default) for field in FIELDS]
+    encoders = [_encoder(field) for field in FIELDS]
+    # Columns save() would fill with the current time
+    auto_now = [
+        index for index, field in enumerate(FIELDS)
+        if getattr(field, 'auto_now_add', False) or getattr(field, 'auto_now', False)
+    ]
+    now = timezone.now()
+    lines = []
+    for event in events:
+        if isinstance(event, dict):
+            values = [event[attname] if attname in event else default() for attname, default in defaults]
+        else:
+            values = list(get_values(event))
+        for index in auto_now:
+            if values[index] is None:
+                values[index] = now
+                if not isinstance(event, dict):
+                    setattr(event, FIELDS[index].attname, now)
+        lines.append('\t'.join([encode(value) for encode, value in zip(encoders, values)]))
+        if len(lines) >= chunk_size:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class _ChunkReader(io.RawIOBase):
+    """
+    Read-only file over an iterator of byte chunks, for psycopg2's copy_expert.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = bytearray()
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while len(self.buffer) < len(target):
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        size = min(len(target), len(self.buffer))
+        target[:size] = self.buffer[:size]
+        del self.buffer[:size]
+        return size
+
+
+def _copy(connection, cursor, sql, chunks):
+    raw = cursor.cursor
+    # Raise IntegrityError and friends like the ORM does
+    with connection.wrap_database_errors:
+        if hasattr(raw, 'copy_expert'):
+            # psycopg2
+            raw.copy_expert(sql, _ChunkReader(chunks), size=COPY_BUFFER_SIZE)
+        else:
+            # psycopg 3
+            with raw.copy(sql) as copy:
+                for chunk in chunks:
+                    copy.write(chunk)
+
+
+def copy_events(events, ignore_conflicts=False, chunk_size=COPY_CHUNK_SIZE, using='default'):
+    """
+    Load events into analytics_event with COPY FROM STDIN.
+
+    Args:
+        events (iterable): Event instances, or dicts keyed by field attname,
+            with their foreign keys resolved; may be a generator. Dicts
+            skip model instantiation, which dominates the cost of large loads.
+        ignore_conflicts (bool): Skip events whose primary key already exists
+        chunk_size (int): Rows encoded per write to the COPY stream
+        using (str): Database alias
+
+    Returns:
+        int: Number of rows inserted; skipped duplicates are not counted
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        events = [Event(**event) if isinstance(event, dict) else event for event in events]
+        if ignore_conflicts:
+            return len(insert_new_events(events, batch_size=chunk_size, using=using))
+        Event.objects.using(using).bulk_create(events, batch_size=chunk_size)
+        return len(events)
+
+    count = 0
+
+    def counted(rows):
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+
+    chunks = encode_rows(counted(events), chunk_size)
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        if not ignore_conflicts:
+            _copy(connection, cursor, f'COPY "{TABLE}" ({COLUMNS}) FROM STDIN', chunks)
+            return count
+        _copy_into_staging(connection, cursor, chunks)
+        return _move_from_staging(cursor, returning=False)
+
+
+def copy_new_events(events, chunk_size=COPY_CHUNK_SIZE, using='default'):
+    """
+    COPY events, skipping existing primary keys, and report which were inserted.
+
+    Returns:
+        set: Primary keys of the events that were inserted
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        events = [Event(**event) if isinstance(event, dict) else event for event in events]
+        return insert_new_events(events, batch_size=chunk_size, using=using)
+
+    chunks = encode_rows(events, chunk_size)
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        _copy_into_staging(connection, cursor, chunks)
+        return _move_from_staging(cursor, returning=True)
+
+
+def _copy_into_staging(connection, cursor, chunks):
+    cursor.execute(
+        f'CREATE TEMPORARY TABLE IF NOT EXISTS "{STAGING}" '
+        f'(LIKE "{TABLE}" INCLUDING DEFAULTS) ON COMMIT DELETE ROWS'
+    )
+    _copy(connection, cursor, f'COPY "{STAGING}" ({COLUMNS}) FROM STDIN', chunks)
+
+
+def _move_from_staging(cursor, returning):
+    sql = f'INSERT INTO "{TABLE}" ({COLUMNS}) SELECT {COLUMNS} FROM "{STAGING}" ON CONFLICT DO NOTHING'
+    if returning:
+        cursor.execute(f'{sql} RETURNING "{PK.column}"')
+        result = {PK.to_python(row[0]) for row in cursor.fetchall()}
+    else:
+        cursor.execute(sql)
+        result = cursor.rowcount
+    # ON COMMIT DELETE ROWS only empties it at the outermost commit
+    cursor.execute(f'TRUNCATE "{STAGING}"')
+    return result
+
+
+def insert_new_events(events, batch_size=1000, using='default'):
+    """
+    INSERT events, skipping existing primary keys, and report which were inserted.
+
+    Unlike bulk_create(ignore_conflicts=True) this tells apart the rows
+    that were written from the ones a concurrent writer stored first.
+    Uses INSERT ... ON CONFLICT DO NOTHING RETURNING, which SQLite (3.35+)
+    also understands.
+
+    Args:
+        events (list): Event instances; created_at is filled in like save() does
+        batch_size (int): Maximum number of rows per INSERT statement
+        using (str): Database alias
+
+    Returns:
+        set: Primary keys of the events that were inserted
+    """
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in FIELDS)
+    placeholders = '(' + ', '.join(['%s'] * len(FIELDS)) + ')'
+
+    inserted = set()
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for offset in range(0, len(events), batch_size):
+            chunk = events[offset:offset + batch_size]
+            params = [
+                field.get_db_prep_save(field.pre_save(event, True), connection)
+                for event in chunk for field in FIELDS
+            ]
+            cursor.execute(
+                f'INSERT INTO {quote(TABLE)} ({columns}) VALUES {", ".join([placeholders] * len(chunk))} '
+                f'ON CONFLICT DO NOTHING RETURNING {quote(PK.column)}',
+                params
+            )
+            inserted.update(PK.to_python(row[0]) for row in cursor.fetchall())
+    return inserted
@@ -0,0 +1,248 @@
+"""
+Query layer for the analytics dashboard.
+
+Completed hours are answered from hourly EventAggregate rows; raw events
+are only read for the tail after the last aggregated hour (normally the
+current partial hour). Results are cached per (days, event_type) for
+DASHBOARD_CACHE_SECONDS, keyed by the aggregates version so an
+aggregation run invalidates them. Session KPIs come from the daily
+SessionAggregate rollup of ended sessions, and the OS and app version
+breakdowns from the rollup cubes.
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .aggregation import (
+    aggregated_counts, aggregated_until, estimate_unique_users, get_aggregates_version,
+    hour_ceil, hour_floor, hourly_rows_between,
+)
+from .models import Event, EventAggregate, SessionAggregate
+from .rollup_cube import breakdown
+from .session_aggregation import summarize_sessions
+from .utils import get_tracking_setting
+
+# Expiry for results that only change with the aggregates version
+AGGREGATED_CACHE_SECONDS = 24 * 3600
+
+
+def growth_rate(current, previous):
+    if previous > 0:
+        return round(((current - previous) / previous) * 100, 1)
+    return 100
+
+
+class EventWindow:
+    """
+    Event metrics over [start, now), split into an aggregated part and a raw tail.
+    """
+
+    def __init__(self, start, end, raw_from, event_type=''):
+        self.start = start
+        self.end = end
+        # Hourly aggregates cover [start, raw_from); raw events cover the rest
+        self.raw_from = max(start, min(raw_from, end))
+        self.event_type = event_type
+
+    def aggregates(self):
+        rows = hourly_rows_between(self.start, self.raw_from)
+        if self.event_type:
+            rows = rows.filter(event_type=self.event_type)
+        return rows
+
+    def raw_events(self):
+        events = Event.objects.filter(timestamp__gte=self.raw_from, timestamp__lt=self.end)
+        if self.event_type:
+            events = events.filter(event_type=self.event_type)
+        return events
+
+    def total(self):
+        aggregated = self.aggregates().aggregate(total=Sum('count'))['total'] or 0
+        if self.raw_from >= self.end:
+            return aggregated
+        return aggregated + self.raw_events().count()
+
+    def unique_users(self):
+        event_types = [self.event_type] if self.event_type else None
+        sketch = estimate_unique_users(self.start, self.raw_from, event_types)
+        if self.raw_from < self.end:
+            sketch.update(self.raw_events().values_list('distinct_id', flat=True).distinct())
+        return sketch.count()
+
+    def daily_counts(self):
+        counts = Counter(dict(
+            self.aggregates().values('date').annotate(total=Sum('count')).values_list('date', 'total')
+        ))
+        if self.raw_from < self.end:
+            counts.update(dict(
+                self.raw_events().annotate(day=TruncDate('timestamp'))
+                .values('day').annotate(total=Count('id')).values_list('day', 'total')
+            ))
+        return [{'day': day, 'count': counts[day]} for day in sorted(counts)]
+
+    def event_type_counts(self, limit=10):
+        counts = Counter(dict(
+            self.aggregates().values('event_type').annotate(total=Sum('count'))
+            .values_list('event_type', 'total')
+        ))
+        if self.raw_from < self.end:
+            counts.update(dict(
+                self.raw_events().values('event_type').annotate(total=Count('id'))
+                .values_list('event_type', 'total')
+            ))
+        return [
+            {'event_type': event_type, 'count': count}
+            for event_type, count in counts.most_common(limit)
+        ]
+
+
+def format_duration(duration):
+    if not duration:
+        return "N/A"
+    # Format duration as minutes and seconds
+    total_seconds = duration.total_seconds()
+    minutes = int(total_seconds // 60)
+    seconds = int(total_seconds % 60)
+    return f"{minutes}m {seconds}s"
+
+
+def compute_dashboard_metrics(days, event_type=''):
+    """
+    Compute every cached dashboard figure for the last `days` days.
+    """
+    now = timezone.now()
+    current_hour = timezone.localtime(now).replace(minute=0, second=0, microsecond=0)
+    start = current_hour - timedelta(days=days)
+    prev_start = start - timedelta(days=days)
+    raw_from = aggregated_until() or start
+
+    window = EventWindow(start, now, raw_from, event_type)
+    previous = EventWindow(prev_start, start, raw_from, event_type)
+
+    metrics = {}
+
+    total_events = window.total()
+    metrics['total_events'] = total_events
+    metrics['event_growth'] = growth_rate(total_events, previous.total())
+
+    unique_users = window.unique_users()
+    metrics['unique_users'] = unique_users
+    metrics['user_growth'] = growth_rate(unique_users, previous.unique_users())
+
+    # Session KPIs over the ended sessions of the window's days
+    sessions = summarize_sessions(SessionAggregate.objects.filter(date__gte=timezone.localdate(start)))
+    metrics['avg_session_duration'] = format_duration(sessions['avg_duration'])
+    metrics['median_session_duration'] = format_duration(sessions['p50_duration'])
+    metrics['p90_session_duration'] = format_duration(sessions['p90_duration'])
+    metrics['events_per_session'] = round(sessions['events_per_session'], 1)
+
+    metrics['daily_counts'] = window.daily_counts()
+    metrics['event_type_counts'] = window.event_type_counts()
+
+    # Device breakdowns come from the rollup cubes instead of joining DeviceInfo
+    filters = {'event_type': event_type} if event_type else {}
+    metrics['device_counts'] = breakdown(['os_name'], start, now, filters)
+    metrics['version_counts'] = breakdown(['app_version'], start, now, filters, limit=10)
+
+    metrics['event_types'] = list(
+        EventAggregate.objects.order_by('event_type')
+        .values_list('event_type', flat=True).distinct()
+    )
+    return metrics
+
+
+def get_dashboard_metrics(days, event_type=''):
+    """
+    Cached dashboard figures for the last `days` days.
+    """
+    key = f'analytics:dashboard:{get_aggregates_version()}:{days}:{event_type}'
+    metrics = cache.get(key)
+    if metrics is None:
+        metrics = compute_dashboard_metrics(days, event_type)
+        cache.set(key, metrics, timeout=get_tracking_setting('DASHBOARD_CACHE_SECONDS', 60))
+    return metrics
+
+
+def _raw_type_counts(start, end):
+    events = Event.objects.filter(timestamp__lt=end)
+    if start is not None:
+        events = events.filter(timestamp__gte=start)
+    return Counter(dict(
+        events.values('event_type').annotate(total=Count('id')).values_list('event_type', 'total')
+    ))
+
+
+def count_events_by_type(start, end):
+    """
+    Count events per event type in [start, end).
+
+    Whole hours before the aggregation watermark come from EventAggregate;
+    raw events are only counted for the unaligned edges of the range and
+    for the tail that has not been aggregated yet.
+
+    Args:
+        start (datetime): Range start (aware), or None for all time
+        end (datetime): Range end, exclusive (aware)
+
+    Returns:
+        list: [{'event_type': ..., 'count': ...}] ordered by descending count
+    """
+    counts = Counter()
+    watermark = aggregated_until()
+    if start is None:
+        first_date = EventAggregate.objects.order_by('date').values_list('date', flat=True).first()
+        if first_date is None:
+            watermark = None
+        else:
+            # Events dated before the first aggregate are counted raw
+            start = min(timezone.make_aware(datetime.combine(first_date, time.min)), end)
+            counts.update(_raw_type_counts(None, start))
+
+    if watermark is None:
+        counts.update(_raw_type_counts(start, end))
+    else:
+        aggregated_from = hour_ceil(start)
+        aggregated_to = min(hour_floor(end), watermark)
+        if aggregated_from < aggregated_to:
+            counts.update(_raw_type_counts(start, aggregated_from))
+            counts.update(aggregated_counts(aggregated_from, aggregated_to))
+            counts.update(_raw_type_counts(aggregated_to, end))
+        else:
+            counts.update(_raw_type_counts(start, end))
+
+    return [
+        {'event_type': event_type, 'count': count}
+        for event_type, count in counts.most_common() if count
+    ]
+
+
+def get_event_counts(start=None, end=None):
+    """
+    Cached event counts per type for [start, end), by default all time up to now.
+
+    Ranges that end before the aggregation watermark are served from the
+    cache until the next aggregation run changes the aggregates version;
+    ranges reaching into the raw tail expire after EVENT_COUNTS_CACHE_SECONDS.
+    """
+    open_ended = end is None
+    end = end or timezone.now()
+    version = get_aggregates_version()
+    key = (
+        f"analytics:event_counts:{version}:"
+        f"{start.isoformat() if start else ''}:{'now' if open_ended else end.isoformat()}"
+    )
+    counts = cache.get(key)
+    if counts is None:
+        counts = count_events_by_type(start, end)
+        watermark = aggregated_until()
+        if not open_ended and watermark is not None and end <= watermark:
+            # Only an aggregation run can change it, and that changes the key
+            timeout = AGGREGATED_CACHE_SECONDS
+        else:
+            timeout = get_tracking_setting('EVENT_COUNTS_CACHE_SECONDS', 60)
+        cache.set(key, counts, timeout=timeout)
+    return counts
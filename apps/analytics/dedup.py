@@ -0,0 +1,93 @@
+"""
+Short-term dedup window for event ids.
+
+SDK retries after a timeout and redeliveries from the ingestion buffer
+resend events that may already be stored. Instead of looking their ids up
+in the events table, ingestion checks a Redis set per hour bucket: ids are
+added once their transaction commits and each bucket expires after
+DEDUP_WINDOW_HOURS, so memory stays bounded by the recent event rate.
+Members are the 16 raw bytes of the UUID.
+
+The window only needs to cover the retry horizon. Duplicates that arrive
+later, or race with the first write, are dropped by the primary key
+through INSERT ... ON CONFLICT DO NOTHING.
+"""
+import uuid
+from datetime import timedelta
+
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+DEDUP_KEY_PREFIX = 'analytics:dedup'
+
+
+def _setting(key, default):
+    # Imported lazily to keep this module free of a utils import cycle
+    from .utils import get_tracking_setting
+    return get_tracking_setting(key, default)
+
+
+def window_keys(now=None):
+    """
+    Keys of the hour buckets inside the dedup window, newest first.
+    """
+    current = (now or timezone.now()).replace(minute=0, second=0, microsecond=0)
+    hours = max(1, _setting('DEDUP_WINDOW_HOURS', 2))
+    return [
+        f'{DEDUP_KEY_PREFIX}:{current - timedelta(hours=offset):%Y%m%d%H}'
+        for offset in range(hours)
+    ]
+
+
+def _member(event_id):
+    return uuid.UUID(str(event_id)).bytes
+
+
+def seen_event_ids(event_ids, now=None):
+    """
+    Find the ids that were stored within the dedup window.
+
+    All buckets are checked with SMISMEMBER in a single pipeline.
+
+    Args:
+        event_ids (iterable): Event ids as UUIDs or strings
+
+    Returns:
+        set: String form of the ids that were already seen
+
+    Raises:
+        RedisError: If Redis is unavailable
+    """
+    event_ids = [str(event_id) for event_id in event_ids]
+    if not event_ids:
+        return set()
+
+    members = [_member(event_id) for event_id in event_ids]
+    pipe = get_redis_connection('default').pipeline(transaction=False)
+    for key in window_keys(now):
+        pipe.smismember(key, members)
+
+    seen = set()
+    for flags in pipe.execute():
+        seen.update(event_id for event_id, flag in zip(event_ids, flags) if flag)
+    return seen
+
+
+def record_event_ids(event_ids, now=None):
+    """
+    Add stored event ids to the current hour bucket.
+
+    Raises:
+        RedisError: If Redis is unavailable
+    """
+    members = [_member(event_id) for event_id in event_ids]
+    if not members:
+        return
+
+    key = window_keys(now)[0]
+    # The bucket must outlive the window it is checked in
+    ttl = (max(1, _setting('DEDUP_WINDOW_HOURS', 2)) + 1) * 3600
+    pipe = get_redis_connection('default').pipeline(transaction=False)
+    pipe.sadd(key, *members)
+    pipe.expire(key, ttl)
+    pipe.execute()
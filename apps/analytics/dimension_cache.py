@@ -0,0 +1,294 @@
+"""
+Two-tier cache for DeviceInfo and LocationInfo lookups.
+
+device_id and ip_address repeat on almost every event of a session, so the
+capture path resolves them through a per-process LRU backed by the shared
+Redis cache before touching the database. Entries hold the plain column
+values of the row; callers rebuild model instances from them without a
+query.
+
+Each process keeps its own LRU, so an edit made elsewhere (for example in
+the admin) is visible in other processes after at most
+DIMENSION_CACHE_LOCAL_TTL seconds. The shared tier is invalidated
+immediately through the post_save/post_delete receivers below.
+
+Hit/miss counters are kept per process and added to totals in the shared
+cache every DIMENSION_CACHE_STATS_FLUSH_SECONDS, so cache_stats() (served
+by the dimension-cache/ admin endpoint) reports all web and worker
+processes together.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import DeviceInfo, LocationInfo
+
+logger = logging.getLogger(__name__)
+
+DEVICE_CACHE_FIELDS = (
+    'device_id', 'app_version', 'os_name', 'os_version',
+    'is_simulator', 'is_rooted_device', 'is_vpn_enabled', 'last_seen',
+)
+LOCATION_CACHE_FIELDS = ('id', 'ip_address', 'city', 'country', 'continent')
+
+STATS_COUNTERS = ('local_hits', 'shared_hits', 'misses')
+
+
+def _setting(key, default):
+    # Imported lazily to keep this module free of a utils import cycle
+    from .utils import get_tracking_setting
+    return get_tracking_setting(key, default)
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded LRU with per-entry expiry.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DimensionCache:
+    """
+    Local LRU in front of the shared Django cache, with hit/miss counters.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.prefix = f'analytics:dim:{name}:'
+        self.stats_prefix = f'analytics:dim-stats:{name}:'
+        self._local = None
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        # Counter values already added to the shared totals
+        self._flushed = dict.fromkeys(STATS_COUNTERS, 0)
+        self._next_flush = 0
+        self._flush_lock = threading.Lock()
+
+    @property
+    def local(self):
+        # Built on first use so settings overrides are honoured
+        if self._local is None:
+            self._local = LRUCache(
+                _setting('DIMENSION_CACHE_LOCAL_SIZE', 10000),
+                _setting('DIMENSION_CACHE_LOCAL_TTL', 300),
+            )
+        return self._local
+
+    def _shared_key(self, key):
+        return f'{self.prefix}{key}'
+
+    def get_many(self, keys):
+        """
+        Look up several keys, returning a dict of the ones found.
+        """
+        found = {}
+        remote = []
+        for key in keys:
+            value = self.local.get(key)
+            if value is None:
+                remote.append(key)
+            else:
+                found[key] = value
+        self.local_hits += len(found)
+
+        if remote:
+            try:
+                shared = cache.get_many([self._shared_key(key) for key in remote])
+            except Exception:
+                logger.warning(f"Shared {self.name} cache unavailable", exc_info=True)
+                shared = {}
+            for key in remote:
+                value = shared.get(self._shared_key(key))
+                if value is None:
+                    self.misses += 1
+                    continue
+                self.shared_hits += 1
+                self.local.set(key, value)
+                found[key] = value
+
+        if time.monotonic() >= self._next_flush:
+            self.flush_stats()
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def set_many(self, mapping):
+        if not mapping:
+            return
+        for key, value in mapping.items():
+            self.local.set(key, value)
+        try:
+            cache.set_many(
+                {self._shared_key(key): value for key, value in mapping.items()},
+                timeout=_setting('DIMENSION_CACHE_SHARED_TTL', 3600),
+            )
+        except Exception:
+            logger.warning(f"Shared {self.name} cache unavailable", exc_info=True)
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def delete(self, key):
+        self.local.delete(key)
+        try:
+            cache.delete(self._shared_key(key))
+        except Exception:
+            logger.warning(f"Shared {self.name} cache unavailable", exc_info=True)
+
+    def flush_stats(self):
+        """
+        Add the counts since the previous flush to the shared totals.
+        """
+        if not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_flush = time.monotonic() + _setting('DIMENSION_CACHE_STATS_FLUSH_SECONDS', 60)
+            for counter in STATS_COUNTERS:
+                value = getattr(self, counter)
+                if value == self._flushed[counter]:
+                    continue
+                key = f'{self.stats_prefix}{counter}'
+                cache.add(key, 0, timeout=None)
+                cache.incr(key, value - self._flushed[counter])
+                self._flushed[counter] = value
+        except Exception:
+            logger.warning(f"Could not flush {self.name} cache stats", exc_info=True)
+        finally:
+            self._flush_lock.release()
+
+    def stats(self):
+        """
+        Counters of this process, with the size of its LRU.
+        """
+        counts = {counter: getattr(self, counter) for counter in STATS_COUNTERS}
+        return {**_with_hit_rate(counts), 'local_size': len(self.local)}
+
+    def shared_stats(self):
+        """
+        Counters summed over every process, as of their last flush.
+        """
+        totals = cache.get_many([f'{self.stats_prefix}{counter}' for counter in STATS_COUNTERS])
+        return _with_hit_rate({
+            counter: totals.get(f'{self.stats_prefix}{counter}', 0) for counter in STATS_COUNTERS
+        })
+
+
+def _with_hit_rate(counts):
+    lookups = sum(counts.values())
+    return {
+        **counts,
+        'hit_rate': round((lookups - counts['misses']) / lookups, 4) if lookups else None,
+    }
+
+
+device_cache = DimensionCache('device')
+location_cache = DimensionCache('location')
+
+
+def device_to_cache(device):
+    return {field: getattr(device, field) for field in DEVICE_CACHE_FIELDS}
+
+
+def device_from_cache(values):
+    """
+    Rebuild a DeviceInfo instance from cached values without a query.
+    """
+    return DeviceInfo.from_db('default', list(values), list(values.values()))
+
+
+def location_to_cache(location):
+    return {field: getattr(location, field) for field in LOCATION_CACHE_FIELDS}
+
+
+def location_from_cache(values):
+    """
+    Rebuild a LocationInfo instance from cached values without a query.
+    """
+    return LocationInfo.from_db('default', list(values), list(values.values()))
+
+
+def changed_device_fields(cached, device_data):
+    """
+    Return the attributes in device_data that differ from the cached row.
+    """
+    return {
+        field: value for field, value in device_data.items()
+        if field in DEVICE_CACHE_FIELDS and cached.get(field) != value
+    }
+
+
+def changed_location_fields(cached, location_data):
+    """
+    Return the attributes in location_data that differ from the cached row.
+    """
+    return {
+        field: value for field, value in location_data.items()
+        if field in LOCATION_CACHE_FIELDS and cached.get(field) != value
+    }
+
+
+def cache_stats():
+    """
+    Hit/miss counters of both caches, used to size them.
+
+    The totals cover every process; 'process' holds the live counters and
+    LRU size of the process answering.
+    """
+    stats = {}
+    for dimension_cache in (device_cache, location_cache):
+        dimension_cache.flush_stats()
+        stats[dimension_cache.name] = {**dimension_cache.shared_stats(), 'process': dimension_cache.stats()}
+    return stats
+
+
+@receiver([post_save, post_delete], sender=DeviceInfo)
+def invalidate_device(sender, instance, **kwargs):
+    device_cache.delete(instance.device_id)
+
+
+@receiver([post_save, post_delete], sender=LocationInfo)
+def invalidate_location(sender, instance, **kwargs):
+    if instance.ip_address:
+        location_cache.delete(instance.ip_address)
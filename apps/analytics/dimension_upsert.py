@@ -0,0 +1,99 @@
+"""
+Bulk upserts for the DeviceInfo and LocationInfo dimension tables.
+
+A batch of dimension rows is written with one INSERT ... ON CONFLICT DO
+UPDATE per set of reported attributes (in practice one per batch, as
+SDKs send the same fields with every event). Rows are only rewritten
+when an attribute actually changed or, for tables with a "seen" column,
+when that column is older than the refresh cutoff, so steady traffic
+from known devices causes no writes at all. Concurrent writers cannot
+collide on the primary key the way SELECT-then-INSERT does.
+
+The statement uses the PostgreSQL syntax that SQLite (3.39+) also
+understands, so it runs unchanged in development.
+"""
+from django.db import connection
+
+UPSERT_BATCH_SIZE = 1000
+
+
+def upsert_rows(model, key, rows, insert_defaults=None, touch=None):
+    """
+    Insert missing rows and update rows whose attributes changed.
+
+    Only the attributes present for a row are updated; columns missing
+    from it keep their stored value, or take `insert_defaults` on insert.
+
+    Args:
+        model: DeviceInfo or LocationInfo
+        key (str): Unique column the rows are keyed by
+        rows (dict): Mapping of key value to the attributes reported for it
+        insert_defaults (dict, optional): Values for columns a new row
+            must have but the batch did not report
+        touch (tuple, optional): (column, now, stale_before); the column is
+            set to `now` on insert and on update, and rows whose column is
+            older than `stale_before` are updated even if unchanged
+
+    Returns:
+        set: Key values of the rows that were inserted or updated
+    """
+    insert_defaults = insert_defaults or {}
+    groups = {}
+    for value, attributes in rows.items():
+        groups.setdefault(tuple(sorted(attributes)), []).append(value)
+
+    written = set()
+    for fields, keys in sorted(groups.items()):
+        # Rows are locked in key order, so concurrent batches touching the
+        # same keys cannot deadlock
+        keys.sort()
+        for offset in range(0, len(keys), UPSERT_BATCH_SIZE):
+            chunk = keys[offset:offset + UPSERT_BATCH_SIZE]
+            written.update(_upsert_chunk(
+                model, key, fields, [(value, rows[value]) for value in chunk], insert_defaults, touch
+            ))
+    return written
+
+
+def _upsert_chunk(model, key, fields, rows, insert_defaults, touch):
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    defaults = [column for column in insert_defaults if column not in fields]
+    columns = [key, *fields, *defaults]
+    if touch:
+        touch_column, now, stale_before = touch
+        columns.append(touch_column)
+        now = connection.ops.adapt_datetimefield_value(now)
+        stale_before = connection.ops.adapt_datetimefield_value(stale_before)
+
+    params = []
+    for value, attributes in rows:
+        params.append(value)
+        params.extend(attributes[field] for field in fields)
+        params.extend(insert_defaults[column] for column in defaults)
+        if touch:
+            params.append(now)
+
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    sql = (
+        f"INSERT INTO {table} ({', '.join(quote(column) for column in columns)}) "
+        f"VALUES {', '.join([placeholders] * len(rows))} "
+        f"ON CONFLICT ({quote(key)}) "
+    )
+
+    assignments = [f'{quote(field)} = excluded.{quote(field)}' for field in fields]
+    # Only rows that really changed are rewritten
+    conditions = [f'{table}.{quote(field)} IS DISTINCT FROM excluded.{quote(field)}' for field in fields]
+    if touch:
+        assignments.append(f'{quote(touch_column)} = excluded.{quote(touch_column)}')
+        conditions.append(f'{table}.{quote(touch_column)} < %s')
+        params.append(stale_before)
+    if assignments:
+        sql += f"DO UPDATE SET {', '.join(assignments)} WHERE {' OR '.join(conditions)} "
+    else:
+        sql += 'DO NOTHING '
+    sql += f'RETURNING {quote(key)}'
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {row[0] for row in cursor.fetchall()}
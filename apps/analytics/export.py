@@ -0,0 +1,255 @@
+"""
+Streaming bulk export of raw events.
+
+Events are read with a server-side cursor (QuerySet.iterator) and encoded
+incrementally, so an export holds at most one chunk of rows in memory no
+matter how many it covers. The same writers back the events/export/ admin
+endpoint, which streams them through a StreamingHttpResponse, and the
+export_events management command, which writes them to a file. Under
+ASGI the response is fed by aiter_chunks, since StreamingHttpResponse
+would otherwise collect a sync iterator into a list before sending it.
+
+Each exported row is flat: device and location columns are joined in and
+properties is a JSON string in CSV and Parquet. Parquet output needs the
+optional `pyarrow` package and is written one row group per chunk.
+"""
+import csv
+import io
+import json
+import uuid
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Event
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - optional dependency
+    pyarrow = None
+
+EXPORT_CHUNK_SIZE = 5000
+
+# (output column, queryset lookup)
+EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('timestamp', 'timestamp'),
+    ('event_type', 'event_type'),
+    ('distinct_id', 'distinct_id'),
+    ('session_id', 'session_id'),
+    ('user_id', 'user_id'),
+    ('device_id', 'device_id'),
+    ('app_version', 'device__app_version'),
+    ('os_name', 'device__os_name'),
+    ('os_version', 'device__os_version'),
+    ('ip_address', 'location__ip_address'),
+    ('city', 'location__city'),
+    ('country', 'location__country'),
+    ('continent', 'location__continent'),
+    ('latitude', 'latitude'),
+    ('longitude', 'longitude'),
+    ('app_check_result', 'app_check_result'),
+    ('properties', 'properties'),
+    ('created_at', 'created_at'),
+)
+COLUMN_NAMES = [name for name, _ in EXPORT_COLUMNS]
+
+# name: (content type, file extension)
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+class ExportUnavailable(Exception):
+    """
+    Raised for a format whose optional dependency is not installed.
+    """
+
+
+def export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Stream the export columns of `queryset` in timestamp order.
+
+    Returns:
+        iterator: Tuples in EXPORT_COLUMNS order
+    """
+    lookups = [lookup for _, lookup in EXPORT_COLUMNS]
+    return queryset.order_by('timestamp', 'id').values_list(*lookups).iterator(chunk_size=chunk_size)
+
+
+def filtered_events(start=None, end=None, event_type=None, distinct_id=None, device_id=None):
+    """
+    Events in [start, end) matching the given filters.
+    """
+    queryset = Event.objects.all()
+    if start:
+        queryset = queryset.filter(timestamp__gte=start)
+    if end:
+        queryset = queryset.filter(timestamp__lt=end)
+    if event_type:
+        queryset = queryset.filter(event_type=event_type)
+    if distinct_id:
+        queryset = queryset.filter(distinct_id=distinct_id)
+    if device_id:
+        queryset = queryset.filter(device_id=device_id)
+    return queryset
+
+
+def _text_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def iter_ndjson(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    lines = []
+    for row in rows:
+        lines.append(encoder.encode(dict(zip(COLUMN_NAMES, row))))
+        if len(lines) >= chunk_size:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def iter_csv(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMN_NAMES)
+    properties = COLUMN_NAMES.index('properties')
+    for count, row in enumerate(rows, 1):
+        row = [_text_value(value) for value in row]
+        row[properties] = json.dumps(row[properties], cls=DjangoJSONEncoder)
+        writer.writerow(row)
+        if count % chunk_size == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file that hands the bytes written so far to the caller.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_schema():
+    return pyarrow.schema([
+        ('id', pyarrow.string()),
+        ('timestamp', pyarrow.timestamp('us', tz='UTC')),
+        ('event_type', pyarrow.string()),
+        ('distinct_id', pyarrow.string()),
+        ('session_id', pyarrow.string()),
+        ('user_id', pyarrow.int64()),
+        ('device_id', pyarrow.string()),
+        ('app_version', pyarrow.string()),
+        ('os_name', pyarrow.string()),
+        ('os_version', pyarrow.string()),
+        ('ip_address', pyarrow.string()),
+        ('city', pyarrow.string()),
+        ('country', pyarrow.string()),
+        ('continent', pyarrow.string()),
+        ('latitude', pyarrow.float64()),
+        ('longitude', pyarrow.float64()),
+        ('app_check_result', pyarrow.bool_()),
+        ('properties', pyarrow.string()),
+        ('created_at', pyarrow.timestamp('us', tz='UTC')),
+    ])
+
+
+def iter_parquet(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    schema = parquet_schema()
+    sink = _ChunkSink()
+    properties = COLUMN_NAMES.index('properties')
+    id_columns = [COLUMN_NAMES.index(name) for name in ('id', 'session_id')]
+
+    def write_row_group(batch):
+        columns = [list(column) for column in zip(*batch)]
+        for index in id_columns:
+            columns[index] = [None if value is None else str(value) for value in columns[index]]
+        columns[properties] = [json.dumps(value, cls=DjangoJSONEncoder) for value in columns[properties]]
+        writer.write_table(pyarrow.Table.from_arrays(columns, schema=schema))
+
+    with pyarrow.parquet.ParquetWriter(sink, schema, compression='zstd') as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                write_row_group(batch)
+                batch = []
+                yield sink.drain()
+        if batch:
+            write_row_group(batch)
+    # Closing the writer appends the footer
+    yield sink.drain()
+
+
+def stream_export(rows, export_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Encode exported rows in one of EXPORT_FORMATS.
+
+    Args:
+        rows (iterator): Rows from export_rows
+        export_format (str): 'ndjson', 'csv' or 'parquet'
+        chunk_size (int): Rows encoded per yielded chunk (a Parquet row group)
+
+    Returns:
+        iterator: Encoded bytes
+
+    Raises:
+        ExportUnavailable: For parquet when pyarrow is not installed
+    """
+    if export_format == 'ndjson':
+        return iter_ndjson(rows, chunk_size)
+    if export_format == 'csv':
+        return iter_csv(rows, chunk_size)
+    if export_format == 'parquet':
+        if pyarrow is None:
+            raise ExportUnavailable('Parquet export requires the pyarrow package')
+        return iter_parquet(rows, chunk_size)
+    raise ValueError(f"Unknown export format: {export_format}")
+
+
+async def aiter_chunks(chunks):
+    """
+    Async iterator over encoded chunks, for StreamingHttpResponse under ASGI.
+
+    Each chunk is pulled in the request's sync thread, where the
+    server-side cursor lives, so only one chunk is held at a time.
+    """
+    chunks = iter(chunks)
+    get_next = sync_to_async(next)
+    try:
+        while True:
+            chunk = await get_next(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        # Release the cursor when the client disconnects part-way
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            await sync_to_async(close)()
@@ -0,0 +1,125 @@
+"""
+Feature flag evaluation.
+
+Active flags are served from an in-memory snapshot so the SDK endpoint
+does not touch the database. The snapshot carries a version that is
+bumped in the shared cache whenever a FeatureFlag is saved or deleted;
+each process re-checks that version at most every
+FEATURE_FLAG_CHECK_SECONDS and reloads when it changed.
+
+Rollout is deterministic: a user is in a flag's rollout when the stable
+hash of (flag key, distinct_id) falls below rollout_percentage, so the
+same user keeps the same answer across requests, processes and deploys.
+"""
+import hashlib
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+from .models import FeatureFlag
+from .utils import get_tracking_setting
+
+VERSION_CACHE_KEY = 'analytics:flags:version'
+SNAPSHOT_CACHE_KEY = 'analytics:flags:snapshot'
+
+# Largest value of the 15 hex digit hash prefix used for bucketing
+BUCKET_SCALE = float(0xFFFFFFFFFFFFFFF)
+
+
+class FlagSnapshot:
+    """
+    Immutable view of the active flag set at a given version.
+    """
+
+    def __init__(self, version, flags):
+        self.version = version
+        self.flags = flags
+
+    def evaluate(self, distinct_id):
+        """
+        Return the flags for a user in the format served to the SDKs.
+        """
+        return {
+            flag['key']: {
+                'active': flag['active'],
+                'enabled': is_in_rollout(flag['key'], distinct_id, flag['rollout_percentage']),
+                'name': flag['name'],
+                'rollout_percentage': flag['rollout_percentage'],
+            } for flag in self.flags
+        }
+
+    def etag(self, distinct_id):
+        digest = hashlib.sha1(f"{self.version}:{distinct_id}".encode()).hexdigest()
+        return f'"{digest[:20]}"'
+
+
+_lock = threading.Lock()
+_snapshot = None
+_checked_at = 0.0
+
+
+def rollout_bucket(flag_key, distinct_id):
+    """
+    Map (flag key, distinct_id) to a stable number in [0, 100].
+    """
+    digest = hashlib.sha1(f"{flag_key}.{distinct_id}".encode()).hexdigest()
+    return int(digest[:15], 16) / BUCKET_SCALE * 100
+
+
+def is_in_rollout(flag_key, distinct_id, rollout_percentage):
+    if rollout_percentage >= 100:
+        return True
+    if rollout_percentage <= 0:
+        return False
+    return rollout_bucket(flag_key, distinct_id) < rollout_percentage
+
+
+def _load_snapshot(version):
+    shared = cache.get(SNAPSHOT_CACHE_KEY)
+    if shared and shared['version'] == version:
+        return FlagSnapshot(version, shared['flags'])
+
+    flags = list(
+        FeatureFlag.objects.filter(active=True)
+        .order_by('key')
+        .values('key', 'name', 'active', 'rollout_percentage')
+    )
+    cache.set(SNAPSHOT_CACHE_KEY, {'version': version, 'flags': flags}, timeout=None)
+    return FlagSnapshot(version, flags)
+
+
+def get_snapshot():
+    """
+    Return the current flag snapshot, reloading it if the version changed.
+    """
+    global _snapshot, _checked_at
+
+    now = time.monotonic()
+    if _snapshot is not None and now - _checked_at < get_tracking_setting('FEATURE_FLAG_CHECK_SECONDS', 5):
+        return _snapshot
+
+    with _lock:
+        version = cache.get(VERSION_CACHE_KEY)
+        if version is None:
+            version = uuid.uuid4().hex
+            # Another process may have set it first; use whichever won
+            if not cache.add(VERSION_CACHE_KEY, version, timeout=None):
+                version = cache.get(VERSION_CACHE_KEY, version)
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = _load_snapshot(version)
+        _checked_at = now
+        return _snapshot
+
+
+def invalidate_snapshot():
+    """
+    Publish a new snapshot version so every process reloads its flags.
+    """
+    global _checked_at
+
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+    cache.delete(SNAPSHOT_CACHE_KEY)
+    # Make the current process notice the change immediately
+    _checked_at = 0.0
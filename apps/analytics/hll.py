@@ -0,0 +1,97 @@
+"""
+HyperLogLog sketches for approximate distinct counting.
+
+Sketches built from disjoint or overlapping sets of users can be merged
+by taking the register-wise maximum, so hourly unique-user sketches can
+be combined into daily, weekly or multi-event-type uniques without
+touching raw events.
+
+With the default precision of 12 (4096 registers) the relative standard
+error is 1.04 / sqrt(4096) ~= 1.6%, i.e. about 95% of estimates fall
+within +/-3.3% of the true count. Small cardinalities use linear counting
+and are close to exact.
+"""
+import hashlib
+import math
+import zlib
+
+DEFAULT_PRECISION = 12
+FORMAT_VERSION = 1
+
+
+class HyperLogLog:
+    """
+    Mergeable HyperLogLog sketch with a 64-bit hash.
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16")
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+        if len(self.registers) != self.size:
+            raise ValueError("register count does not match precision")
+
+    @property
+    def standard_error(self):
+        return 1.04 / math.sqrt(self.size)
+
+    def add(self, value):
+        digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+        x = int.from_bytes(digest, 'big')
+        index = x >> (64 - self.precision)
+        remaining_bits = 64 - self.precision
+        rest = x & ((1 << remaining_bits) - 1)
+        # Position of the leftmost 1-bit in the remaining bits
+        rank = remaining_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+        return self
+
+    def merge(self, other):
+        """
+        Fold another sketch into this one (set union).
+        """
+        if other.precision != self.precision:
+            raise ValueError("cannot merge sketches with different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        """
+        Estimated number of distinct values added.
+        """
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return bytes([FORMAT_VERSION, self.precision]) + zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = bytes(data)
+        if data[0] != FORMAT_VERSION:
+            raise ValueError(f"unsupported sketch format {data[0]}")
+        return cls(precision=data[1], registers=zlib.decompress(data[2:]))
+
+    @classmethod
+    def merged(cls, sketches, precision=DEFAULT_PRECISION):
+        """
+        Union of serialized sketches; empty values are ignored.
+        """
+        result = cls(precision)
+        for data in sketches:
+            if data:
+                result.merge(cls.from_bytes(data))
+        return result
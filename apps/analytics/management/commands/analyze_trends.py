@@ -1,9 +1,12 @@
 from django.core.management.base import BaseCommand
-from django.db.models import Count, F, Sum
+from django.db.models import Count, Sum
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, time, timedelta
 
-from apps.analytics.models import Event, EventAggregate
+from apps.analytics.models import Event, EventAggregate, SessionAggregate
+from apps.analytics.dashboard_queries import format_duration
+from apps.analytics.rollup_cube import breakdown
+from apps.analytics.session_aggregation import summarize_sessions
 
 
 class Command(BaseCommand):
@@ -77,14 +80,29 @@ class Command(BaseCommand):
         for day in unique_users:
             self.stdout.write(f"  {day['day']}: {day['unique_users']} unique users")
         
-        # Top device types
-        self.stdout.write('\nTop device types:')
-        devices = queryset.values('os_name').annotate(
-            count=Count('id')
-        ).order_by('-count')
+        # Device, app version and country breakdowns, from the rollup cubes
+        range_start = timezone.make_aware(datetime.combine(start_date, time.min))
+        filters = {'event_type': event_type} if event_type else {}
+        for title, dimension, limit in (
+            ('Top device types', 'os_name', None),
+            ('Top app versions', 'app_version', 10),
+            ('Top countries', 'country', 10),
+        ):
+            self.stdout.write(f'\n{title}:')
+            for row in breakdown([dimension], range_start, timezone.now(), filters, limit=limit):
+                self.stdout.write(f"  {row[dimension] or 'unknown'}: {row['count']} events")
         
-        for device in devices:
-            self.stdout.write(f"  {device['os_name']}: {device['count']} events")
+        # Sessions, from the daily rollup of ended sessions
+        self.stdout.write('\nSessions per day:')
+        session_rows = SessionAggregate.objects.filter(date__gte=start_date, date__lte=end_date)
+        for day in session_rows.values_list('date', flat=True).distinct().order_by('date'):
+            self.write_sessions(day, summarize_sessions(session_rows.filter(date=day)))
+        
+        self.stdout.write('\nSessions by OS and app version:')
+        groups = session_rows.values_list('os_name', 'app_version').distinct().order_by('os_name', 'app_version')
+        for os_name, app_version in groups:
+            summary = summarize_sessions(session_rows.filter(os_name=os_name, app_version=app_version))
+            self.write_sessions(f"{os_name or 'unknown'} {app_version}".strip(), summary)
         
         # Check data completeness
         self.stdout.write('\nData completeness:')
@@ -100,4 +118,13 @@ class Command(BaseCommand):
         else:
             self.stdout.write(
                 self.style.SUCCESS(f'Data complete for all {total_days} days')
-            ) 
\ No newline at end of file
+            ) 
+    
+    def write_sessions(self, label, summary):
+        self.stdout.write(
+            f"  {label}: {summary['sessions']} sessions, "
+            f"avg {format_duration(summary['avg_duration'])}, "
+            f"p50 {format_duration(summary['p50_duration'])}, "
+            f"p90 {format_duration(summary['p90_duration'])}, "
+            f"{summary['events_per_session']:.1f} events/session"
+        )
@@ -0,0 +1,174 @@
+import random
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from apps.analytics.models import DeviceInfo, Event, Session
+
+BENCH_PREFIX = 'bench-index'
+EVENT_TYPES = [f'event_{i}' for i in range(20)]
+
+
+class Rollback(Exception):
+    """
+    Raised to discard the sample data at the end of a run.
+    """
+
+
+def sample_events(count, users, now):
+    """
+    Events spread over the last week, with 10% still unprocessed.
+    """
+    for i in range(count):
+        user = i % users
+        yield Event(
+            id=uuid.uuid4(),
+            distinct_id=f'{BENCH_PREFIX}-user-{user}',
+            device_id=f'{BENCH_PREFIX}-device-{user}',
+            event_type=random.choice(EVENT_TYPES),
+            properties={'index': i},
+            timestamp=now - timedelta(seconds=random.randint(0, 7 * 24 * 3600)),
+            processed=random.random() >= 0.1,
+        )
+
+
+def query_shapes(now):
+    """
+    The event and session reads the app runs, as (name, queryset) pairs.
+    """
+    user = f'{BENCH_PREFIX}-user-7'
+    device = f'{BENCH_PREFIX}-device-7'
+    return [
+        ('keyset page', Event.objects.order_by('-timestamp', '-id')[:100]),
+        ('type count, 1 day', Event.objects.filter(
+            event_type='event_3', timestamp__gte=now - timedelta(days=1)
+        ).values('event_type').annotate(count=Count('id'))),
+        ('user timeline', Event.objects.filter(distinct_id=user).order_by('-timestamp')[:100]),
+        ('device timeline', Event.objects.filter(device_id=device).order_by('-timestamp')[:100]),
+        ('unprocessed claim', Event.objects.filter(processed=False).only('id').order_by('timestamp')[:1000]),
+        ('dirty hours', Event.objects.filter(created_at__gt=now - timedelta(minutes=5))
+            .annotate(bucket=TruncHour('timestamp')).values_list('bucket', flat=True).distinct()),
+        ('session match', Session.objects.filter(
+            distinct_id=user, device_id=device, start_time__lte=now
+        ).order_by('-start_time')[:1]),
+    ]
+
+
+def index_sizes():
+    """
+    Size in bytes of every index on the event and session tables (PostgreSQL).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relname, indexrelname, pg_relation_size(indexrelid) "
+            "FROM pg_stat_user_indexes WHERE relname IN (%s, %s) ORDER BY 1, 2",
+            [Event._meta.db_table, Session._meta.db_table]
+        )
+        return cursor.fetchall()
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure insert throughput and the cost of the main event and session '
+        'queries under the current index set; run before and after a migration to compare'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--events',
+            type=int,
+            default=50000,
+            help='Number of sample events to insert',
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=1000,
+            help='Number of distinct users and devices in the sample',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows per INSERT statement',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Runs per query; the median is reported',
+        )
+        parser.add_argument(
+            '--explain',
+            action='store_true',
+            help='Print the plan of every query',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Commit the sample data instead of rolling it back',
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                self.run(now, options)
+                if not options['keep']:
+                    raise Rollback()
+        except Rollback:
+            self.stdout.write('Sample data rolled back')
+
+    def run(self, now, options):
+        users = options['users']
+        DeviceInfo.objects.bulk_create([
+            DeviceInfo(device_id=f'{BENCH_PREFIX}-device-{user}', app_version='1.0.0', os_name='iOS', os_version='17.0')
+            for user in range(users)
+        ], ignore_conflicts=True)
+        Session.objects.bulk_create([
+            Session(
+                distinct_id=f'{BENCH_PREFIX}-user-{user}',
+                device_id=f'{BENCH_PREFIX}-device-{user}',
+                start_time=now - timedelta(hours=1),
+                last_event_at=now,
+            )
+            for user in range(users)
+        ])
+
+        events = list(sample_events(options['events'], users, now))
+        started = time.perf_counter()
+        Event.objects.bulk_create(events, batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Inserted {len(events)} events in {elapsed:.2f}s "
+            f"({len(events) / elapsed:,.0f} events/s, {elapsed / len(events) * 1e6:.1f} us/event)"
+        )
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE "{Event._meta.db_table}"')
+                cursor.execute(f'ANALYZE "{Session._meta.db_table}"')
+
+        self.stdout.write(f"Queries (median of {options['repeat']} runs):")
+        for name, queryset in query_shapes(now):
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                # A fresh clone per run so the result cache is not reused
+                list(queryset.all())
+                timings.append(time.perf_counter() - started)
+            self.stdout.write(f"  {name:<20} {statistics.median(timings) * 1000:8.2f} ms")
+            if options['explain']:
+                self.stdout.write(f"{queryset.explain()}\n")
+
+        if connection.vendor == 'postgresql':
+            self.stdout.write('Index sizes:')
+            for table, index, size in index_sizes():
+                self.stdout.write(f"  {table}.{index:<40} {size / 1024 / 1024:8.1f} MB")
@@ -0,0 +1,94 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.analytics.models import Session
+from apps.analytics.serializers import BatchEventSerializer, EventSerializer
+from apps.analytics.validation import validate_batch, validate_event
+
+
+def sample_event(index, session_id=None):
+    event = {
+        'event_id': str(uuid.uuid4()),
+        'distinct_id': f'bench-user-{index % 50}',
+        'event_type': 'button_click',
+        'properties': {'button_name': 'submit', 'page': 'checkout', 'index': index},
+        'device_id': f'bench-device-{index % 50}',
+        'app_version': '1.0.0',
+        'os_name': 'iOS',
+        'os_version': '17.0',
+        'timestamp': timezone.now().isoformat(),
+        'is_simulator': False,
+        'is_rooted_device': False,
+        'is_vpn_enabled': False,
+        'latitude': 37.7749,
+        'longitude': -122.4194,
+        'ip_address': '203.0.113.42',
+        'city': 'San Francisco',
+        'country': 'United States',
+        'continent': 'North America',
+        'app_check_result': True,
+    }
+    if session_id:
+        event['session'] = session_id
+    return event
+
+
+class Command(BaseCommand):
+    help = 'Compare per-event validation cost of the serializers and the ingestion validator'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--events',
+            type=int,
+            default=5000,
+            help='Number of events to validate one by one',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Events per batch payload',
+        )
+        parser.add_argument(
+            '--with-session',
+            action='store_true',
+            help='Reference an existing session from every event',
+        )
+
+    def handle(self, *args, **options):
+        session_id = None
+        if options['with_session']:
+            session = Session.objects.order_by('-start_time').first()
+            if session:
+                session_id = str(session.id)
+            else:
+                self.stdout.write(self.style.WARNING('No session found; benchmarking without one'))
+
+        events = [sample_event(i, session_id) for i in range(options['events'])]
+        batch = {'batch': [sample_event(i, session_id) for i in range(options['batch_size'])]}
+
+        self.stdout.write(
+            f"Validating {len(events)} single events and a batch of {options['batch_size']}"
+        )
+        results = [
+            ('EventSerializer', len(events), lambda: [
+                EventSerializer(data=event).is_valid() for event in events
+            ]),
+            ('validate_event', len(events), lambda: [validate_event(event) for event in events]),
+            ('BatchEventSerializer', options['batch_size'], lambda: BatchEventSerializer(data=batch).is_valid()),
+            ('validate_batch', options['batch_size'], lambda: validate_batch(batch)),
+        ]
+        for name, count, run in results:
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                run()
+                elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"  {name:<22} {elapsed / count * 1e6:8.1f} us/event "
+                f"{len(queries)} queries"
+            )
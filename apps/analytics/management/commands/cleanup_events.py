@@ -1,11 +1,13 @@
 from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.db import connection, transaction
 from django.utils import timezone
 from django.conf import settings
 from datetime import timedelta
 import logging
+import time
 
 from apps.analytics.models import Event
+from apps.analytics.partitioning import drop_partition, expired_partitions, is_partitioned
 
 logger = logging.getLogger(__name__)
 
@@ -23,7 +25,19 @@ class Command(BaseCommand):
             '--batch-size',
             type=int,
             default=10000,
-            help='Batch size for deletion operations',
+            help='Rows deleted per transaction when deleting row by row',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.1,
+            help='Seconds to pause between delete batches to limit load on the database',
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            default=None,
+            help='Stop after this many delete batches; the next run resumes where this one stopped',
         )
         parser.add_argument(
             '--dry-run',
@@ -31,48 +45,105 @@ class Command(BaseCommand):
             help='Show what would be deleted without actually deleting',
         )
 
-    @transaction.atomic
     def handle(self, *args, **options):
         # Determine retention period
         days = options['days']
         if days is None:
             days = getattr(settings, 'EVENT_TRACKING', {}).get('RETENTION_DAYS', 365)
         
-        batch_size = options['batch_size']
         dry_run = options['dry_run']
         
         # Calculate cutoff date
         cutoff_date = timezone.now() - timedelta(days=days)
+        started = time.monotonic()
+        
+        partitioned = connection.vendor == 'postgresql' and is_partitioned()
+        
+        dropped = 0
+        if partitioned:
+            dropped = self.drop_expired_partitions(cutoff_date, dry_run)
+        
+        # Rows older than the cutoff that share a partition with newer events
+        # (or all of them, on an unpartitioned table) are deleted in batches
+        deleted = self.delete_in_batches(
+            cutoff_date, options['batch_size'], options['sleep'], options['max_batches'], dry_run
+        )
+        
+        if dry_run:
+            return
         
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"Event retention: dropped ~{dropped} rows by partition, deleted {deleted} rows "
+            f"older than {cutoff_date:%Y-%m-%d} in {elapsed:.1f}s"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully removed {dropped + deleted} old events in {elapsed:.1f}s"
+        ))
+
+    def drop_expired_partitions(self, cutoff_date, dry_run):
+        dropped = 0
+        for name, start, end in expired_partitions(cutoff_date):
+            if dry_run:
+                self.stdout.write(f"Would drop partition {name} (events before {end:%Y-%m-%d})")
+                continue
+            rows = drop_partition(name)
+            dropped += rows
+            self.stdout.write(f"Dropped partition {name} with ~{rows} events")
+        return dropped
+
+    def delete_in_batches(self, cutoff_date, batch_size, pause, max_batches, dry_run):
+        """
+        Delete old events oldest first, one short transaction per batch.
+        
+        Each batch is a single server-side DELETE, so no ids are fetched into
+        Python and an interrupted run loses nothing: the next run simply
+        continues with the oldest remaining rows.
+        """
         # Count events to be deleted
         count = Event.objects.filter(timestamp__lt=cutoff_date).count()
         
         if dry_run:
             self.stdout.write(f"Would delete {count} events older than {cutoff_date.strftime('%Y-%m-%d')}")
-            return
+            return 0
         
         if count == 0:
             self.stdout.write("No events to delete")
-            return
+            return 0
         
         self.stdout.write(f"Deleting {count} events older than {cutoff_date.strftime('%Y-%m-%d')}")
         
-        # Delete in batches to avoid memory issues
+        table = connection.ops.quote_name(Event._meta.db_table)
+        sql = (
+            f'DELETE FROM {table} WHERE (id, "timestamp") IN ('
+            f'SELECT id, "timestamp" FROM {table} WHERE "timestamp" < %s '
+            f'ORDER BY "timestamp" LIMIT %s)'
+        )
+        
         deleted_count = 0
-        while True:
-            # Get a batch of old event IDs
-            event_ids = list(
-                Event.objects.filter(timestamp__lt=cutoff_date)
-                .values_list('id', flat=True)[:batch_size]
-            )
+        batches = 0
+        started = time.monotonic()
+        while max_batches is None or batches < max_batches:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(sql, [cutoff_date, batch_size])
+                batch_deleted = cursor.rowcount
             
-            if not event_ids:
+            if batch_deleted <= 0:
                 break
-                
-            # Delete this batch
-            batch_deleted = Event.objects.filter(id__in=event_ids).delete()[0]
+            
             deleted_count += batch_deleted
+            batches += 1
+            rate = deleted_count / max(time.monotonic() - started, 0.001)
+            self.stdout.write(
+                f"Deleted batch of {batch_deleted} events. Progress: {deleted_count}/{count} "
+                f"({rate:.0f} rows/s)"
+            )
             
-            self.stdout.write(f"Deleted batch of {batch_deleted} events. Progress: {deleted_count}/{count}")
+            if batch_deleted < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
         
-        self.stdout.write(self.style.SUCCESS(f"Successfully deleted {deleted_count} old events")) 
\ No newline at end of file
+        if deleted_count < count:
+            self.stdout.write(f"Stopped after {batches} batches; {count - deleted_count} events remain")
+        return deleted_count
@@ -0,0 +1,179 @@
+import asyncio
+import json
+import ssl
+import time
+import uuid
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def sample_event(worker, sequence):
+    return {
+        'event_id': str(uuid.uuid4()),
+        'distinct_id': f'loadtest-user-{worker}',
+        'event_type': 'loadtest_event',
+        'properties': {'sequence': sequence},
+        'device_id': f'loadtest-device-{worker}',
+        'app_version': '1.0.0',
+        'os_name': 'iOS',
+        'os_version': '17.0',
+    }
+
+
+class Command(BaseCommand):
+    help = 'Load test the ingestion endpoints with many concurrent keep-alive connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            default='http://localhost:8000/api/v1/analytics/capture/',
+            help='Capture or batch endpoint to post to',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=0,
+            help='Events per request; 0 posts single events in the /capture/ format',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=200,
+            help='Number of concurrent connections',
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=30,
+            help='Seconds to run the test',
+        )
+        parser.add_argument(
+            '--token',
+            default='',
+            help='JWT access token sent as a Bearer Authorization header',
+        )
+        parser.add_argument(
+            '--server-cores',
+            type=int,
+            default=1,
+            help='CPU cores serving the endpoint, to report requests per second per core',
+        )
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme not in ('http', 'https'):
+            raise CommandError('--url must be an http or https URL')
+
+        self.stdout.write(
+            f"Posting to {options['url']} with {options['concurrency']} connections "
+            f"for {options['duration']}s"
+        )
+        stats = asyncio.run(self.run(url, options))
+
+        elapsed = stats['elapsed']
+        requests = len(stats['latencies'])
+        rps = requests / elapsed if elapsed else 0
+        events = requests * max(options['batch_size'], 1)
+        latencies = sorted(stats['latencies'])
+
+        def percentile(p):
+            if not latencies:
+                return 0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        self.stdout.write(f"Requests: {requests} in {elapsed:.1f}s")
+        self.stdout.write(f"Status codes: {dict(stats['statuses'])}")
+        if stats['errors']:
+            self.stdout.write(self.style.WARNING(f"Connection errors: {stats['errors']}"))
+        self.stdout.write(
+            f"Latency p50/p95/p99: {percentile(0.5):.1f}/{percentile(0.95):.1f}/{percentile(0.99):.1f} ms"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{rps:.0f} requests/s ({events / elapsed if elapsed else 0:.0f} events/s), "
+            f"{rps / options['server_cores']:.0f} requests/s per core"
+        ))
+
+    async def run(self, url, options):
+        stats = {'latencies': [], 'statuses': Counter(), 'errors': 0}
+        deadline = time.monotonic() + options['duration']
+        started = time.monotonic()
+        await asyncio.gather(*(
+            self.worker(worker, url, options, deadline, stats)
+            for worker in range(options['concurrency'])
+        ))
+        stats['elapsed'] = time.monotonic() - started
+        return stats
+
+    def build_request(self, url, options, worker, sequence):
+        if options['batch_size']:
+            payload = {'batch': [
+                sample_event(worker, sequence + i) for i in range(options['batch_size'])
+            ]}
+        else:
+            payload = sample_event(worker, sequence)
+        body = json.dumps(payload).encode()
+        headers = [
+            f"POST {url.path or '/'} HTTP/1.1",
+            f"Host: {url.netloc}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(body)}",
+            "Connection: keep-alive",
+        ]
+        if options['token']:
+            headers.append(f"Authorization: Bearer {options['token']}")
+        return ('\r\n'.join(headers) + '\r\n\r\n').encode() + body
+
+    async def connect(self, url):
+        port = url.port or (443 if url.scheme == 'https' else 80)
+        context = ssl.create_default_context() if url.scheme == 'https' else None
+        return await asyncio.open_connection(url.hostname, port, ssl=context)
+
+    async def read_response(self, reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError('connection closed by server')
+        status = int(status_line.split()[1])
+        length = 0
+        keep_alive = True
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name = name.strip().lower()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'connection' and value.strip().lower() == 'close':
+                keep_alive = False
+        if length:
+            await reader.readexactly(length)
+        return status, keep_alive
+
+    async def worker(self, worker, url, options, deadline, stats):
+        reader = writer = None
+        sequence = 0
+        while time.monotonic() < deadline:
+            try:
+                if writer is None:
+                    reader, writer = await self.connect(url)
+                request = self.build_request(url, options, worker, sequence)
+                sent = time.monotonic()
+                writer.write(request)
+                await writer.drain()
+                status, keep_alive = await self.read_response(reader)
+                stats['latencies'].append(time.monotonic() - sent)
+                stats['statuses'][status] += 1
+                sequence += max(options['batch_size'], 1)
+                if not keep_alive:
+                    writer.close()
+                    writer = None
+            except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+                stats['errors'] += 1
+                if writer is not None:
+                    writer.close()
+                writer = None
+                await asyncio.sleep(0.1)
+        if writer is not None:
+            writer.close()
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from apps.analytics.partitioning import (
+    convert_to_partitioned, create_future_partitions, get_interval, is_partitioned, list_partitions
+)
+
+
+class Command(BaseCommand):
+    help = 'Convert analytics_event to a range-partitioned table and create future partitions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--convert',
+            action='store_true',
+            help='One-time conversion of the existing table (takes an exclusive lock)',
+        )
+        parser.add_argument(
+            '--ahead',
+            type=int,
+            default=None,
+            help='Number of future partitions to keep ready (default: PARTITION_PREMAKE)',
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='List existing partitions and exit',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Event partitioning requires PostgreSQL')
+
+        if options['convert']:
+            cutover = convert_to_partitioned()
+            self.stdout.write(f'Converted analytics_event; legacy partition holds events before {cutover}')
+        elif not is_partitioned():
+            self.stdout.write(self.style.WARNING(
+                'analytics_event is not partitioned; run with --convert first'
+            ))
+            return
+
+        if options['list']:
+            for name, start, end in list_partitions():
+                if end is None:
+                    bounds = 'DEFAULT'
+                else:
+                    bounds = f"{start or 'MINVALUE'} -> {end}"
+                self.stdout.write(f'  {name}: {bounds}')
+            return
+
+        created = create_future_partitions(ahead=options['ahead'])
+        for name in created:
+            self.stdout.write(f'  Created {name}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(created)} {get_interval()} partitions created'
+        ))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from datetime import datetime, time, timedelta
+
+from apps.analytics.aggregation import aggregate_hours, rollup_days
+from apps.analytics.rollup_cube import aggregate_cube_hours, extend_cube_coverage, rollup_cube_days
+from apps.analytics.session_aggregation import rebuild_session_aggregates
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute hourly and daily event aggregates (including unique-user sketches), '
+        'rollup cubes and daily session aggregates for a date range'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=7,
+            help='Number of past days to rebuild, including today',
+        )
+
+    def handle(self, *args, **options):
+        days = options['days']
+        
+        today = timezone.localdate()
+        start_date = today - timedelta(days=days - 1)
+        
+        self.stdout.write(f'Rebuilding aggregates from {start_date} to {today}')
+        
+        for offset in range(days):
+            date = start_date + timedelta(days=offset)
+            day_start = timezone.make_aware(datetime.combine(date, time.min))
+            hours = [day_start + timedelta(hours=hour) for hour in range(24)]
+            
+            rows = aggregate_hours(hours)
+            cube_rows = aggregate_cube_hours(hours)
+            if date < today:
+                rollup_days([date])
+                rollup_cube_days([date])
+            session_rows = rebuild_session_aggregates([date])
+            
+            self.stdout.write(
+                f"  {date}: {rows} hourly rows, {cube_rows} cube rows, {session_rows} session rows"
+            )
+        
+        # Breakdowns can now read the cubes back to the first rebuilt day
+        extend_cube_coverage(timezone.make_aware(datetime.combine(start_date, time.min)))
+        
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt aggregates for {days} days'))
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("analytics", "0006_remove_temporary_fields"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AggregationCheckpoint",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=100, primary_key=True, serialize=False),
+                ),
+                (
+                    "position",
+                    models.DateTimeField(
+                        help_text="Events created up to this time have been aggregated"
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(
+                fields=["created_at"], name="analytics_e_created_7b5fb3_idx"
+            ),
+        ),
+    ]
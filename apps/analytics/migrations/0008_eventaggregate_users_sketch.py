@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("analytics", "0007_aggregation_checkpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="eventaggregate",
+            name="users_sketch",
+            field=models.BinaryField(
+                blank=True,
+                help_text="Serialized HyperLogLog sketch of the distinct_ids in this bucket",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:34
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_open_sessions(apps, schema_editor):
+    """
+    Set last_event_at on open sessions from their latest event, or their start.
+    """
+    Event = apps.get_model('analytics', 'Event')
+    Session = apps.get_model('analytics', 'Session')
+
+    latest_event = Event.objects.filter(session_id=OuterRef('pk')) \
+        .values('session_id').annotate(latest=Max('timestamp')).values('latest')
+    Session.objects.filter(end_time__isnull=True).update(
+        last_event_at=Coalesce(Subquery(latest_event), 'start_time')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("analytics", "0008_eventaggregate_users_sketch"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="session",
+            name="last_event_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="Timestamp of the latest event, maintained at ingestion",
+                null=True,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="session",
+            index=models.Index(
+                condition=models.Q(("end_time__isnull", True)),
+                fields=["last_event_at"],
+                name="analytics_session_open_idx",
+            ),
+        ),
+        migrations.RunPython(backfill_open_sessions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,122 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:41
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("analytics", "0009_session_last_event_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # New access paths are built before the indexes they replace are dropped
+    operations = [
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(
+                fields=["timestamp", "id"], name="analytics_event_ts_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(
+                fields=["event_type", "timestamp"], name="analytics_event_type_ts_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(
+                fields=["distinct_id", "timestamp"], name="analytics_event_user_ts_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(
+                fields=["device", "timestamp"], name="analytics_event_device_ts_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(
+                condition=models.Q(("processed", False)),
+                fields=["timestamp"],
+                name="analytics_event_unproc_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="event",
+            index=django.contrib.postgres.indexes.BrinIndex(
+                autosummarize=True,
+                fields=["created_at"],
+                name="analytics_event_created_brin",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="session",
+            index=models.Index(
+                fields=["distinct_id", "device", "start_time"],
+                name="analytics_session_user_dev_idx",
+            ),
+        ),
+        migrations.RemoveIndex(
+            model_name="event",
+            name="analytics_e_distinc_534475_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="event",
+            name="analytics_e_event_t_acfd0a_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="event",
+            name="analytics_e_timesta_fdc538_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="event",
+            name="analytics_e_process_d222cd_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="event",
+            name="analytics_e_created_7b5fb3_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="session",
+            name="analytics_s_distinc_e4c8f0_idx",
+        ),
+        migrations.AlterField(
+            model_name="event",
+            name="device",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="events",
+                to="analytics.deviceinfo",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="event",
+            name="event_type",
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AlterField(
+            model_name="event",
+            name="timestamp",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name="session",
+            name="distinct_id",
+            field=models.CharField(max_length=200),
+        ),
+        migrations.AlterField(
+            model_name="session",
+            name="start_time",
+            field=models.DateTimeField(),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:57
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("analytics", "0010_review_event_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SessionAggregate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "date",
+                    models.DateField(help_text="Local date the sessions started on"),
+                ),
+                ("os_name", models.CharField(blank=True, default="", max_length=50)),
+                (
+                    "app_version",
+                    models.CharField(blank=True, default="", max_length=50),
+                ),
+                ("sessions", models.IntegerField(default=0)),
+                ("total_duration", models.DurationField(default=datetime.timedelta)),
+                ("total_events", models.BigIntegerField(default=0)),
+                (
+                    "duration_histogram",
+                    models.JSONField(
+                        default=dict, help_text="Sessions per duration bucket (seconds)"
+                    ),
+                ),
+                (
+                    "events_histogram",
+                    models.JSONField(
+                        default=dict, help_text="Sessions per events-count bucket"
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("date", "os_name", "app_version"),
+                        name="unique_session_aggregate",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("analytics", "0011_session_aggregate"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RollupCubeRow",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "cube",
+                    models.CharField(
+                        help_text="Name of the cube in ROLLUP_CUBES", max_length=50
+                    ),
+                ),
+                ("date", models.DateField()),
+                (
+                    "hour",
+                    models.IntegerField(
+                        blank=True,
+                        help_text="Hour of day (0-23) if this is an hourly row",
+                        null=True,
+                    ),
+                ),
+                ("event_type", models.CharField(blank=True, max_length=100, null=True)),
+                ("os_name", models.CharField(blank=True, max_length=50, null=True)),
+                ("app_version", models.CharField(blank=True, max_length=50, null=True)),
+                ("country", models.CharField(blank=True, max_length=100, null=True)),
+                ("is_simulator", models.BooleanField(blank=True, null=True)),
+                ("count", models.IntegerField(default=0)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["cube", "date", "hour"],
+                        name="analytics_rollup_cube_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -1,4 +1,6 @@
 import uuid
+from datetime import timedelta
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
 from django.utils import timezone
 from apps.users.models import User
@@ -52,12 +54,14 @@ class Session(models.Model):
     Represents a user session with start and end times.
     """
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    distinct_id = models.CharField(max_length=200, db_index=True)
+    distinct_id = models.CharField(max_length=200)
     device = models.ForeignKey(DeviceInfo, on_delete=models.PROTECT, related_name='sessions', null=True, blank=True)
-    start_time = models.DateTimeField(db_index=True)
+    start_time = models.DateTimeField()
     end_time = models.DateTimeField(null=True, blank=True)
     duration = models.DurationField(null=True, blank=True)
     events_count = models.IntegerField(default=0)
+    last_event_at = models.DateTimeField(null=True, blank=True,
+                                         help_text="Timestamp of the latest event, maintained at ingestion")
     user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
     # Location can change during a session (e.g. mobile user moving)
     location = models.ForeignKey(LocationInfo, null=True, blank=True, on_delete=models.SET_NULL, related_name='sessions')
@@ -67,8 +71,12 @@ class Session(models.Model):
     
     class Meta:
         indexes = [
-            models.Index(fields=['distinct_id']),
+            # Session matching looks up the latest session of a user and device
+            models.Index(fields=['distinct_id', 'device', 'start_time'], name='analytics_session_user_dev_idx'),
             models.Index(fields=['start_time']),
+            # Lets close_inactive_sessions find idle open sessions without a scan
+            models.Index(fields=['last_event_at'], condition=models.Q(end_time__isnull=True),
+                         name='analytics_session_open_idx'),
         ]
         ordering = ['-start_time']
     
@@ -89,11 +97,13 @@ class Event(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name='events', null=True, blank=True)
     distinct_id = models.CharField(max_length=200, help_text="Anonymous user identifier")
-    event_type = models.CharField(max_length=100, db_index=True)
+    event_type = models.CharField(max_length=100)
     properties = models.JSONField(default=dict, help_text="Event properties in JSON format")
-    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
+    timestamp = models.DateTimeField(default=timezone.now)
     # We can still reference the device directly for events without sessions
-    device = models.ForeignKey(DeviceInfo, on_delete=models.PROTECT, related_name='events', null=True, blank=True)
+    # (indexed by analytics_event_device_ts_idx)
+    device = models.ForeignKey(DeviceInfo, on_delete=models.PROTECT, related_name='events', null=True, blank=True,
+                               db_index=False)
     # Location can change during a session (e.g. mobile user moving)
     location = models.ForeignKey(LocationInfo, null=True, blank=True, on_delete=models.SET_NULL, related_name='events')
     # Fields that remain in the model
@@ -106,11 +116,22 @@ class Event(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
+        # Every index is maintained on each insert, so only the access paths
+        # the app actually uses are indexed (see benchmark_indexes)
         indexes = [
-            models.Index(fields=['distinct_id']),
-            models.Index(fields=['event_type']),
-            models.Index(fields=['timestamp']),
-            models.Index(fields=['processed']),
+            # Keyset pagination, exports and time-range scans read in (timestamp, id) order
+            models.Index(fields=['timestamp', 'id'], name='analytics_event_ts_id_idx'),
+            # Per-type counts and time series
+            models.Index(fields=['event_type', 'timestamp'], name='analytics_event_type_ts_idx'),
+            # Per-user and per-device timelines; the latter also serves the device foreign key
+            models.Index(fields=['distinct_id', 'timestamp'], name='analytics_event_user_ts_idx'),
+            models.Index(fields=['device', 'timestamp'], name='analytics_event_device_ts_idx'),
+            # The processor only looks at the small unprocessed backlog
+            models.Index(fields=['timestamp'], condition=models.Q(processed=False),
+                         name='analytics_event_unproc_idx'),
+            # Incremental aggregation scans events by ingestion time, which follows
+            # the physical order of the append-only table, so a tiny BRIN suffices
+            BrinIndex(fields=['created_at'], autosummarize=True, name='analytics_event_created_brin'),
         ]
         ordering = ['-timestamp']
     
@@ -147,6 +168,8 @@ class EventAggregate(models.Model):
                               help_text="Hour of day (0-23) if this is an hourly aggregate")
     count = models.IntegerField(default=0)
     unique_users = models.IntegerField(default=0)
+    users_sketch = models.BinaryField(null=True, blank=True,
+                                      help_text="Serialized HyperLogLog sketch of the distinct_ids in this bucket")
     properties = models.JSONField(default=dict, help_text="Aggregated properties in JSON format")
     
     class Meta:
@@ -161,4 +184,74 @@ class EventAggregate(models.Model):
         time_str = f"{self.date}"
         if self.hour is not None:
             time_str += f" {self.hour:02d}:00"
-        return f"{self.event_type} - {time_str} - {self.count} events" 
\ No newline at end of file
+        return f"{self.event_type} - {time_str} - {self.count} events" 
+
+
+class SessionAggregate(models.Model):
+    """
+    Daily rollup of ended sessions per OS and app version.
+
+    Durations and events per session are kept as histograms (bucket lower
+    bound -> sessions) so percentiles can be estimated over any set of rows.
+    """
+    date = models.DateField(help_text="Local date the sessions started on")
+    os_name = models.CharField(max_length=50, blank=True, default='')
+    app_version = models.CharField(max_length=50, blank=True, default='')
+    sessions = models.IntegerField(default=0)
+    total_duration = models.DurationField(default=timedelta)
+    total_events = models.BigIntegerField(default=0)
+    duration_histogram = models.JSONField(default=dict, help_text="Sessions per duration bucket (seconds)")
+    events_histogram = models.JSONField(default=dict, help_text="Sessions per events-count bucket")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'os_name', 'app_version'],
+                name='unique_session_aggregate'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.os_name} {self.app_version} - {self.sessions} sessions"
+
+
+class RollupCubeRow(models.Model):
+    """
+    Event count for one combination of dimension values in a rollup cube.
+
+    Dimensions that are not part of the row's cube are left NULL, as are
+    values the events did not have (e.g. no device). See rollup_cube.
+    """
+    cube = models.CharField(max_length=50, help_text="Name of the cube in ROLLUP_CUBES")
+    date = models.DateField()
+    hour = models.IntegerField(null=True, blank=True,
+                               help_text="Hour of day (0-23) if this is an hourly row")
+    event_type = models.CharField(max_length=100, null=True, blank=True)
+    os_name = models.CharField(max_length=50, null=True, blank=True)
+    app_version = models.CharField(max_length=50, null=True, blank=True)
+    country = models.CharField(max_length=100, null=True, blank=True)
+    is_simulator = models.BooleanField(null=True, blank=True)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['cube', 'date', 'hour'], name='analytics_rollup_cube_idx'),
+        ]
+
+    def __str__(self):
+        time_str = f"{self.date}"
+        if self.hour is not None:
+            time_str += f" {self.hour:02d}:00"
+        return f"{self.cube} - {time_str} - {self.count} events"
+
+
+class AggregationCheckpoint(models.Model):
+    """
+    Tracks how far an incremental aggregation job has progressed.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    position = models.DateTimeField(help_text="Events created up to this time have been aggregated")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
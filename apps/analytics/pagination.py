@@ -0,0 +1,168 @@
+"""
+Keyset pagination for large, append-only tables.
+
+PageNumberPagination runs COUNT(*) and OFFSET N on every page, both of
+which grow with the table. KeysetPagination instead orders by
+(timestamp, id) descending and encodes the last row of a page in an
+opaque cursor; the next page is read with a range condition on the
+timestamp index, so every page costs the same no matter how deep it is.
+id breaks ties between events that share a timestamp, e.g. a batch
+stored with the server time.
+
+The total count is only computed when the client asks for it with
+?count=true.
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on (timestamp, id), newest first.
+    """
+    page_size = 100
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.count = queryset.count() if self.include_count(request) else None
+
+        reverse, timestamp, pk = self.decode_cursor(request)
+        if pk is not None:
+            try:
+                pk = queryset.model._meta.pk.to_python(pk)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+        if timestamp is None:
+            rows = queryset.order_by('-timestamp', '-id')
+        elif reverse:
+            # Walk towards newer rows and flip the page afterwards
+            rows = queryset.filter(
+                Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk),
+                timestamp__gte=timestamp,
+            ).order_by('timestamp', 'id')
+        else:
+            rows = queryset.filter(
+                Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk),
+                timestamp__lte=timestamp,
+            ).order_by('-timestamp', '-id')
+
+        # One extra row tells whether another page follows
+        page = list(rows[:self.page_size + 1])
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if reverse:
+            page.reverse()
+
+        self.next_row = self.previous_row = None
+        if page:
+            if reverse:
+                self.next_row = page[-1]
+                self.previous_row = page[0] if has_more else None
+            else:
+                self.next_row = page[-1] if has_more else None
+                self.previous_row = page[0] if timestamp is not None else None
+        return page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def include_count(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes')
+
+    def decode_cursor(self, request):
+        """
+        Returns:
+            tuple: (reverse, timestamp, id), with timestamp None on the first page
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None, None
+        try:
+            direction, timestamp, pk = urlsafe_b64decode(encoded.encode('ascii')).decode('ascii').split('|')
+            timestamp = parse_datetime(timestamp)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if direction not in ('n', 'p') or timestamp is None or not pk:
+            raise NotFound(self.invalid_cursor_message)
+        return direction == 'p', timestamp, pk
+
+    def encode_cursor(self, row, reverse=False):
+        raw = f"{'p' if reverse else 'n'}|{row.timestamp.isoformat()}|{row.pk}"
+        cursor = urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        if self.next_row is None:
+            return None
+        return self.encode_cursor(self.next_row)
+
+    def get_previous_link(self):
+        if self.previous_row is None:
+            return None
+        return self.encode_cursor(self.previous_row, reverse=True)
+
+    def get_paginated_response(self, data):
+        payload = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+        if self.count is not None:
+            payload['count'] = self.count
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Include the total number of results.',
+                'schema': {'type': 'boolean'},
+            },
+        ]
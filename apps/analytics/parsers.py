@@ -0,0 +1,257 @@
+"""
+Streaming request parsers for batch uploads.
+
+/batch/ accepts, besides the plain JSON {"batch": [...]} object:
+
+* Content-Encoding: gzip, deflate or zstd on any body
+* application/x-ndjson: one event object per line
+* application/msgpack: a stream of event maps (or arrays of them)
+
+Bodies are decompressed and decoded incrementally, so NDJSON and msgpack
+uploads are turned into an EventStream that yields events one at a time;
+the view validates and stores them in chunks of MAX_BATCH_SIZE instead of
+materialising the whole upload. Decompressed output is capped at
+BATCH_MAX_DECOMPRESSED_BYTES to guard against compression bombs, and a
+single NDJSON line at NDJSON_MAX_LINE_BYTES.
+"""
+import json
+import zlib
+
+import msgpack
+import zstandard
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.parsers import BaseParser
+
+from .utils import get_tracking_setting
+
+READ_CHUNK_SIZE = 64 * 1024
+# zstd has no output limit per call and a few input bytes can expand to a
+# 128 KiB block, so input is fed in slices that bound one call to ~8 MiB
+ZSTD_INPUT_SLICE = 256
+# One event per line; anything longer is not an event and would only be buffered
+NDJSON_MAX_LINE_BYTES = 1024 * 1024
+
+NDJSON_MEDIA_TYPES = ('application/x-ndjson', 'application/ndjson')
+MSGPACK_MEDIA_TYPES = ('application/msgpack', 'application/x-msgpack')
+
+
+class PayloadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Decompressed request body is too large.'
+    default_code = 'payload_too_large'
+
+
+class UnsupportedEncoding(APIException):
+    status_code = status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+    default_detail = 'Unsupported Content-Encoding.'
+    default_code = 'unsupported_encoding'
+
+
+class InvalidItem:
+    """
+    Placeholder for a stream item that could not be decoded.
+    """
+
+    def __init__(self, message):
+        self.message = message
+
+
+class EventStream:
+    """
+    Lazily decoded sequence of event payloads from a streamed upload.
+    """
+
+    def __init__(self, items):
+        self.items = items
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def _read_chunks(stream):
+    while True:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _limited(chunks, limit):
+    total = 0
+    for chunk in chunks:
+        total += len(chunk)
+        if total > limit:
+            raise PayloadTooLarge(f'Decompressed request body exceeds {limit} bytes.')
+        yield chunk
+
+
+def _inflate(stream):
+    # wbits 32 + MAX_WBITS accepts both gzip and zlib (deflate) headers
+    decompressor = zlib.decompressobj(32 + zlib.MAX_WBITS)
+    try:
+        for chunk in _read_chunks(stream):
+            data = decompressor.decompress(chunk, READ_CHUNK_SIZE)
+            while data:
+                yield data
+                data = decompressor.decompress(decompressor.unconsumed_tail, READ_CHUNK_SIZE)
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+    except zlib.error as e:
+        raise ParseError(f'Malformed compressed body - {e}')
+    if not decompressor.eof:
+        raise ParseError('Malformed compressed body - unexpected end of data')
+
+
+def _unzstd(stream):
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+    try:
+        for chunk in _read_chunks(stream):
+            for offset in range(0, len(chunk), ZSTD_INPUT_SLICE):
+                data = decompressor.decompress(chunk[offset:offset + ZSTD_INPUT_SLICE])
+                if data:
+                    yield data
+    except zstandard.ZstdError as e:
+        raise ParseError(f'Malformed compressed body - {e}')
+    if not decompressor.eof:
+        raise ParseError('Malformed compressed body - unexpected end of data')
+
+
+def decoded_chunks(stream, content_encoding=''):
+    """
+    Yield the decompressed body of a request in chunks.
+
+    Args:
+        stream: File-like request body
+        content_encoding (str): Value of the Content-Encoding header
+
+    Raises:
+        UnsupportedEncoding: For encodings this server cannot decode
+        PayloadTooLarge: When the output exceeds BATCH_MAX_DECOMPRESSED_BYTES
+    """
+    encoding = (content_encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        chunks = _read_chunks(stream)
+    elif encoding in ('gzip', 'x-gzip', 'deflate'):
+        chunks = _inflate(stream)
+    elif encoding == 'zstd':
+        chunks = _unzstd(stream)
+    else:
+        raise UnsupportedEncoding(f'Unsupported Content-Encoding "{content_encoding}" in request.')
+    limit = get_tracking_setting('BATCH_MAX_DECOMPRESSED_BYTES', 200 * 1024 * 1024)
+    return _limited(chunks, limit)
+
+
+def iter_ndjson(chunks, max_line=NDJSON_MAX_LINE_BYTES):
+    """
+    Decode newline-delimited JSON, yielding one value per non-empty line.
+
+    Only the bytes appended by each chunk are searched for newlines, so a
+    line spread over many chunks costs linear time.
+
+    Raises:
+        PayloadTooLarge: For a line longer than `max_line` bytes
+    """
+    pending = bytearray()
+    for chunk in chunks:
+        scanned = len(pending)
+        pending += chunk
+        start = 0
+        end = pending.find(b'\n', scanned)
+        while end != -1:
+            _check_line_length(end - start, max_line)
+            line = pending[start:end]
+            if line.strip():
+                yield _decode_json_line(line)
+            start = end + 1
+            end = pending.find(b'\n', start)
+        del pending[:start]
+        _check_line_length(len(pending), max_line)
+    if pending.strip():
+        yield _decode_json_line(pending)
+
+
+def _check_line_length(length, max_line):
+    if length > max_line:
+        raise PayloadTooLarge(f'NDJSON line exceeds {max_line} bytes.')
+
+
+def _decode_json_line(line):
+    try:
+        return json.loads(line)
+    except (ValueError, UnicodeDecodeError) as e:
+        return InvalidItem(f'JSON parse error - {e}')
+
+
+def iter_msgpack(chunks):
+    """
+    Decode a stream of msgpack objects; top-level arrays are flattened.
+    """
+    unpacker = msgpack.Unpacker(raw=False, timestamp=3)
+    try:
+        for chunk in chunks:
+            unpacker.feed(chunk)
+            for item in unpacker:
+                if isinstance(item, list):
+                    yield from item
+                else:
+                    yield item
+    except (msgpack.UnpackException, ValueError) as e:
+        raise ParseError(f'Msgpack parse error - {e}')
+
+
+def parse_batch_body(stream, media_type, content_encoding=''):
+    """
+    Decode a batch upload body.
+
+    Returns:
+        dict or EventStream: The decoded JSON object for application/json,
+            or a lazily decoded EventStream for NDJSON and msgpack
+    """
+    media_type = (media_type or '').split(';')[0].strip().lower()
+    chunks = decoded_chunks(stream, content_encoding)
+    if media_type in NDJSON_MEDIA_TYPES:
+        return EventStream(iter_ndjson(chunks))
+    if media_type in MSGPACK_MEDIA_TYPES:
+        return EventStream(iter_msgpack(chunks))
+    try:
+        return json.loads(b''.join(chunks))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ParseError(f'JSON parse error - {e}')
+
+
+class BatchParser(BaseParser):
+    """
+    DRF parser for /batch/ bodies in any of the supported formats and encodings.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = (parser_context or {}).get('request')
+        content_encoding = request.META.get('HTTP_CONTENT_ENCODING', '') if request else ''
+        return parse_batch_body(stream, media_type, content_encoding)
+
+
+class BatchJSONParser(BatchParser):
+    media_type = 'application/json'
+
+
+class NDJSONParser(BatchParser):
+    media_type = 'application/x-ndjson'
+
+
+class NDJSONAltParser(BatchParser):
+    media_type = 'application/ndjson'
+
+
+class MsgpackParser(BatchParser):
+    media_type = 'application/msgpack'
+
+
+class MsgpackAltParser(BatchParser):
+    media_type = 'application/x-msgpack'
+
+
+BATCH_PARSER_CLASSES = [
+    BatchJSONParser, NDJSONParser, NDJSONAltParser, MsgpackParser, MsgpackAltParser,
+]
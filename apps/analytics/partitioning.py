@@ -0,0 +1,277 @@
+"""
+Native PostgreSQL range partitioning of analytics_event on timestamp.
+
+The table is converted once with `manage.py partition_events --convert`.
+The existing heap becomes the "legacy" partition covering everything
+before the cut-over, a DEFAULT partition catches events outside every
+range (e.g. devices with a wrong clock), and daily or monthly partitions
+(EVENT_TRACKING['PARTITION_INTERVAL']) are created ahead of time by the
+create_event_partitions beat task.
+
+PostgreSQL requires the partition key in every unique constraint, so the
+primary key of the partitioned table is (id, timestamp). Client-supplied
+event ids stay unique in practice because retries resend the same
+timestamp; events sent without one are looked up by id before insert.
+"""
+import re
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.db import connection, transaction
+
+from .models import Event
+from .utils import get_tracking_setting
+
+TABLE = Event._meta.db_table
+LEGACY_PARTITION = f'{TABLE}_legacy'
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+INTERVALS = ('day', 'month')
+
+
+def get_interval():
+    interval = get_tracking_setting('PARTITION_INTERVAL', 'month')
+    if interval not in INTERVALS:
+        raise ValueError(f"PARTITION_INTERVAL must be one of {INTERVALS}, got {interval!r}")
+    return interval
+
+
+def partition_start(moment, interval):
+    """
+    Start of the partition range containing `moment`, in UTC.
+    """
+    moment = moment.astimezone(dt_timezone.utc)
+    if interval == 'day':
+        return datetime(moment.year, moment.month, moment.day, tzinfo=dt_timezone.utc)
+    return datetime(moment.year, moment.month, 1, tzinfo=dt_timezone.utc)
+
+
+def next_partition_start(start, interval):
+    if interval == 'day':
+        return start + timedelta(days=1)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def partition_name(start, interval):
+    if interval == 'day':
+        return f"{TABLE}_y{start:%Y}m{start:%m}d{start:%d}"
+    return f"{TABLE}_y{start:%Y}m{start:%m}"
+
+
+def is_partitioned():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p "
+            "JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+BOUND_PATTERN = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+INDEX_TABLE_PATTERN = re.compile(rf' ON (ONLY )?((\w+)\.)?"?{LEGACY_PARTITION}"? ')
+
+
+def _parse_bound(value):
+    value = value.strip("'")
+    if value == 'MINVALUE':
+        return None
+    return datetime.fromisoformat(value).astimezone(dt_timezone.utc)
+
+
+def list_partitions():
+    """
+    Return the partitions of the event table.
+
+    Returns:
+        list: (name, start, end) tuples ordered by start; start is None for
+            the legacy partition and both bounds are None for the default
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) "
+            "FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = %s AND pg_table_is_visible(parent.oid)",
+            [TABLE]
+        )
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, bound in rows:
+        match = BOUND_PATTERN.search(bound)
+        if match:
+            partitions.append((name, _parse_bound(match.group(1)), _parse_bound(match.group(2))))
+        else:
+            partitions.append((name, None, None))
+    epoch = datetime.min.replace(tzinfo=dt_timezone.utc)
+    return sorted(partitions, key=lambda p: (p[2] is None, p[1] or epoch))
+
+
+def create_partition(start, end, name):
+    """
+    Create one range partition, moving any rows the DEFAULT partition holds for it.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE "{name}" (LIKE "{TABLE}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+        )
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" '
+            f'WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *) '
+            f'INSERT INTO "{name}" SELECT * FROM moved',
+            [start, end]
+        )
+        cursor.execute(
+            f'ALTER TABLE "{TABLE}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)',
+            [start, end]
+        )
+
+
+def create_future_partitions(ahead=None, now=None):
+    """
+    Make sure partitions exist from the current interval up to `ahead` intervals ahead.
+
+    Returns:
+        list: Names of the partitions that were created
+    """
+    interval = get_interval()
+    if ahead is None:
+        ahead = get_tracking_setting('PARTITION_PREMAKE', 3)
+    now = now or datetime.now(dt_timezone.utc)
+
+    existing = list_partitions()
+    covered_until = max((end for _, _, end in existing if end is not None), default=None)
+
+    created = []
+    start = partition_start(now, interval)
+    for _ in range(ahead + 1):
+        end = next_partition_start(start, interval)
+        # Ranges below the legacy cut-over are already covered
+        if covered_until is None or start >= covered_until:
+            name = partition_name(start, interval)
+            create_partition(start, end, name)
+            created.append(name)
+        start = end
+    return created
+
+
+def convert_to_partitioned(now=None):
+    """
+    Turn the plain analytics_event table into a partitioned table.
+
+    The current heap is attached as the legacy partition for everything
+    before the start of the next interval, so no rows are copied except
+    events dated after the cut-over, which move to the DEFAULT partition.
+    Validating the legacy range and rebuilding its primary key on
+    (id, timestamp) scan the table, so run this in a maintenance window.
+
+    Returns:
+        datetime: The cut-over between the legacy partition and new partitions
+    """
+    interval = get_interval()
+    now = now or datetime.now(dt_timezone.utc)
+    cutover = next_partition_start(partition_start(now, interval), interval)
+
+    if is_partitioned():
+        raise ValueError(f"{TABLE} is already partitioned")
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE "{TABLE}" IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'ALTER TABLE "{TABLE}" RENAME TO "{LEGACY_PARTITION}"')
+
+        # Index definitions are recreated on the parent under their Django names;
+        # ATTACH PARTITION then adopts the renamed legacy indexes as children
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes "
+            "WHERE tablename = %s AND indexname NOT IN ("
+            "  SELECT conname FROM pg_constraint WHERE contype = 'p')",
+            [LEGACY_PARTITION]
+        )
+        indexes = cursor.fetchall()
+        for index_name, definition in indexes:
+            if definition.startswith('CREATE UNIQUE'):
+                raise ValueError(
+                    f"Unique index {index_name} does not include timestamp; "
+                    f"drop it before partitioning"
+                )
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [LEGACY_PARTITION]
+        )
+        foreign_keys = cursor.fetchall()
+        for index_name, _ in indexes:
+            cursor.execute(f'ALTER INDEX "{index_name}" RENAME TO "{index_name[:56]}_legacy"')
+
+        # A partition cannot keep a primary key of its own, so the legacy
+        # heap gets one matching the parent's (id, timestamp), which
+        # ATTACH PARTITION adopts like the other indexes
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'",
+            [LEGACY_PARTITION]
+        )
+        for (constraint_name,) in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE "{LEGACY_PARTITION}" DROP CONSTRAINT "{constraint_name}"')
+        cursor.execute(
+            f'ALTER TABLE "{LEGACY_PARTITION}" ADD CONSTRAINT "{LEGACY_PARTITION}_pkey" '
+            f'PRIMARY KEY ("id", "timestamp")'
+        )
+
+        cursor.execute(
+            f'CREATE TABLE "{TABLE}" (LIKE "{LEGACY_PARTITION}" INCLUDING DEFAULTS '
+            f'INCLUDING CONSTRAINTS INCLUDING STORAGE) PARTITION BY RANGE ("timestamp")'
+        )
+        cursor.execute(f'ALTER TABLE "{TABLE}" ADD PRIMARY KEY ("id", "timestamp")')
+        for _, definition in indexes:
+            cursor.execute(INDEX_TABLE_PATTERN.sub(f' ON {TABLE} ', definition, count=1))
+        for constraint_name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{constraint_name}" {definition}')
+
+        cursor.execute(f'CREATE TABLE "{DEFAULT_PARTITION}" PARTITION OF "{TABLE}" DEFAULT')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM "{LEGACY_PARTITION}" WHERE "timestamp" >= %s RETURNING *) '
+            f'INSERT INTO "{TABLE}" SELECT * FROM moved',
+            [cutover]
+        )
+        cursor.execute(
+            f'ALTER TABLE "{TABLE}" ATTACH PARTITION "{LEGACY_PARTITION}" '
+            f'FOR VALUES FROM (MINVALUE) TO (%s)',
+            [cutover]
+        )
+
+    return cutover
+
+
+def expired_partitions(cutoff):
+    """
+    Range partitions whose upper bound is at or before `cutoff`.
+
+    Returns:
+        list: (name, start, end) tuples, oldest first
+    """
+    return [
+        partition for partition in list_partitions()
+        if partition[2] is not None and partition[2] <= cutoff
+    ]
+
+
+def drop_partition(name):
+    """
+    Detach a partition and drop it.
+
+    Returns:
+        int: Planner estimate of the rows it held (pg_class.reltuples), so
+        that reporting does not scan the partition being dropped
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        # reltuples is -1 for a table that was never vacuumed or analyzed
+        cursor.execute('SELECT greatest(reltuples, 0)::bigint FROM pg_class WHERE oid = %s::regclass', [name])
+        rows = cursor.fetchone()[0]
+        cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"')
+        cursor.execute(f'DROP TABLE "{name}"')
+    return rows
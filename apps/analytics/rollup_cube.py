@@ -0,0 +1,321 @@
+"""
+Hourly rollup cubes of event counts over device, app and location dimensions.
+
+A cube is a named set of dimensions from DIMENSIONS, configured in the
+ROLLUP_CUBES setting. For every hour it stores one RollupCubeRow per
+combination of dimension values that occurred, with the event count;
+completed days also get daily rows (hour NULL) summed from the hourly
+ones. All cubes are filled from a single GROUP BY over the events of an
+hour, joined once to DeviceInfo and LocationInfo, so breakdowns by OS,
+app version or country no longer join over the whole event range.
+
+Cubes are maintained incrementally like EventAggregate: each run of
+aggregate_cube_events recomputes the hours that received events since
+its own created_at watermark. A cube only holds the hours recomputed
+after it was configured, so each cube records the hour it is complete
+from (its first run, or the start of a rebuild_aggregates backfill).
+breakdown() answers a grouped count from the cube with the fewest
+dimensions that covers the requested dimensions and filters, and counts
+raw events only for the edges of the range, the hours before the cube's
+coverage and the tail after the watermark.
+"""
+import logging
+from collections import Counter
+from datetime import time, timedelta
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .aggregation import (
+    HOUR, bump_aggregates_version, find_dirty_hours, get_checkpoint, hour_ceil, hour_floor,
+    hour_range_filter, hourly_rows_between, set_checkpoint,
+)
+from .models import AggregationCheckpoint, Event, RollupCubeRow
+from .utils import get_tracking_setting
+
+logger = logging.getLogger(__name__)
+
+CUBE_CHECKPOINT = 'rollup_cube_hourly'
+# Per cube: start of the hour from which the cube holds every hour
+CUBE_COVERAGE_PREFIX = 'rollup_cube_from:'
+
+# Dimensions a cube can use: RollupCubeRow column -> Event lookup
+DIMENSIONS = {
+    'event_type': 'event_type',
+    'os_name': 'device__os_name',
+    'app_version': 'device__app_version',
+    'country': 'location__country',
+    'is_simulator': 'device__is_simulator',
+}
+
+
+def get_cubes():
+    """
+    Configured cubes as {name: (dimension, ...)}.
+    """
+    cubes = {}
+    for name, dimensions in get_tracking_setting('ROLLUP_CUBES', {}).items():
+        unknown = set(dimensions) - set(DIMENSIONS)
+        if unknown:
+            raise ImproperlyConfigured(
+                f"ROLLUP_CUBES['{name}'] uses unknown dimensions: {', '.join(sorted(unknown))}"
+            )
+        cubes[name] = tuple(dimensions)
+    return cubes
+
+
+def choose_cube(dimensions):
+    """
+    Pick the cube with the fewest dimensions that covers `dimensions`.
+
+    Ties go to the cube configured first.
+
+    Returns:
+        str: Cube name, or None if no cube has all the dimensions
+    """
+    needed = set(dimensions)
+    candidates = [
+        (len(cube_dimensions), index, name)
+        for index, (name, cube_dimensions) in enumerate(get_cubes().items())
+        if needed <= set(cube_dimensions)
+    ]
+    return min(candidates)[2] if candidates else None
+
+
+def _hours_filter(hours):
+    condition = Q()
+    for hour in hours:
+        hour = timezone.localtime(hour)
+        condition |= Q(date=hour.date(), hour=hour.hour)
+    return condition
+
+
+def aggregate_cube_hours(hours):
+    """
+    Recompute the hourly rows of every configured cube for the given hours.
+
+    Args:
+        hours (iterable): Aware datetimes truncated to the hour
+
+    Returns:
+        int: Number of rows written
+    """
+    hours = set(hours)
+    cubes = get_cubes()
+    if not hours or not cubes:
+        return 0
+
+    # Group once by every dimension any cube uses, then roll up per cube
+    dimensions = [name for name in DIMENSIONS if any(name in dims for dims in cubes.values())]
+    rows = (
+        Event.objects.filter(hour_range_filter(hours))
+        .annotate(bucket=TruncHour('timestamp'))
+        .values_list('bucket', *(DIMENSIONS[name] for name in dimensions))
+        .annotate(count=Count('id'))
+    )
+    counts = {name: Counter() for name in cubes}
+    for bucket, *values, count in rows:
+        values = dict(zip(dimensions, values))
+        for name, cube_dimensions in cubes.items():
+            counts[name][(bucket, tuple(values[dimension] for dimension in cube_dimensions))] += count
+
+    cube_rows = [
+        RollupCubeRow(
+            cube=name,
+            date=bucket.date(),
+            hour=bucket.hour,
+            count=count,
+            **dict(zip(cubes[name], values)),
+        )
+        for name, cube_counts in counts.items()
+        for (bucket, values), count in cube_counts.items()
+    ]
+    with transaction.atomic():
+        RollupCubeRow.objects.filter(_hours_filter(hours), cube__in=cubes).delete()
+        RollupCubeRow.objects.bulk_create(cube_rows, batch_size=1000)
+    bump_aggregates_version()
+    return len(cube_rows)
+
+
+def rollup_cube_days(dates):
+    """
+    Rebuild the daily rows of every configured cube from its hourly rows.
+
+    Returns:
+        int: Number of daily rows written
+    """
+    cubes = get_cubes()
+    written = 0
+    for date in sorted(set(dates)):
+        daily = (
+            RollupCubeRow.objects.filter(cube__in=cubes, date=date, hour__isnull=False)
+            .values('cube', *DIMENSIONS)
+            .annotate(total=Sum('count'))
+        )
+        cube_rows = [
+            RollupCubeRow(date=date, hour=None, count=row.pop('total'), **row)
+            for row in daily
+        ]
+        with transaction.atomic():
+            RollupCubeRow.objects.filter(cube__in=cubes, date=date, hour__isnull=True).delete()
+            RollupCubeRow.objects.bulk_create(cube_rows, batch_size=1000)
+        written += len(cube_rows)
+    if dates:
+        bump_aggregates_version()
+    return written
+
+
+def cube_aggregated_until():
+    """
+    Start of the hour up to which the cubes are complete.
+    """
+    position = get_checkpoint(CUBE_CHECKPOINT, None)
+    if position is None:
+        return None
+    return hour_floor(position)
+
+
+def cube_covered_from(cube):
+    """
+    Start of the hour from which `cube` is complete, or None if it never ran.
+    """
+    return get_checkpoint(f'{CUBE_COVERAGE_PREFIX}{cube}', None)
+
+
+def extend_cube_coverage(start, cubes=None):
+    """
+    Record that the cubes hold every hour from `start` on.
+
+    Coverage only ever moves back, e.g. after rebuild_aggregates
+    recomputed the hours from `start` up to now.
+
+    Args:
+        start (datetime): Aware datetime aligned to the hour
+        cubes (iterable, optional): Cube names, all configured cubes by default
+    """
+    for cube in get_cubes() if cubes is None else cubes:
+        covered_from = cube_covered_from(cube)
+        if covered_from is None or start < covered_from:
+            set_checkpoint(f'{CUBE_COVERAGE_PREFIX}{cube}', start)
+
+
+def aggregate_cube_events():
+    """
+    Bring the cubes up to date with events created since the last run.
+
+    Completed days get their daily rows rebuilt: days touched by
+    late-arriving events and days that ended since the previous run.
+
+    Returns:
+        dict: Summary of the run
+    """
+    now = timezone.now()
+    until = now - timedelta(seconds=get_tracking_setting('AGGREGATION_LAG_SECONDS', 60))
+    default_since = (now - HOUR).replace(minute=0, second=0, microsecond=0)
+    since = get_checkpoint(CUBE_CHECKPOINT, default_since)
+    if until <= since:
+        return {'hours': 0, 'rows': 0, 'days': 0}
+
+    hours = find_dirty_hours(since, until)
+    rows = aggregate_cube_hours(hours)
+
+    today = timezone.localdate(now)
+    ended_days = {hour.date() for hour in hours if hour.date() < today}
+    day = timezone.localdate(since)
+    while day < today:
+        ended_days.add(day)
+        day += timedelta(days=1)
+    days = rollup_cube_days(ended_days) if ended_days else 0
+
+    # Cubes new to this run hold no hours before it; a cube that was removed
+    # has to start over if it is configured again
+    cubes = get_cubes()
+    AggregationCheckpoint.objects.filter(name__startswith=CUBE_COVERAGE_PREFIX).exclude(
+        name__in=[f'{CUBE_COVERAGE_PREFIX}{cube}' for cube in cubes]
+    ).delete()
+    extend_cube_coverage(hour_ceil(since), [cube for cube in cubes if cube_covered_from(cube) is None])
+
+    set_checkpoint(CUBE_CHECKPOINT, until)
+    if hours:
+        logger.info(f"Aggregated {len(hours)} hours ({rows} cube rows) from events created up to {until}")
+    return {'hours': len(hours), 'rows': rows, 'days': days}
+
+
+def _cube_counts(cube, dimensions, filters, start, end):
+    """
+    Counts per dimension values from a cube over hour-aligned [start, end).
+    """
+    start = timezone.localtime(start)
+    end = timezone.localtime(end)
+    rows = RollupCubeRow.objects.filter(cube=cube, **filters)
+
+    counts = Counter()
+    first_full_day = start.date() if start.time() == time.min else start.date() + timedelta(days=1)
+    daily = rows.filter(hour__isnull=True, date__gte=first_full_day, date__lt=end.date())
+    covered_days = set(daily.values_list('date', flat=True).distinct())
+    hourly = hourly_rows_between(start, end, rows).exclude(date__in=covered_days)
+    for part in (daily, hourly):
+        for *values, total in part.values_list(*dimensions).annotate(total=Sum('count')):
+            counts[tuple(values)] += total
+    return counts
+
+
+def _raw_counts(dimensions, filters, start, end):
+    events = Event.objects.filter(
+        timestamp__gte=start, timestamp__lt=end,
+        **{DIMENSIONS[name]: value for name, value in filters.items()}
+    )
+    return Counter({
+        tuple(values): count for *values, count in
+        events.values_list(*(DIMENSIONS[name] for name in dimensions)).annotate(count=Count('id'))
+    })
+
+
+def breakdown(dimensions, start, end, filters=None, limit=None):
+    """
+    Count events in [start, end) grouped by the given dimensions.
+
+    Whole hours between the cube's coverage start and its watermark are
+    read from the smallest cube that has every grouped and filtered
+    dimension; the unaligned edges of the range, the hours before the
+    cube was complete and the tail after the watermark are counted from
+    raw events. Without a suitable cube the whole range is counted raw.
+
+    Args:
+        dimensions (list): Names from DIMENSIONS to group by
+        start (datetime): Range start (aware)
+        end (datetime): Range end, exclusive (aware)
+        filters (dict, optional): Dimension values to restrict to,
+            e.g. {'event_type': 'purchase'}
+        limit (int, optional): Only return the largest groups
+
+    Returns:
+        list: [{<dimension>: value, ..., 'count': ...}] ordered by descending count
+    """
+    if not dimensions:
+        raise ValueError("At least one dimension is required")
+    filters = filters or {}
+    unknown = (set(dimensions) | set(filters)) - set(DIMENSIONS)
+    if unknown:
+        raise ValueError(f"Unknown dimensions: {', '.join(sorted(unknown))}")
+
+    cube = choose_cube(set(dimensions) | set(filters))
+    covered_from = cube_covered_from(cube) if cube else None
+    watermark = cube_aggregated_until() if covered_from else None
+    counts = Counter()
+    aggregated_from = max(hour_ceil(start), covered_from) if covered_from else hour_ceil(start)
+    aggregated_to = min(hour_floor(end), watermark) if watermark else aggregated_from
+    if aggregated_from < aggregated_to:
+        counts.update(_raw_counts(dimensions, filters, start, aggregated_from))
+        counts.update(_cube_counts(cube, dimensions, filters, aggregated_from, aggregated_to))
+        counts.update(_raw_counts(dimensions, filters, aggregated_to, end))
+    else:
+        counts.update(_raw_counts(dimensions, filters, start, end))
+
+    return [
+        {**dict(zip(dimensions, values)), 'count': count}
+        for values, count in counts.most_common(limit) if count
+    ]
@@ -22,6 +22,23 @@ def cleanup_old_events():
         return f"Error during cleanup: {str(e)}"
 
 
+@shared_task
+def create_event_partitions():
+    """
+    Create upcoming analytics_event partitions ahead of time.
+    
+    This task is scheduled to run daily; it does nothing until the table has
+    been converted with `manage.py partition_events --convert`.
+    """
+    logger.info("Creating upcoming event partitions")
+    try:
+        management.call_command('partition_events')
+        return "Event partitions are up to date"
+    except Exception as e:
+        logger.error(f"Error creating event partitions: {str(e)}")
+        return f"Error creating partitions: {str(e)}"
+
+
 @shared_task
 def generate_daily_report():
     """
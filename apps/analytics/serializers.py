@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import Event, Session, FeatureFlag, EventAggregate, DeviceInfo, LocationInfo
-from .utils import create_event, create_session
+from .utils import create_event, create_session, bulk_create_events, get_client_ip
+from .validation import json_text_error
 
 
 class DeviceInfoSerializer(serializers.ModelSerializer):
@@ -26,7 +27,41 @@ class LocationInfoSerializer(serializers.ModelSerializer):
         ]
 
 
-class EventSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Limit the serialized fields to those named in the `fields` query parameter.
+    
+    Unknown names are ignored; without the parameter every field is returned.
+    """
+    
+    @property
+    def requested_fields(self):
+        request = self.context.get('request')
+        value = request.query_params.get('fields') if request else None
+        if not value:
+            return None
+        return {name.strip() for name in value.split(',') if name.strip()}
+    
+    def to_representation(self, instance):
+        # Computed once per serializer, not once per row of a list
+        if not hasattr(self, '_sparse_fields'):
+            requested = self.requested_fields
+            self._sparse_fields = None
+            if requested:
+                self._sparse_fields = [
+                    field for field in self._readable_fields if field.field_name in requested
+                ]
+        if self._sparse_fields is None:
+            return super().to_representation(instance)
+        
+        ret = {}
+        for field in self._sparse_fields:
+            attribute = field.get_attribute(instance)
+            ret[field.field_name] = None if attribute is None else field.to_representation(attribute)
+        return ret
+
+
+class EventSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for individual events.
     """
@@ -34,6 +69,9 @@ class EventSerializer(serializers.ModelSerializer):
     device_info = DeviceInfoSerializer(source='device', read_only=True)
     location_info = LocationInfoSerializer(source='location', read_only=True)
     
+    # Optional client-generated id used to de-duplicate SDK retries
+    event_id = serializers.UUIDField(required=False, write_only=True)
+    
     # These fields are for write operations to maintain API compatibility
     device_id = serializers.CharField(write_only=True)
     app_version = serializers.CharField(write_only=True)
@@ -50,7 +88,7 @@ class EventSerializer(serializers.ModelSerializer):
     class Meta:
         model = Event
         fields = [
-            'id', 'distinct_id', 'event_type', 'properties', 
+            'id', 'event_id', 'distinct_id', 'event_type', 'properties', 
             'timestamp', 'latitude', 'longitude', 'app_check_result',
             # Write-only fields for backward compatibility
             'device_id', 'app_version', 'os_name', 'os_version',
@@ -61,15 +99,18 @@ class EventSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at', 'processed', 'device_info', 'location_info']
     
+    def validate_properties(self, value):
+        # jsonb cannot store NUL, which JSON allows as \u0000
+        error = json_text_error(value)
+        if error:
+            raise serializers.ValidationError(error)
+        return value
+    
     def create(self, validated_data):
         # Get the client IP from the request if available
         request = self.context.get('request')
         if request and not validated_data.get('ip_address'):
-            x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-            if x_forwarded_for:
-                validated_data['ip_address'] = x_forwarded_for.split(',')[0]
-            else:
-                validated_data['ip_address'] = request.META.get('REMOTE_ADDR')
+            validated_data['ip_address'] = get_client_ip(request)
         
         # Use our utility function to create the event
         return create_event(validated_data)
@@ -86,11 +127,8 @@ class BatchEventSerializer(serializers.Serializer):
     )
     
     def create(self, validated_data):
-        events = []
-        for event_data in validated_data['batch']:
-            # Process each event in the batch using our utility
-            event = create_event(event_data)
-            events.append(event)
+        # Resolve dimensions and insert the whole batch in a few queries
+        events = bulk_create_events(validated_data['batch'])
         
         return {'events': events}
 
@@ -135,11 +173,7 @@ class SessionSerializer(serializers.ModelSerializer):
         # Get the client IP from the request if available
         request = self.context.get('request')
         if request and not validated_data.get('ip_address'):
-            x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-            if x_forwarded_for:
-                validated_data['ip_address'] = x_forwarded_for.split(',')[0]
-            else:
-                validated_data['ip_address'] = request.META.get('REMOTE_ADDR')
+            validated_data['ip_address'] = get_client_ip(request)
         
         # Use our utility function to create the session
         return create_session(validated_data)
@@ -0,0 +1,233 @@
+"""
+Daily session rollups in SessionAggregate.
+
+Sessions are counted once, when they end: close_inactive_sessions and the
+session end API pass the sessions they just ended to record_ended_sessions
+inside the same transaction, so a session is added to the row of its
+start date, OS and app version exactly once. Durations and events per
+session are stored as histograms over fixed buckets; rows for any range
+of days and devices are merged by adding the buckets, and percentiles are
+estimated from the merged histogram (see summarize_sessions).
+
+rebuild_session_aggregates recomputes whole days from the Session table,
+for backfilling sessions that ended before the rollup existed.
+"""
+import logging
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .aggregation import bump_aggregates_version
+from .models import Session, SessionAggregate
+
+logger = logging.getLogger(__name__)
+
+# Lower bounds of the histogram buckets; the last bucket is open-ended
+DURATION_BUCKETS = (  # seconds
+    0, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 240, 300, 420, 600, 900,
+    1200, 1800, 2700, 3600, 5400, 7200, 10800, 14400, 21600,
+)
+EVENT_BUCKETS = (0, 1, 2, 3, 4, 5, 7, 10, 15, 20, 30, 50, 75, 100, 150, 200, 300, 500, 1000)
+
+SESSION_FIELDS = ('start_time', 'duration', 'events_count', 'device__os_name', 'device__app_version')
+
+
+def bucket_for(value, buckets):
+    """
+    Histogram key of the bucket `value` falls in.
+    """
+    return str(buckets[max(bisect_right(buckets, value) - 1, 0)])
+
+
+class SessionRollup:
+    """
+    Running totals for one (date, os_name, app_version) row.
+    """
+
+    def __init__(self):
+        self.sessions = 0
+        self.total_duration = timedelta()
+        self.total_events = 0
+        self.duration_histogram = Counter()
+        self.events_histogram = Counter()
+
+    def add(self, duration, events_count):
+        duration = duration or timedelta()
+        self.sessions += 1
+        self.total_duration += duration
+        self.total_events += events_count
+        self.duration_histogram[bucket_for(duration.total_seconds(), DURATION_BUCKETS)] += 1
+        self.events_histogram[bucket_for(events_count, EVENT_BUCKETS)] += 1
+
+    def merge_into(self, aggregate):
+        aggregate.sessions += self.sessions
+        aggregate.total_duration += self.total_duration
+        aggregate.total_events += self.total_events
+        aggregate.duration_histogram = dict(Counter(aggregate.duration_histogram) + self.duration_histogram)
+        aggregate.events_histogram = dict(Counter(aggregate.events_histogram) + self.events_histogram)
+
+
+def rollup_sessions(rows):
+    """
+    Group ended sessions by their aggregate row.
+
+    Args:
+        rows (iterable): Tuples of SESSION_FIELDS
+
+    Returns:
+        dict: SessionRollup per (date, os_name, app_version)
+    """
+    rollups = defaultdict(SessionRollup)
+    for start_time, duration, events_count, os_name, app_version in rows:
+        key = (timezone.localdate(start_time), os_name or '', app_version or '')
+        rollups[key].add(duration, events_count)
+    return rollups
+
+
+def record_ended_sessions(session_ids):
+    """
+    Add sessions that were just ended to their SessionAggregate rows.
+
+    Must run in the transaction that ended the sessions, so that a
+    session is recorded if and only if its end is committed.
+
+    Args:
+        session_ids (list): Primary keys of the sessions
+
+    Returns:
+        int: Number of aggregate rows updated
+    """
+    if not session_ids:
+        return 0
+    rollups = rollup_sessions(
+        Session.objects.filter(pk__in=session_ids, end_time__isnull=False).values_list(*SESSION_FIELDS)
+    )
+    if not rollups:
+        return 0
+
+    with transaction.atomic():
+        # Make sure every row exists, then update them under row locks
+        SessionAggregate.objects.bulk_create([
+            SessionAggregate(date=date, os_name=os_name, app_version=app_version)
+            for date, os_name, app_version in rollups
+        ], ignore_conflicts=True)
+        dates = {date for date, _, _ in rollups}
+        aggregates = [
+            aggregate for aggregate in
+            # Locked in a fixed order so concurrent writers cannot deadlock
+            SessionAggregate.objects.select_for_update().filter(date__in=dates).order_by('pk')
+            if (aggregate.date, aggregate.os_name, aggregate.app_version) in rollups
+        ]
+        for aggregate in aggregates:
+            rollups[(aggregate.date, aggregate.os_name, aggregate.app_version)].merge_into(aggregate)
+        SessionAggregate.objects.bulk_update(aggregates, [
+            'sessions', 'total_duration', 'total_events', 'duration_histogram', 'events_histogram',
+        ])
+        transaction.on_commit(bump_aggregates_version)
+    return len(aggregates)
+
+
+def rebuild_session_aggregates(dates):
+    """
+    Recompute the SessionAggregate rows of the given dates from the Session table.
+
+    Sessions ending while a day is rebuilt may be missed or counted twice,
+    so this is meant for backfills rather than routine use.
+
+    Returns:
+        int: Number of aggregate rows written
+    """
+    written = 0
+    for date in sorted(set(dates)):
+        day_start = timezone.make_aware(datetime.combine(date, time.min))
+        rows = Session.objects.filter(
+            start_time__gte=day_start,
+            start_time__lt=day_start + timedelta(days=1),
+            end_time__isnull=False,
+        ).order_by().values_list(*SESSION_FIELDS)
+        rollups = rollup_sessions(rows.iterator(chunk_size=10000))
+
+        aggregates = []
+        for (day, os_name, app_version), rollup in rollups.items():
+            aggregate = SessionAggregate(date=day, os_name=os_name, app_version=app_version)
+            rollup.merge_into(aggregate)
+            aggregates.append(aggregate)
+        with transaction.atomic():
+            SessionAggregate.objects.filter(date=date).delete()
+            SessionAggregate.objects.bulk_create(aggregates)
+        written += len(aggregates)
+    if dates:
+        bump_aggregates_version()
+    return written
+
+
+def histogram_percentile(histogram, fraction, buckets):
+    """
+    Estimate a percentile from a bucketed histogram.
+
+    Values are assumed to be spread evenly within a bucket; the open-ended
+    last bucket reports its lower bound.
+
+    Args:
+        histogram (dict): Count per bucket lower bound (as a string)
+        fraction (float): Percentile as a fraction, e.g. 0.9
+        buckets (tuple): Bucket lower bounds the histogram was built with
+
+    Returns:
+        float: Estimated value, or None for an empty histogram
+    """
+    total = sum(histogram.values())
+    if not total:
+        return None
+    rank = fraction * total
+    seen = 0
+    for index, lower in enumerate(buckets):
+        count = histogram.get(str(lower), 0)
+        if count and seen + count >= rank:
+            if index + 1 == len(buckets):
+                return lower
+            return lower + (buckets[index + 1] - lower) * (rank - seen) / count
+        seen += count
+    return buckets[-1]
+
+
+def summarize_sessions(aggregates):
+    """
+    Session KPIs over a set of SessionAggregate rows.
+
+    Args:
+        aggregates (QuerySet): SessionAggregate rows to merge
+
+    Returns:
+        dict: Session count, average and p50/p90/p99 durations (timedelta),
+        and events per session over sessions that had events
+    """
+    sessions = 0
+    total_duration = timedelta()
+    total_events = 0
+    durations = Counter()
+    events = Counter()
+    for row in aggregates.values_list(
+        'sessions', 'total_duration', 'total_events', 'duration_histogram', 'events_histogram'
+    ):
+        sessions += row[0]
+        total_duration += row[1]
+        total_events += row[2]
+        durations.update(row[3])
+        events.update(row[4])
+
+    summary = {
+        'sessions': sessions,
+        'avg_duration': total_duration / sessions if sessions else None,
+    }
+    for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+        seconds = histogram_percentile(durations, fraction, DURATION_BUCKETS)
+        summary[f'{name}_duration'] = timedelta(seconds=seconds) if seconds is not None else None
+    # Like the former Avg over Session, sessions without events are left out
+    with_events = sessions - events.get('0', 0)
+    summary['events_per_session'] = total_events / with_events if with_events else 0
+    summary['p90_events'] = histogram_percentile(events, 0.9, EVENT_BUCKETS)
+    return summary
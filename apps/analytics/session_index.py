@@ -0,0 +1,318 @@
+"""
+Redis index of open sessions for attributing events at ingest time.
+
+A single hash maps (distinct_id, device_id) to the newest open session of
+that pair as "<session id>|<start epoch>|<last activity epoch>". Ingestion
+resolves the session of every event in a batch with one HMGET instead of
+querying Session, and advances the last activity with one script call.
+
+The index is kept in step with the Session table by:
+
+* the post_save/post_delete receivers below (session start and end API,
+  admin edits);
+* explicit calls for bulk writes that skip signals: sessions created by
+  process_pending_events and sessions ended by close_inactive_sessions;
+* a full rebuild from the open sessions whenever the warm marker is
+  missing, i.e. after a Redis restart or flush and every
+  SESSION_INDEX_REBUILD_SECONDS to repair any drift.
+
+Until the index has been warmed, lookups report it as cold and callers
+query the database instead. A missing entry in a warm index means "no
+open session"; events that get no session at ingest are still attached
+by process_pending_events, so a stale index never loses attribution.
+"""
+import logging
+import uuid
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from .models import Session
+
+logger = logging.getLogger(__name__)
+
+INDEX_KEY = 'analytics:sessions:open'
+BUILDING_KEY = 'analytics:sessions:open:building'
+# "<field>|<session id>" of the sessions removed while a rebuild runs
+REMOVED_KEY = 'analytics:sessions:open:building:removed'
+WARM_KEY = 'analytics:sessions:open:warm'
+REBUILD_BATCH_SIZE = 5000
+
+# ARGV holds (field, value) pairs. While a rebuild is running, changes are
+# also applied to the hash being built so the swap does not lose them.
+REGISTER_SCRIPT = """
+local building = redis.call('EXISTS', KEYS[2]) == 1
+for i = 1, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+    if building then
+        redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 1])
+    end
+end
+return 0
+"""
+
+# ARGV holds (field, session id) pairs; an entry is only removed if it
+# still names that session. While a rebuild is running the removal is
+# also remembered, so the rebuild does not write the session back.
+REMOVE_SCRIPT = """
+local building = redis.call('EXISTS', KEYS[2]) == 1
+local removed = 0
+for i = 1, #ARGV, 2 do
+    for k = 1, 2 do
+        local current = redis.call('HGET', KEYS[k], ARGV[i])
+        if current and string.match(current, '^([^|]+)|') == ARGV[i + 1] then
+            removed = removed + redis.call('HDEL', KEYS[k], ARGV[i])
+        end
+    end
+    if building then
+        redis.call('SADD', KEYS[3], ARGV[i] .. '|' .. ARGV[i + 1])
+    end
+end
+return removed
+"""
+
+# Writes rows read by a rebuild into the hash being built. ARGV holds
+# (field, value) pairs, newest session first. Fields the REGISTER script
+# already set during the rebuild are newer than the rows read from the
+# database and are kept, like fields set earlier in the same rebuild;
+# sessions removed during the rebuild are skipped.
+MERGE_SCRIPT = """
+local written = 0
+for i = 1, #ARGV, 2 do
+    local id = string.match(ARGV[i + 1], '^([^|]+)|')
+    if redis.call('SISMEMBER', KEYS[2], ARGV[i] .. '|' .. id) == 0 then
+        written = written + redis.call('HSETNX', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+end
+return written
+"""
+
+# Replace the index with the rebuilt hash and mark it warm for ARGV[1] seconds
+SWAP_SCRIPT = """
+redis.call('DEL', KEYS[4])
+redis.call('HDEL', KEYS[1], '')
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('PERSIST', KEYS[1])
+    redis.call('RENAME', KEYS[1], KEYS[2])
+else
+    redis.call('DEL', KEYS[2])
+end
+redis.call('SET', KEYS[3], 1, 'EX', ARGV[1])
+return 0
+"""
+
+# ARGV holds (field, session id, activity epoch) triples; the activity of
+# an entry only moves forward and only for the session it names. Applied
+# to the index and to the hash being built, if any.
+TOUCH_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    for i = 1, #ARGV, 3 do
+        local current = redis.call('HGET', key, ARGV[i])
+        if current then
+            local id, start, last = string.match(current, '^([^|]+)|([^|]+)|([^|]+)$')
+            if id == ARGV[i + 1] and tonumber(ARGV[i + 2]) > tonumber(last) then
+                redis.call('HSET', key, ARGV[i], id .. '|' .. start .. '|' .. ARGV[i + 2])
+            end
+        end
+    end
+end
+return 0
+"""
+
+
+def _setting(key, default):
+    # Imported lazily to keep this module free of a utils import cycle
+    from .utils import get_tracking_setting
+    return get_tracking_setting(key, default)
+
+
+def _field(distinct_id, device_id):
+    return f'{distinct_id}\x1f{device_id}'
+
+
+def _encode(session_id, start_time, last_event_at):
+    last_event_at = last_event_at or start_time
+    return f'{session_id}|{start_time.timestamp()}|{last_event_at.timestamp()}'
+
+
+def _decode(raw):
+    session_id, start, _ = raw.decode().split('|')
+    return uuid.UUID(session_id), datetime.fromtimestamp(float(start), tz=dt_timezone.utc)
+
+
+def lookup_open_sessions(keys):
+    """
+    Find the open session of each (distinct_id, device_id) pair.
+
+    Args:
+        keys (iterable): (distinct_id, device_id) pairs
+
+    Returns:
+        dict or None: Mapping of pair to (session id, start time) for the
+            pairs with an open session, or None while the index is cold
+
+    Raises:
+        RedisError: If Redis is unavailable
+    """
+    keys = list(keys)
+    conn = get_redis_connection('default')
+    pipe = conn.pipeline(transaction=False)
+    pipe.exists(WARM_KEY)
+    pipe.hmget(INDEX_KEY, [_field(*key) for key in keys] or ['-'])
+    warm, values = pipe.execute()
+    if not warm:
+        return None
+    return {key: _decode(value) for key, value in zip(keys, values) if value}
+
+
+def register_sessions(sessions):
+    """
+    Make sessions the open session of their (distinct_id, device_id) pair.
+
+    Args:
+        sessions (iterable): Session instances; closed sessions and
+            sessions without a device are ignored
+    """
+    args = []
+    for session in sessions:
+        if session.device_id and session.end_time is None:
+            args.extend([
+                _field(session.distinct_id, session.device_id),
+                _encode(session.pk, session.start_time, session.last_event_at),
+            ])
+    if args:
+        conn = get_redis_connection('default')
+        conn.register_script(REGISTER_SCRIPT)(keys=[INDEX_KEY, BUILDING_KEY], args=args)
+
+
+def unregister_sessions(sessions):
+    """
+    Drop the index entries that still point at these sessions.
+
+    Args:
+        sessions (iterable): Session instances with distinct_id and device_id
+    """
+    args = []
+    for session in sessions:
+        if session.device_id:
+            args.extend([_field(session.distinct_id, session.device_id), str(session.pk)])
+    if args:
+        conn = get_redis_connection('default')
+        conn.register_script(REMOVE_SCRIPT)(keys=[INDEX_KEY, BUILDING_KEY, REMOVED_KEY], args=args)
+
+
+def touch_sessions(activity):
+    """
+    Advance the last activity of indexed sessions.
+
+    Args:
+        activity (dict): Mapping of (distinct_id, device_id) to
+            (session id, latest event timestamp)
+    """
+    args = []
+    for (distinct_id, device_id), (session_id, last_event_at) in activity.items():
+        args.extend([_field(distinct_id, device_id), str(session_id), last_event_at.timestamp()])
+    if args:
+        conn = get_redis_connection('default')
+        conn.register_script(TOUCH_SCRIPT)(keys=[INDEX_KEY, BUILDING_KEY], args=args)
+
+
+def update_on_commit(func, payload):
+    """
+    Apply an index update once the current transaction commits.
+
+    Errors are logged rather than raised; the periodic rebuild repairs
+    the index.
+    """
+    def apply():
+        try:
+            func(payload)
+        except RedisError as e:
+            logger.warning(f"Could not update the open session index: {e}")
+    transaction.on_commit(apply)
+
+
+def open_session_rows():
+    """
+    Open sessions with a device, newest first, read with a server-side cursor.
+
+    Returns:
+        iterator: (distinct_id, device_id, id, start_time, last_event_at) tuples
+    """
+    return Session.objects.filter(end_time__isnull=True, device__isnull=False) \
+        .order_by('-start_time') \
+        .values_list('distinct_id', 'device_id', 'id', 'start_time', 'last_event_at') \
+        .iterator(chunk_size=REBUILD_BATCH_SIZE)
+
+
+def rebuild():
+    """
+    Load every open session into a fresh index and mark it warm.
+
+    The new hash is built under BUILDING_KEY and swapped in with RENAME,
+    so lookups never see a partial index. Sessions started or ended while
+    the rebuild runs are written to both hashes by the scripts above, and
+    MERGE_SCRIPT never lets the rows read from the database override them.
+
+    Returns:
+        int: Number of open sessions indexed
+    """
+    conn = get_redis_connection('default')
+    rebuild_seconds = _setting('SESSION_INDEX_REBUILD_SECONDS', 3600)
+    # Placeholder members make both keys exist from the start; the expiry
+    # cleans up after a rebuild that dies halfway
+    pipe = conn.pipeline()
+    pipe.delete(BUILDING_KEY, REMOVED_KEY)
+    pipe.hset(BUILDING_KEY, '', '')
+    pipe.sadd(REMOVED_KEY, '')
+    pipe.expire(BUILDING_KEY, rebuild_seconds)
+    pipe.expire(REMOVED_KEY, rebuild_seconds)
+    pipe.execute()
+
+    merge = conn.register_script(MERGE_SCRIPT)
+    count = 0
+    args = []
+    # Newest first, so the newest open session of a pair is the one kept
+    for distinct_id, device_id, session_id, start_time, last_event_at in open_session_rows():
+        args.extend([_field(distinct_id, device_id), _encode(session_id, start_time, last_event_at)])
+        count += 1
+        if len(args) >= 2 * REBUILD_BATCH_SIZE:
+            merge(keys=[BUILDING_KEY, REMOVED_KEY], args=args)
+            args = []
+    if args:
+        merge(keys=[BUILDING_KEY, REMOVED_KEY], args=args)
+
+    conn.register_script(SWAP_SCRIPT)(
+        keys=[BUILDING_KEY, INDEX_KEY, WARM_KEY, REMOVED_KEY], args=[rebuild_seconds]
+    )
+    logger.info(f"Rebuilt the open session index with {count} sessions")
+    return count
+
+
+def ensure_warm():
+    """
+    Rebuild the index if it is cold or due for its periodic rebuild.
+
+    Returns:
+        int or None: Number of sessions indexed, or None if the index was warm
+    """
+    if get_redis_connection('default').exists(WARM_KEY):
+        return None
+    return rebuild()
+
+
+@receiver(post_save, sender=Session)
+def index_saved_session(sender, instance, **kwargs):
+    if instance.end_time is None:
+        update_on_commit(register_sessions, [instance])
+    else:
+        update_on_commit(unregister_sessions, [instance])
+
+
+@receiver(post_delete, sender=Session)
+def unindex_deleted_session(sender, instance, **kwargs):
+    update_on_commit(unregister_sessions, [instance])
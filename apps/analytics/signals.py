@@ -1,9 +1,11 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 
-from .models import Event
+from .feature_flags import invalidate_snapshot
+from .models import Event, FeatureFlag
 from .utils import create_event
 
 User = get_user_model()
@@ -58,4 +60,12 @@ def track_user_events(sender, instance, created, **kwargs):
                 'os_name': 'system',
                 'os_version': '1.0',
                 'user': instance,
-            }) 
\ No newline at end of file
+            }) 
+
+
+@receiver([post_save, post_delete], sender=FeatureFlag)
+def invalidate_feature_flags(sender, instance, **kwargs):
+    """
+    Make every process reload its feature flag snapshot once the change commits.
+    """
+    transaction.on_commit(invalidate_snapshot)
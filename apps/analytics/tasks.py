@@ -1,149 +1,263 @@
 import logging
+import time as time_module
+from collections import defaultdict
 from datetime import datetime, time, timedelta
-from django.db import transaction
-from django.db.models import Count
+from django.db import connection, transaction
+from django.db.models import (
+    Case, Count, DateTimeField, DurationField, ExpressionWrapper, F, Q, UUIDField, Value, When
+)
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from celery import shared_task
 
-from .models import Event, Session, EventAggregate
+from . import session_index
+from .aggregation import aggregate_new_events, rollup_days
+from .session_aggregation import record_ended_sessions
+from .models import Event, Session
+from .rollup_cube import aggregate_cube_events, rollup_cube_days
+from .utils import get_tracking_setting, record_session_activity
 
 logger = logging.getLogger(__name__)
 
 
+# Open sessions older than this are never extended by new events
+SESSION_REUSE_WINDOW = timedelta(hours=6)
+
+# Columns the processor needs; avoids loading the properties payload
+PROCESSING_FIELDS = (
+    'id', 'distinct_id', 'device_id', 'session_id', 'timestamp',
+    'location_id', 'latitude', 'longitude', 'app_check_result', 'user_id',
+)
+
+
 @shared_task
 def process_event(event_id):
     """
     Process a single event.
     
-    This task:
-    1. Updates session data
-    2. Identifies the user if possible
-    3. Marks the event as processed
-    """
-    try:
-        event = Event.objects.select_for_update().get(id=event_id)
-        
-        if event.processed:
-            logger.info(f"Event {event_id} already processed, skipping")
-            return True
-            
-        with transaction.atomic():
-            # Find or create a session for this event
-            update_session_for_event(event)
-            
-            # Mark as processed
-            event.processed = True
-            event.save(update_fields=['processed'])
-            
-        return True
-    except Event.DoesNotExist:
-        logger.error(f"Event with ID {event_id} not found")
-        return False
-    except Exception as e:
-        logger.exception(f"Error processing event {event_id}: {str(e)}")
-        return False
+    Kept for messages queued before process_pending_events replaced
+    per-event fan-out.
+    """
+    return process_event_batch([event_id])['success_count'] == 1
 
 
 @shared_task
 def process_event_batch(event_ids):
     """
-    Process a batch of events.
+    Process a specific batch of events.
     """
     logger.info(f"Processing batch of {len(event_ids)} events")
-    success_count = 0
-    error_count = 0
+    with transaction.atomic():
+        events = claim_unprocessed_events(len(event_ids), id__in=event_ids)
+        process_event_chunk(events)
     
-    for event_id in event_ids:
-        result = process_event(event_id)
-        if result:
-            success_count += 1
-        else:
-            error_count += 1
-    
-    logger.info(f"Batch processing completed: {success_count} succeeded, {error_count} failed")
     return {
-        'success_count': success_count,
-        'error_count': error_count
+        'success_count': len(events),
+        'error_count': len(event_ids) - len(events)
+    }
+
+
+@shared_task
+def process_pending_events(chunk_size=1000, max_chunks=50):
+    """
+    Process unprocessed events in chunks.
+    
+    Each chunk is claimed with SELECT ... FOR UPDATE SKIP LOCKED, so
+    several workers can run this task concurrently without picking the
+    same rows. This task is scheduled every few seconds and replaces the
+    per-event process_event fan-out.
+    """
+    started = time_module.monotonic()
+    processed = 0
+    chunks = 0
+    
+    while chunks < max_chunks:
+        with transaction.atomic():
+            events = claim_unprocessed_events(chunk_size)
+            if not events:
+                break
+            process_event_chunk(events)
+        processed += len(events)
+        chunks += 1
+    
+    elapsed = time_module.monotonic() - started
+    metrics = {
+        'processed': processed,
+        'chunks': chunks,
+        'seconds': round(elapsed, 3),
+        'events_per_second': round(processed / elapsed, 1) if elapsed else 0.0,
     }
+    if processed:
+        logger.info(
+            f"Processed {processed} events in {chunks} chunks "
+            f"({metrics['events_per_second']} events/s)"
+        )
+    return metrics
 
 
-def update_session_for_event(event):
+def claim_unprocessed_events(limit, **filters):
     """
-    Update or create a session for the given event.
+    Lock and return up to `limit` unprocessed events.
+    
+    Must be called inside a transaction. Rows locked by another worker
+    are skipped rather than waited on.
     """
-    # Try to find a recent session for this user
-    recent_session = Session.objects.filter(
-        distinct_id=event.distinct_id,
-        device_id=event.device_id,
+    return list(
+        Event.objects.select_for_update(skip_locked=True)
+        .filter(processed=False, **filters)
+        .only(*PROCESSING_FIELDS)
+        .order_by('timestamp')[:limit]
+    )
+
+
+def process_event_chunk(events):
+    """
+    Attach a chunk of claimed events to sessions and mark them processed.
+    
+    Events that already have a session were counted at ingestion time.
+    The others are grouped by (distinct_id, device) and attached to the
+    latest open session of that pair, or to a new session starting at the
+    group's first event. Session counters are then written in bulk and the
+    whole chunk is marked processed with a single UPDATE.
+    """
+    if not events:
+        return
+    
+    groups = defaultdict(list)
+    for event in events:
+        if event.session_id is None and event.device_id:
+            groups[(event.distinct_id, event.device_id)].append(event)
+    
+    sessions = find_open_sessions(groups.keys())
+    missing = sorted(key for key in groups if key not in sessions)
+    if missing:
+        # Serialize session creation per (distinct_id, device) across workers,
+        # then re-check in case another worker created it meanwhile
+        lock_session_keys(missing)
+        sessions.update(find_open_sessions(missing))
+        new_sessions = []
+        for key in missing:
+            if key in sessions:
+                continue
+            first = groups[key][0]
+            sessions[key] = Session(
+                distinct_id=first.distinct_id,
+                device_id=first.device_id,
+                start_time=first.timestamp,
+                location_id=first.location_id,
+                latitude=first.latitude,
+                longitude=first.longitude,
+                app_check_result=first.app_check_result,
+                user_id=first.user_id,
+                last_event_at=first.timestamp,
+            )
+            new_sessions.append(sessions[key])
+        Session.objects.bulk_create(new_sessions)
+        # bulk_create sends no post_save, so index the new sessions here
+        session_index.update_on_commit(session_index.register_sessions, new_sessions)
+    
+    session_activity = {}
+    indexed_activity = {}
+    assignments = []
+    for key, group in groups.items():
+        session_id = sessions[key].id
+        last_event_at = max(event.timestamp for event in group)
+        session_activity[session_id] = (len(group), last_event_at)
+        indexed_activity[key] = (session_id, last_event_at)
+        assignments.append(When(id__in=[event.id for event in group], then=Value(session_id)))
+    record_session_activity(session_activity)
+    if indexed_activity:
+        session_index.update_on_commit(session_index.touch_sessions, indexed_activity)
+    
+    # The whole chunk in one statement; events that needed no session keep theirs
+    updates = {'processed': True}
+    if assignments:
+        updates['session_id'] = Case(*assignments, default=F('session_id'), output_field=UUIDField())
+    Event.objects.filter(id__in=[event.id for event in events]).update(**updates)
+
+
+def find_open_sessions(keys):
+    """
+    Return the latest recent open session for each (distinct_id, device_id) pair.
+    """
+    keys = set(keys)
+    if not keys:
+        return {}
+    
+    candidates = Session.objects.filter(
+        distinct_id__in={distinct_id for distinct_id, _ in keys},
+        device_id__in={device_id for _, device_id in keys},
         end_time__isnull=True,  # Session is still open
-        start_time__gt=timezone.now() - timedelta(hours=6)  # Within 6 hours
-    ).order_by('-start_time').first()
-    
-    if recent_session:
-        # Update existing session
-        recent_session.events_count += 1
-        recent_session.save(update_fields=['events_count'])
-    else:
-        # Create a new session
-        Session.objects.create(
-            distinct_id=event.distinct_id,
-            device_id=event.device_id,
-            start_time=event.timestamp,
-            events_count=1,
-            app_version=event.app_version,
-            os_name=event.os_name,
-            os_version=event.os_version,
-            is_simulator=event.is_simulator,
-            is_rooted_device=event.is_rooted_device,
-            is_vpn_enabled=event.is_vpn_enabled,
-            latitude=event.latitude,
-            longitude=event.longitude,
-            ip_address=event.ip_address,
-            city=event.city,
-            country=event.country,
-            continent=event.continent,
-            user=event.user
+        start_time__gt=timezone.now() - SESSION_REUSE_WINDOW,
+    ).only('id', 'distinct_id', 'device_id').order_by('start_time')
+    
+    # Later rows overwrite earlier ones, leaving the newest session per key
+    return {
+        (session.distinct_id, session.device_id): session
+        for session in candidates
+        if (session.distinct_id, session.device_id) in keys
+    }
+
+
+def lock_session_keys(keys):
+    """
+    Take transaction-scoped advisory locks for (distinct_id, device_id) pairs.
+    
+    Keys are locked in sorted order so concurrent workers cannot deadlock.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_advisory_xact_lock(hashtext(k)) FROM unnest(%s::text[]) AS k",
+            [[f"{distinct_id}:{device_id}" for distinct_id, device_id in sorted(keys)]]
         )
 
 
 @shared_task
-def aggregate_daily_events():
+def flush_event_buffer():
     """
-    Aggregate events by day for faster analytics.
+    Drain the write-behind ingestion buffer into the database.
     
-    This task is scheduled to run once a day and
-    aggregates the previous day's events.
+    This task is scheduled every few seconds. It is a no-op when the
+    buffer is empty, so it is safe to keep scheduled in 'sync' mode.
     """
-    yesterday = (timezone.now() - timedelta(days=1)).date()
+    from .buffer import flush_buffer
     
-    # Get all event types from yesterday
-    event_types = Event.objects.filter(
-        timestamp__date=yesterday
-    ).values_list('event_type', flat=True).distinct()
+    drained, event_ids = flush_buffer(max_chunks=20)
     
-    for event_type in event_types:
-        # Count events of this type
-        events = Event.objects.filter(
-            timestamp__date=yesterday,
-            event_type=event_type
-        )
-        
-        count = events.count()
-        unique_users = events.values('distinct_id').distinct().count()
-        
-        # Create or update aggregate
-        EventAggregate.objects.update_or_create(
-            event_type=event_type,
-            date=yesterday,
-            hour=None,  # None indicates a daily aggregate
-            defaults={
-                'count': count,
-                'unique_users': unique_users,
-                'properties': {}  # Add aggregated properties if needed
-            }
-        )
+    if drained:
+        logger.info(f"Flushed {drained} buffered events, {len(event_ids)} new")
+    return {'drained': drained, 'created': len(event_ids)}
+
+
+@shared_task
+def check_ingest_health():
+    """
+    Sample DB latency and buffer backlog and toggle ingestion load shedding.
+    """
+    from .throttling import measure_ingest_health, update_load_shedding
+    
+    health = measure_ingest_health()
+    health['shedding'] = update_load_shedding(health)
+    return health
+
+
+@shared_task
+def aggregate_daily_events(date=None):
+    """
+    Aggregate events by day for faster analytics.
+    
+    This task is scheduled to run once a day and rolls the previous
+    day's hourly aggregates up into daily rows.
+    """
+    if date is None:
+        date = (timezone.now() - timedelta(days=1)).date()
+    elif isinstance(date, str):
+        date = datetime.strptime(date, '%Y-%m-%d').date()
+    
+    rollup_days([date])
+    rollup_cube_days([date])
     
-    return f"Aggregated events for {yesterday}"
+    return f"Aggregated events for {date}"
 
 
 @shared_task
@@ -151,79 +265,92 @@ def aggregate_hourly_events():
     """
     Aggregate events by hour for faster analytics.
     
-    This task is scheduled to run every hour and
-    aggregates the previous hour's events.
-    """
-    now = timezone.now()
-    previous_hour = now - timedelta(hours=1)
-    date = previous_hour.date()
-    hour = previous_hour.hour
-    
-    # Get all event types from the previous hour
-    event_types = Event.objects.filter(
-        timestamp__date=date,
-        timestamp__hour=hour
-    ).values_list('event_type', flat=True).distinct()
-    
-    for event_type in event_types:
-        # Count events of this type
-        events = Event.objects.filter(
-            timestamp__date=date,
-            timestamp__hour=hour,
-            event_type=event_type
-        )
-        
-        count = events.count()
-        unique_users = events.values('distinct_id').distinct().count()
-        
-        # Create or update aggregate
-        EventAggregate.objects.update_or_create(
-            event_type=event_type,
-            date=date,
-            hour=hour,
-            defaults={
-                'count': count,
-                'unique_users': unique_users,
-                'properties': {}  # Add aggregated properties if needed
-            }
-        )
+    This task is scheduled every few minutes. It only looks at events
+    created since the previous run and recomputes the hours they fall
+    in, so late-arriving events land in the right bucket.
+    """
+    result = aggregate_new_events()
+    
+    return f"Aggregated {result['hours']} hours ({result['rows']} rows)"
+
+
+@shared_task
+def aggregate_rollup_cubes():
+    """
+    Bring the rollup cubes up to date with newly created events.
+    
+    Runs on the same cadence as aggregate_hourly_events with its own
+    watermark, and rebuilds the daily cube rows of days that ended or
+    received late events.
+    """
+    result = aggregate_cube_events()
     
-    return f"Aggregated events for {date} hour {hour}"
+    return f"Aggregated {result['hours']} hours ({result['rows']} cube rows)"
 
 
 @shared_task
-def close_inactive_sessions():
+def warm_session_index():
+    """
+    Rebuild the open session index from the Session table when it is cold.
+    
+    The index goes cold after a Redis restart or flush and, on purpose,
+    every SESSION_INDEX_REBUILD_SECONDS so any drift gets repaired. Until
+    it is warm again, ingestion matches sessions in the database.
+    """
+    count = session_index.ensure_warm()
+    if count is None:
+        return "Session index is warm"
+    return f"Indexed {count} open sessions"
+
+
+@shared_task
+def close_inactive_sessions(batch_size=50000):
     """
     Close sessions that have been inactive for too long.
     
-    This task finds sessions without an end time that haven't had
-    any events for a while, and sets their end time.
+    Open sessions whose last event (or start, if none was recorded) is
+    older than SESSION_TIMEOUT_MINUTES are ended with bulk UPDATEs that compute end_time and duration in SQL:
+    the session ends at its last event, or one minute after it started if
+    it never received one. Each batch commits on its own to keep row locks
+    short; the closed sessions are added to their SessionAggregate rows in
+    the same transaction and then dropped from the session index.
     """
-    # Find sessions that haven't ended but should have
-    cutoff_time = timezone.now() - timedelta(minutes=30)
+    timeout = timedelta(minutes=get_tracking_setting('SESSION_TIMEOUT_MINUTES', 30))
+    cutoff = timezone.now() - timeout
     
-    inactive_sessions = Session.objects.filter(
+    # Sessions created outside the capture path may have no last_event_at;
+    # their last activity is their start, as in record_session_activity.
+    # COALESCE(last_event_at, start_time) < cutoff is spelled out so that
+    # both branches can use the partial last_event_at index.
+    idle = Session.objects.filter(
+        Q(last_event_at__lt=cutoff) | Q(last_event_at__isnull=True, start_time__lt=cutoff),
         end_time__isnull=True,
-        start_time__lt=cutoff_time
+    )
+    end_time = Case(
+        When(events_count=0, then=F('start_time') + Value(timedelta(minutes=1))),
+        default=Coalesce('last_event_at', 'start_time'),
+        output_field=DateTimeField(),
     )
     
     count = 0
-    for session in inactive_sessions:
-        # Set the end time to the last event or a default value
-        last_event = Event.objects.filter(
-            distinct_id=session.distinct_id,
-            device_id=session.device_id,
-            timestamp__gt=session.start_time
-        ).order_by('-timestamp').first()
-        
-        if last_event:
-            session.end_time = last_event.timestamp
-        else:
-            # If no events, use start time + a short duration
-            session.end_time = session.start_time + timedelta(minutes=1)
-        
-        session.calculate_duration()
-        session.save()
-        count += 1
-    
-    return f"Closed {count} inactive sessions" 
\ No newline at end of file
+    while True:
+        with transaction.atomic():
+            # Sessions busy receiving events are skipped until the next run
+            batch = list(
+                idle.select_for_update(skip_locked=True).only('id', 'distinct_id', 'device_id')[:batch_size]
+            )
+            session_ids = [session.pk for session in batch]
+            closed = Session.objects.filter(pk__in=session_ids).update(
+                end_time=end_time,
+                duration=ExpressionWrapper(end_time - F('start_time'), output_field=DurationField()),
+            )
+            record_ended_sessions(session_ids)
+            # The UPDATE sends no post_save, so unindex the sessions here
+            session_index.update_on_commit(session_index.unregister_sessions, batch)
+        count += closed
+        if len(batch) < batch_size:
+            break
+    
+    if count:
+        logger.info(f"Closed {count} sessions idle since before {cutoff}")
+    return f"Closed {count} inactive sessions"
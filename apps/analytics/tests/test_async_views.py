@@ -0,0 +1,98 @@
+import json
+import threading
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.analytics import async_views
+from apps.analytics.models import Event
+
+EVENT = {
+    'distinct_id': 'user', 'event_type': 'open',
+    'device_id': 'device', 'app_version': '1.0', 'os_name': 'iOS', 'os_version': '17',
+}
+
+
+@override_settings(EVENT_TRACKING={**settings.EVENT_TRACKING, 'INGESTION_MODE': 'sync', 'RATE_LIMIT_ENABLED': False})
+class AsyncCaptureTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='sdk', email='sdk@example.com')
+        self.factory = AsyncRequestFactory()
+
+    def post(self, body, content_type='application/json'):
+        token = AccessToken.for_user(self.user)
+        return self.factory.post(
+            '/', data=body, content_type=content_type, headers={'Authorization': f'Bearer {token}'}
+        )
+
+    async def test_capture_with_valid_token(self):
+        response = await async_views.capture(self.post(json.dumps(EVENT)))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(await Event.objects.filter(distinct_id='user').acount(), 1)
+
+    async def test_missing_token_is_refused(self):
+        request = self.factory.post('/', data=json.dumps(EVENT), content_type='application/json')
+        response = await async_views.capture(request)
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+
+    async def test_token_of_inactive_user_is_refused(self):
+        self.user.is_active = False
+        await self.user.asave()
+        for view in (async_views.capture, async_views.batch_capture, async_views.session_start):
+            with self.subTest(view=view.__name__):
+                response = await view(self.post(json.dumps(EVENT)))
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(json.loads(response.content)['detail'], 'User is inactive')
+        self.assertEqual(await Event.objects.filter(distinct_id='user').acount(), 0)
+
+    async def test_token_of_deleted_user_is_refused(self):
+        request = self.post(json.dumps(EVENT))
+        await self.user.adelete()
+        response = await async_views.capture(request)
+        self.assertEqual(response.status_code, 401)
+
+    async def test_invalid_event_is_rejected(self):
+        response = await async_views.capture(self.post(json.dumps({'event_type': 'open'})))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('distinct_id', json.loads(response.content))
+
+    async def test_malformed_body_is_rejected(self):
+        response = await async_views.batch_capture(self.post('{"batch": ['))
+        self.assertEqual(response.status_code, 400)
+
+    async def test_bodies_are_decoded_off_the_event_loop(self):
+        loop_thread = threading.get_ident()
+        threads = []
+
+        def recording(function):
+            def wrapper(*args, **kwargs):
+                threads.append(threading.get_ident())
+                return function(*args, **kwargs)
+            return wrapper
+
+        def recording_stream(items):
+            for chunk in validate_stream(items):
+                threads.append(threading.get_ident())
+                yield chunk
+
+        validate_stream = async_views.validate_stream
+        with mock.patch.object(async_views, 'validate_event', recording(async_views.validate_event)), \
+                mock.patch.object(async_views, 'validate_batch', recording(async_views.validate_batch)), \
+                mock.patch.object(async_views, 'validate_stream', recording_stream):
+            responses = [
+                await async_views.capture(self.post(json.dumps(EVENT))),
+                await async_views.batch_capture(self.post(json.dumps({'batch': [EVENT, EVENT]}))),
+                await async_views.batch_capture(self.post(
+                    '\n'.join(json.dumps(EVENT) for _ in range(3)), content_type='application/x-ndjson'
+                )),
+            ]
+
+        self.assertEqual([response.status_code for response in responses], [202, 202, 202])
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(loop_thread, threads)
+        self.assertEqual(await Event.objects.filter(distinct_id='user').acount(), 6)
@@ -0,0 +1,135 @@
+import json
+import re
+import uuid
+from datetime import datetime
+from datetime import timezone as dt_timezone
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from apps.analytics.copy_loader import (
+    FIELDS, _encode_json, _encode_text, copy_events, copy_new_events, encode_rows,
+)
+from apps.analytics.models import Event
+
+TEXTS = [
+    'back\\slash',
+    'tab\there',
+    'new\nline',
+    'carriage\rreturn\r\n',
+    '\\N',
+    '\\\\N\\t',
+    'café ✓ 日本語 🚀',
+    '',
+]
+
+PROPERTIES = {
+    'path': 'C:\\tmp\\N',
+    'text': 'tab\tnew\ncr\r',
+    'escaped': '\\u0000 is not a NUL',
+    'unicode': 'café ✓ 🚀',
+    'ключ': [None, True, 1.5, {'nested': '\\\t'}],
+}
+
+TIMESTAMP = datetime(2026, 1, 1, 12, tzinfo=dt_timezone.utc)
+
+COPY_ESCAPE = re.compile(r'\\(.)')
+COPY_UNESCAPES = {'\\': '\\', 't': '\t', 'n': '\n', 'r': '\r'}
+
+
+def decode_field(field):
+    # What COPY FROM makes of one field in the text format
+    if field == '\\N':
+        return None
+    return COPY_ESCAPE.sub(lambda match: COPY_UNESCAPES[match.group(1)], field)
+
+
+def row(text, **kwargs):
+    return {
+        'id': uuid.uuid4(), 'distinct_id': text, 'event_type': text,
+        'properties': PROPERTIES, 'timestamp': TIMESTAMP, **kwargs,
+    }
+
+
+class EncodingTests(SimpleTestCase):
+
+    def test_text_round_trip(self):
+        for text in TEXTS:
+            with self.subTest(text=text):
+                encoded = _encode_text(text)
+                self.assertNotRegex(encoded, '[\t\n\r]')
+                self.assertEqual(decode_field(encoded), text)
+
+    def test_null_is_not_the_text_backslash_n(self):
+        self.assertEqual(_encode_text(None), '\\N')
+        self.assertEqual(_encode_json(None), '\\N')
+        self.assertNotEqual(_encode_text('\\N'), '\\N')
+
+    def test_json_round_trip(self):
+        encoded = _encode_json(PROPERTIES)
+        self.assertNotRegex(encoded, '[\t\n\r]')
+        self.assertEqual(json.loads(decode_field(encoded)), PROPERTIES)
+
+    def test_rows_are_one_line_per_event(self):
+        lines = b''.join(encode_rows([row(text) for text in TEXTS])).decode('utf-8').split('\n')
+        self.assertEqual(lines.pop(), '')
+        self.assertEqual(len(lines), len(TEXTS))
+        attnames = [field.attname for field in FIELDS]
+        for text, line in zip(TEXTS, lines):
+            values = dict(zip(attnames, map(decode_field, line.split('\t'))))
+            self.assertEqual(len(values), len(FIELDS))
+            self.assertEqual(values['distinct_id'], text)
+            self.assertEqual(json.loads(values['properties']), PROPERTIES)
+            # Defaults and auto_now_add are filled in for missing keys
+            self.assertIsNone(values['session_id'])
+            self.assertEqual(values['processed'], 'f')
+            self.assertIsNotNone(values['created_at'])
+
+    def test_chunks(self):
+        chunks = list(encode_rows([row('user') for _ in range(5)], chunk_size=2))
+        self.assertEqual([chunk.count(b'\n') for chunk in chunks], [2, 2, 1])
+
+    def test_instances_are_stamped(self):
+        event = Event(distinct_id='user', event_type='open')
+        list(encode_rows([event]))
+        self.assertIsNotNone(event.created_at)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'COPY requires PostgreSQL')
+class CopyRoundTripTests(TestCase):
+
+    def assertStored(self, rows):
+        stored = Event.objects.in_bulk([row['id'] for row in rows])
+        self.assertEqual(len(stored), len(rows))
+        for row in rows:
+            event = stored[row['id']]
+            self.assertEqual(event.distinct_id, row['distinct_id'])
+            self.assertEqual(event.event_type, row['event_type'])
+            self.assertEqual(event.properties, row['properties'])
+            self.assertEqual(event.timestamp, TIMESTAMP)
+
+    def test_copy_events(self):
+        rows = [row(text) for text in TEXTS]
+        self.assertEqual(copy_events(rows, chunk_size=3), len(TEXTS))
+        self.assertStored(rows)
+
+    def test_copy_events_ignoring_conflicts(self):
+        rows = [row(text) for text in TEXTS]
+        copy_events(rows[:2])
+        self.assertEqual(copy_events(rows, ignore_conflicts=True), len(TEXTS) - 2)
+        self.assertStored(rows)
+
+    def test_copy_new_events(self):
+        rows = [row(text) for text in TEXTS]
+        self.assertEqual(copy_new_events(rows[:3]), {row['id'] for row in rows[:3]})
+        self.assertEqual(copy_new_events(rows), {row['id'] for row in rows[3:]})
+        self.assertStored(rows)
+
+    def test_nulls(self):
+        rows = [row('user', latitude=None, app_check_result=None, properties=[None, '\\N'])]
+        copy_events(rows)
+        event = Event.objects.get()
+        self.assertIsNone(event.latitude)
+        self.assertIsNone(event.app_check_result)
+        self.assertEqual(event.properties, [None, '\\N'])
@@ -0,0 +1,111 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from apps.analytics.dimension_cache import DimensionCache, device_cache, location_cache
+from apps.analytics.models import DeviceInfo, Event, LocationInfo
+from apps.analytics.utils import bulk_create_events, create_event
+
+
+class RolledBack(Exception):
+    pass
+
+
+class DimensionCacheTests(TestCase):
+
+    def setUp(self):
+        for dimension_cache in (device_cache, location_cache):
+            dimension_cache.local.clear()
+            self.addCleanup(dimension_cache.local.clear)
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def payload(self):
+        return {
+            'distinct_id': 'user', 'event_type': 'open',
+            'device_id': 'device', 'app_version': '1.0', 'os_name': 'iOS', 'os_version': '17',
+            'ip_address': '10.0.0.1', 'city': 'Paris', 'country': 'FR',
+        }
+
+    def assertDimensionsStored(self):
+        self.assertTrue(DeviceInfo.objects.filter(device_id='device').exists())
+        self.assertTrue(LocationInfo.objects.filter(ip_address='10.0.0.1').exists())
+
+    def test_rolled_back_batch_is_not_cached(self):
+        with self.assertRaises(RolledBack), transaction.atomic():
+            bulk_create_events([self.payload()])
+            raise RolledBack
+        self.assertFalse(DeviceInfo.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            events = bulk_create_events([self.payload()])
+        self.assertDimensionsStored()
+        self.assertEqual(events[0].device_id, 'device')
+        self.assertEqual(Event.objects.get().location.ip_address, '10.0.0.1')
+
+    def test_rolled_back_event_is_not_cached(self):
+        with self.assertRaises(RolledBack), transaction.atomic():
+            create_event(self.payload())
+            raise RolledBack
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_event(self.payload())
+        self.assertDimensionsStored()
+
+    def test_committed_batch_is_cached(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_create_events([self.payload()])
+        self.assertEqual(device_cache.get('device')['app_version'], '1.0')
+        self.assertEqual(location_cache.get('10.0.0.1')['city'], 'Paris')
+
+
+class DimensionCacheStatsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_counters_are_summed_over_processes(self):
+        # Two processes with their own LRU and counters
+        first, second = DimensionCache('device'), DimensionCache('device')
+        first.set('known', {'device_id': 'known'})
+        first.get_many(['known', 'unknown'])
+        second.get_many(['known', 'unknown', 'other'])
+        first.get_many(['known'])
+        for process in (first, second):
+            process.flush_stats()
+
+        self.assertEqual(first.stats()['local_hits'], 2)
+        self.assertEqual(second.stats()['shared_hits'], 1)
+        self.assertEqual(first.shared_stats(), {
+            'local_hits': 2, 'shared_hits': 1, 'misses': 3, 'hit_rate': 0.5,
+        })
+
+    def test_flush_only_adds_new_counts(self):
+        process = DimensionCache('location')
+        process.get_many(['10.0.0.1'])
+        process.flush_stats()
+        process.flush_stats()
+        process.get_many(['10.0.0.2'])
+        process.flush_stats()
+        self.assertEqual(process.shared_stats()['misses'], 2)
+
+    def test_admin_endpoint(self):
+        User = get_user_model()
+        client = APIClient()
+        url = reverse('dimension_cache_stats')
+
+        client.force_authenticate(User.objects.create_user(username='member', email='member@example.com'))
+        self.assertEqual(client.get(url).status_code, 403)
+
+        device_cache.get_many(['unknown-device'])
+        client.force_authenticate(User.objects.create_user(
+            username='staff', email='staff@example.com', is_staff=True
+        ))
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(response.data['device']['misses'], 1)
+        self.assertIn('local_size', response.data['location']['process'])
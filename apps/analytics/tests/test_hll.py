@@ -0,0 +1,77 @@
+from django.test import SimpleTestCase
+
+from apps.analytics.hll import DEFAULT_PRECISION, HyperLogLog
+
+
+def sketch(values, precision=DEFAULT_PRECISION):
+    return HyperLogLog(precision).update(values)
+
+
+def users(start, stop):
+    return (f'user-{i}' for i in range(start, stop))
+
+
+class HyperLogLogTests(SimpleTestCase):
+
+    def test_empty_and_small_counts_are_exact(self):
+        self.assertEqual(HyperLogLog().count(), 0)
+        self.assertEqual(sketch(['a', 'a', 'a']).count(), 1)
+        self.assertEqual(sketch(users(0, 100)).count(), 100)
+
+    def test_estimates_stay_within_error_bounds(self):
+        # Hashing is deterministic, so these estimates never change between runs
+        for precision in (10, DEFAULT_PRECISION, 14):
+            hll = HyperLogLog(precision)
+            counted = 0
+            for cardinality in (1000, 10000, 100000):
+                hll.update(users(counted, cardinality))
+                counted = cardinality
+                with self.subTest(precision=precision, cardinality=cardinality):
+                    bound = 3 * hll.standard_error * cardinality
+                    self.assertLessEqual(abs(hll.count() - cardinality), bound)
+
+    def test_values_are_hashed_as_strings(self):
+        self.assertEqual(sketch([1, '1']).count(), 1)
+
+    def test_merge_is_the_union(self):
+        left = sketch(users(0, 6000))
+        right = sketch(users(4000, 10000))
+        union = sketch(users(0, 10000))
+        self.assertEqual(left.merge(right).registers, union.registers)
+        self.assertEqual(left.count(), union.count())
+
+    def test_merge_is_idempotent_and_commutative(self):
+        left, right = sketch(users(0, 500)), sketch(users(250, 750))
+        merged = HyperLogLog().merge(left).merge(right).merge(left)
+        self.assertEqual(merged.registers, HyperLogLog().merge(right).merge(left).registers)
+
+    def test_merge_requires_the_same_precision(self):
+        with self.assertRaises(ValueError):
+            HyperLogLog(12).merge(HyperLogLog(14))
+
+    def test_serialize_round_trip(self):
+        for precision in (4, DEFAULT_PRECISION, 16):
+            with self.subTest(precision=precision):
+                original = sketch(users(0, 3000), precision)
+                restored = HyperLogLog.from_bytes(original.to_bytes())
+                self.assertEqual(restored.precision, precision)
+                self.assertEqual(restored.registers, original.registers)
+                self.assertEqual(restored.count(), original.count())
+        # Stored in a BinaryField, which returns memoryview on PostgreSQL
+        data = memoryview(sketch(['a']).to_bytes())
+        self.assertEqual(HyperLogLog.from_bytes(data).count(), 1)
+
+    def test_merged_ignores_missing_sketches(self):
+        hours = [sketch(users(0, 300)).to_bytes(), None, b'', sketch(users(200, 500)).to_bytes()]
+        self.assertEqual(HyperLogLog.merged(hours).registers, sketch(users(0, 500)).registers)
+        self.assertEqual(HyperLogLog.merged([]).count(), 0)
+
+    def test_invalid_sketches(self):
+        with self.assertRaises(ValueError):
+            HyperLogLog(3)
+        with self.assertRaises(ValueError):
+            HyperLogLog(17)
+        with self.assertRaises(ValueError):
+            HyperLogLog(12, registers=bytes(100))
+        with self.assertRaises(ValueError):
+            HyperLogLog.from_bytes(b'\x02' + sketch(['a']).to_bytes()[1:])
@@ -0,0 +1,99 @@
+import uuid
+from base64 import urlsafe_b64encode
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from urllib.parse import urlencode
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from apps.analytics.models import Event
+
+NOW = datetime(2026, 3, 1, 12, tzinfo=dt_timezone.utc)
+
+
+def cursor(raw):
+    return urlsafe_b64encode(raw.encode()).decode()
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(
+            username='staff', email='staff@example.com', is_staff=True
+        ))
+        # A batch stored with the server time shares one timestamp
+        timestamps = [NOW - timedelta(hours=1)] + [NOW] * 5 + [NOW + timedelta(hours=1)]
+        Event.objects.bulk_create(
+            Event(id=uuid.uuid4(), distinct_id='user', event_type='open', timestamp=timestamp)
+            for timestamp in timestamps
+        )
+        self.expected = [
+            event.pk for event in sorted(
+                Event.objects.filter(distinct_id='user'), key=lambda event: (event.timestamp, event.pk), reverse=True
+            )
+        ]
+        self.url = reverse('event-list') + '?distinct_id=user&page_size=2'
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def ids(self, page):
+        return [uuid.UUID(event['id']) for event in page['results']]
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            page = self.get(url)
+            pages.append(page)
+            url = page[link]
+        return pages
+
+    def test_ties_are_broken_by_id(self):
+        pages = self.walk(self.url, 'next')
+        self.assertEqual([len(page['results']) for page in pages], [2, 2, 2, 1])
+        self.assertEqual([pk for page in pages for pk in self.ids(page)], self.expected)
+        self.assertIsNone(pages[0]['previous'])
+        self.assertNotIn('count', pages[0])
+
+    def test_previous_links_walk_back(self):
+        forward = self.walk(self.url, 'next')
+        backward = self.walk(forward[-1]['previous'], 'previous')
+        self.assertEqual(
+            [self.ids(page) for page in backward],
+            [self.ids(page) for page in reversed(forward[:-1])],
+        )
+        # A page reached backwards links forward to the page after it
+        self.assertEqual(self.ids(self.get(backward[-1]['next'])), self.ids(forward[1]))
+
+    def test_rows_added_while_paging_are_not_repeated(self):
+        first = self.get(self.url)
+        Event.objects.create(distinct_id='user', event_type='open', timestamp=NOW + timedelta(hours=2))
+        rest = self.walk(first['next'], 'next')
+        self.assertEqual(self.ids(first) + [pk for page in rest for pk in self.ids(page)], self.expected)
+
+    def test_count_on_request(self):
+        self.assertEqual(self.get(self.url + '&count=true')['count'], 7)
+
+    def test_malformed_cursors(self):
+        timestamp = NOW.isoformat()
+        cursors = [
+            '!!!',
+            'é',
+            cursor('not a cursor'),
+            cursor(f'x|{timestamp}|{uuid.uuid4()}'),
+            cursor(f'n|yesterday|{uuid.uuid4()}'),
+            cursor(f'n|{timestamp}|'),
+            cursor(f'n|{timestamp}|42'),
+            cursor(f'p|{timestamp}|{uuid.uuid4()}|extra'),
+        ]
+        for value in cursors:
+            with self.subTest(cursor=value):
+                response = self.client.get(f'{self.url}&{urlencode({"cursor": value})}')
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.data['detail'], 'Invalid cursor')
@@ -0,0 +1,124 @@
+import gzip
+import io
+import json
+import zlib
+
+import msgpack
+import zstandard
+from django.conf import settings
+from django.test import SimpleTestCase
+from rest_framework.exceptions import ParseError
+
+from apps.analytics.parsers import (
+    EventStream, InvalidItem, PayloadTooLarge, UnsupportedEncoding, iter_ndjson, parse_batch_body,
+)
+
+EVENTS = [{'distinct_id': f'user-{i}', 'event_type': 'open', 'properties': {'n': i}} for i in range(50)]
+
+
+def ndjson(events):
+    return b''.join(json.dumps(event).encode() + b'\n' for event in events)
+
+
+def split(data, size):
+    return [data[offset:offset + size] for offset in range(0, len(data), size)]
+
+
+class NDJSONTests(SimpleTestCase):
+
+    def test_lines_split_across_chunks(self):
+        body = ndjson(EVENTS)
+        for size in (1, 7, 64, len(body)):
+            with self.subTest(chunk_size=size):
+                self.assertEqual(list(iter_ndjson(split(body, size))), EVENTS)
+
+    def test_last_line_without_newline_and_blank_lines(self):
+        chunks = [b'\n{"a": 1}\r\n', b'  \n\n{"b"', b': 2}']
+        self.assertEqual(list(iter_ndjson(chunks)), [{'a': 1}, {'b': 2}])
+
+    def test_malformed_line_is_reported_in_place(self):
+        items = list(iter_ndjson([b'{"a": 1}\n{"a": \n', b'{"a": 3}\n']))
+        self.assertEqual(items[0], {'a': 1})
+        self.assertIsInstance(items[1], InvalidItem)
+        self.assertIn('JSON parse error', items[1].message)
+        self.assertEqual(items[2], {'a': 3})
+
+    def test_complete_line_longer_than_limit(self):
+        chunks = [b'{"a": 1}\n' + b'{"a": "' + b'x' * 100 + b'"}\n']
+        items = iter_ndjson(chunks, max_line=64)
+        self.assertEqual(next(items), {'a': 1})
+        with self.assertRaises(PayloadTooLarge):
+            next(items)
+
+    def test_unterminated_line_longer_than_limit(self):
+        # Rejected as soon as the buffered partial line is too long
+        def chunks():
+            yield b'{"a": 1}\n{"a": "'
+            for _ in range(100):
+                yield b'x' * 16
+            self.fail('read past the line limit')
+
+        with self.assertRaises(PayloadTooLarge):
+            list(iter_ndjson(chunks(), max_line=256))
+
+    def test_long_line_in_small_chunks(self):
+        line = json.dumps({'a': 'x' * 200000}).encode()
+        self.assertEqual(list(iter_ndjson(split(line + b'\n', 16))), [{'a': 'x' * 200000}])
+
+
+class BatchBodyTests(SimpleTestCase):
+
+    def parse(self, body, media_type='application/x-ndjson', encoding=''):
+        parsed = parse_batch_body(io.BytesIO(body), media_type, encoding)
+        return list(parsed) if isinstance(parsed, EventStream) else parsed
+
+    def test_json_object(self):
+        self.assertEqual(self.parse(json.dumps({'batch': EVENTS}).encode(), 'application/json'), {'batch': EVENTS})
+
+    def test_malformed_json_object(self):
+        with self.assertRaises(ParseError):
+            self.parse(b'{"batch": [', 'application/json')
+
+    def test_msgpack_maps_and_arrays(self):
+        body = msgpack.packb(EVENTS[0]) + msgpack.packb(EVENTS[1:20]) + msgpack.packb(EVENTS[20])
+        self.assertEqual(self.parse(body, 'application/msgpack'), EVENTS[:21])
+        self.assertEqual(self.parse(msgpack.packb(EVENTS), 'application/x-msgpack; charset=binary'), EVENTS)
+
+    def test_malformed_msgpack(self):
+        with self.assertRaises(ParseError):
+            self.parse(msgpack.packb(EVENTS[0]) + b'\xc1', 'application/msgpack')
+
+    def test_compressed_bodies(self):
+        body = ndjson(EVENTS)
+        encoded = {
+            'gzip': gzip.compress(body),
+            'deflate': zlib.compress(body),
+            'zstd': zstandard.ZstdCompressor().compress(body),
+        }
+        for encoding, data in encoded.items():
+            with self.subTest(encoding=encoding):
+                self.assertEqual(self.parse(data, encoding=encoding), EVENTS)
+        self.assertEqual(self.parse(encoded['gzip'], 'application/ndjson', ' GZIP '), EVENTS)
+
+    def test_compressed_msgpack(self):
+        data = zstandard.ZstdCompressor().compress(msgpack.packb(EVENTS))
+        self.assertEqual(self.parse(data, 'application/msgpack', 'zstd'), EVENTS)
+
+    def test_truncated_compressed_bodies(self):
+        body = ndjson(EVENTS)
+        for encoding, data in (
+            ('gzip', gzip.compress(body)),
+            ('zstd', zstandard.ZstdCompressor().compress(body)),
+        ):
+            with self.subTest(encoding=encoding), self.assertRaises(ParseError):
+                self.parse(data[:len(data) // 2], encoding=encoding)
+
+    def test_unsupported_encoding(self):
+        with self.assertRaises(UnsupportedEncoding):
+            self.parse(ndjson(EVENTS), encoding='br')
+
+    def test_decompressed_size_is_capped(self):
+        data = gzip.compress(b'\n' * 10000)
+        with self.settings(EVENT_TRACKING={**settings.EVENT_TRACKING, 'BATCH_MAX_DECOMPRESSED_BYTES': 1000}):
+            with self.assertRaises(PayloadTooLarge):
+                self.parse(data, encoding='gzip')
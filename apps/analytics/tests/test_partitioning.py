@@ -0,0 +1,114 @@
+import uuid
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from unittest import mock, skipUnless
+
+from django.db import IntegrityError, connection, transaction
+from django.test import TransactionTestCase
+
+from apps.analytics.models import Event
+from apps.analytics.partitioning import (
+    DEFAULT_PARTITION, LEGACY_PARTITION, convert_to_partitioned, create_future_partitions,
+    drop_partition, expired_partitions, is_partitioned, list_partitions,
+)
+from apps.analytics.utils import bulk_create_events, create_event
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Range partitioning requires PostgreSQL')
+class ConvertToPartitionedTests(TransactionTestCase):
+    # The conversion runs in its own transaction, as it does in production
+    now = datetime(2026, 3, 15, 12, tzinfo=dt_timezone.utc)
+
+    def tearDown(self):
+        # DDL is not rolled back between tests: put the plain table back
+        if is_partitioned():
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE "{Event._meta.db_table}" CASCADE')
+            with connection.schema_editor() as editor:
+                editor.create_model(Event)
+        super().tearDown()
+
+    def create_event(self, timestamp, **kwargs):
+        return Event.objects.create(distinct_id='user', event_type='test', timestamp=timestamp, **kwargs)
+
+    def test_convert_keeps_rows_and_accepts_inserts(self):
+        old = self.create_event(self.now - timedelta(days=40))
+        future = self.create_event(self.now + timedelta(days=40))
+
+        with self.settings(EVENT_TRACKING={'PARTITION_INTERVAL': 'month'}):
+            cutover = convert_to_partitioned(now=self.now)
+            created = create_future_partitions(ahead=2, now=self.now + timedelta(days=31))
+
+        self.assertTrue(is_partitioned())
+        self.assertEqual(cutover, datetime(2026, 4, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(created, ['analytics_event_y2026m04', 'analytics_event_y2026m05', 'analytics_event_y2026m06'])
+        names = [name for name, _, _ in list_partitions()]
+        self.assertIn(LEGACY_PARTITION, names)
+        self.assertIn(DEFAULT_PARTITION, names)
+
+        # Rows before the cut-over stay in the legacy heap; the later one was
+        # moved to the default partition and then into its own partition
+        self.assertEqual(set(Event.objects.values_list('id', flat=True)), {old.id, future.id})
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT tableoid::regclass::text FROM analytics_event WHERE id = %s', [future.id])
+            self.assertEqual(cursor.fetchone()[0], 'analytics_event_y2026m04')
+
+        # New rows are routed to the legacy, range and default partitions
+        self.create_event(self.now)
+        self.create_event(self.now + timedelta(days=20))
+        Event.objects.bulk_create([
+            Event(distinct_id='user', event_type='bulk', timestamp=self.now + timedelta(days=400)),
+            Event(distinct_id='user', event_type='bulk', timestamp=self.now - timedelta(days=400)),
+        ])
+        self.assertEqual(Event.objects.count(), 6)
+
+    def test_primary_key_is_id_and_timestamp(self):
+        with self.settings(EVENT_TRACKING={'PARTITION_INTERVAL': 'month'}):
+            convert_to_partitioned(now=self.now)
+
+        event_id = uuid.uuid4()
+        self.create_event(self.now, id=event_id)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.create_event(self.now, id=event_id)
+        # The same id with another timestamp is a distinct row on a partitioned table
+        self.create_event(self.now + timedelta(seconds=1), id=event_id)
+        self.assertEqual(Event.objects.filter(id=event_id).count(), 2)
+
+    def test_convert_twice_is_refused(self):
+        with self.settings(EVENT_TRACKING={'PARTITION_INTERVAL': 'month'}):
+            convert_to_partitioned(now=self.now)
+            with self.assertRaises(ValueError):
+                convert_to_partitioned(now=self.now)
+
+    def test_expired_partitions_are_dropped(self):
+        with self.settings(EVENT_TRACKING={'PARTITION_INTERVAL': 'month'}):
+            convert_to_partitioned(now=self.now)
+            create_future_partitions(ahead=1, now=self.now + timedelta(days=31))
+        self.create_event(datetime(2026, 4, 10, tzinfo=dt_timezone.utc))
+        self.create_event(datetime(2026, 5, 10, tzinfo=dt_timezone.utc))
+
+        expired = expired_partitions(datetime(2026, 5, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual([name for name, _, _ in expired], [LEGACY_PARTITION, 'analytics_event_y2026m04'])
+        for name, _, _ in expired:
+            drop_partition(name)
+
+        remaining = [name for name, _, _ in list_partitions()]
+        self.assertNotIn(LEGACY_PARTITION, remaining)
+        self.assertNotIn('analytics_event_y2026m04', remaining)
+        self.assertEqual(Event.objects.count(), 1)
+
+    def test_retry_without_timestamp_is_stored_once(self):
+        with self.settings(EVENT_TRACKING={'PARTITION_INTERVAL': 'month'}):
+            convert_to_partitioned(now=self.now)
+        event_id = uuid.uuid4()
+
+        def payload():
+            return {'distinct_id': 'user', 'event_type': 'test', 'event_id': str(event_id)}
+
+        # Retries that arrive after the Redis dedup window
+        with mock.patch('apps.analytics.utils.seen_event_ids', return_value=set()):
+            first = create_event(payload())
+            self.assertEqual(create_event(payload()).timestamp, first.timestamp)
+            self.assertEqual(bulk_create_events([payload()]), [])
+            self.assertEqual(len(bulk_create_events([payload(), {**payload(), 'event_id': str(uuid.uuid4())}])), 1)
+        self.assertEqual(Event.objects.filter(id=event_id).count(), 1)
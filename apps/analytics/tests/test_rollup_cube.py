@@ -0,0 +1,72 @@
+from datetime import datetime, time, timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from apps.analytics.models import DeviceInfo, Event, LocationInfo
+from apps.analytics.rollup_cube import aggregate_cube_events, breakdown, cube_covered_from
+
+
+def tracking(**cubes):
+    return {**settings.EVENT_TRACKING, 'AGGREGATION_LAG_SECONDS': 0, 'ROLLUP_CUBES': cubes}
+
+
+class BreakdownCoverageTests(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.device = DeviceInfo.objects.create(device_id='device', app_version='1.0', os_name='iOS', os_version='17')
+        self.location = LocationInfo.objects.create(ip_address='10.0.0.1', country='FR')
+        # Stored days before any cube ran
+        self.create_events(2, self.now - timedelta(days=3), created_at=self.now - timedelta(days=3))
+        self.create_events(1, self.now - timedelta(minutes=10))
+
+    def create_events(self, count, timestamp, created_at=None):
+        events = Event.objects.bulk_create([
+            Event(distinct_id='user', event_type='open', timestamp=timestamp,
+                  device=self.device, location=self.location)
+            for _ in range(count)
+        ])
+        if created_at:
+            Event.objects.filter(id__in=[event.id for event in events]).update(created_at=created_at)
+
+    def breakdown(self, dimension):
+        return breakdown([dimension], self.now - timedelta(days=7), self.now + timedelta(seconds=1))
+
+    def test_hours_before_the_first_run_are_counted_raw(self):
+        with self.settings(EVENT_TRACKING=tracking(os=['os_name'])):
+            aggregate_cube_events()
+            self.assertIsNotNone(cube_covered_from('os'))
+            self.assertEqual(self.breakdown('os_name'), [{'os_name': 'iOS', 'count': 3}])
+
+    def test_cube_configured_later_covers_only_its_own_runs(self):
+        with self.settings(EVENT_TRACKING=tracking(os=['os_name'])):
+            aggregate_cube_events()
+        with self.settings(EVENT_TRACKING=tracking(os=['os_name'], country=['country'])):
+            self.assertIsNone(cube_covered_from('country'))
+            self.assertEqual(self.breakdown('country'), [{'country': 'FR', 'count': 3}])
+            self.create_events(1, self.now)
+            aggregate_cube_events()
+            self.assertGreater(cube_covered_from('country'), cube_covered_from('os'))
+            self.assertEqual(self.breakdown('country'), [{'country': 'FR', 'count': 4}])
+
+    def test_removed_cube_loses_its_coverage(self):
+        with self.settings(EVENT_TRACKING=tracking(os=['os_name'], country=['country'])):
+            aggregate_cube_events()
+        with self.settings(EVENT_TRACKING=tracking(os=['os_name'])):
+            aggregate_cube_events()
+            self.assertIsNone(cube_covered_from('country'))
+
+    def test_rebuild_extends_coverage_back(self):
+        with self.settings(EVENT_TRACKING=tracking(os=['os_name'])):
+            aggregate_cube_events()
+            call_command('rebuild_aggregates', days=7, stdout=StringIO())
+            first_day = timezone.localdate() - timedelta(days=6)
+            self.assertEqual(cube_covered_from('os'), timezone.make_aware(datetime.combine(first_day, time.min)))
+
+            # The old hours are now read from the cube, not from raw events
+            Event.objects.filter(timestamp__lt=self.now - timedelta(days=1)).delete()
+            self.assertEqual(self.breakdown('os_name'), [{'os_name': 'iOS', 'count': 3}])
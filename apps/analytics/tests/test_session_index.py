@@ -0,0 +1,134 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from apps.analytics import session_index
+from apps.analytics.models import DeviceInfo, Session
+from apps.analytics.session_index import (
+    BUILDING_KEY, INDEX_KEY, REMOVED_KEY, WARM_KEY, lookup_open_sessions, rebuild,
+    register_sessions, touch_sessions, unregister_sessions,
+)
+
+KEY = ('user', 'device')
+
+
+class SessionIndexTests(TestCase):
+    """
+    The index scripts run against the configured Redis cache.
+    """
+
+    def setUp(self):
+        self.conn = get_redis_connection('default')
+        try:
+            self.conn.ping()
+        except RedisError:
+            self.skipTest('Redis is not available')
+        self.clear()
+        self.addCleanup(self.clear)
+        DeviceInfo.objects.create(device_id='device', app_version='1.0', os_name='iOS', os_version='17')
+        self.now = timezone.now()
+
+    def clear(self):
+        self.conn.delete(INDEX_KEY, BUILDING_KEY, REMOVED_KEY, WARM_KEY)
+
+    def create_session(self, minutes_ago, **kwargs):
+        return Session.objects.create(
+            distinct_id='user', device_id='device',
+            start_time=self.now - timedelta(minutes=minutes_ago), **kwargs
+        )
+
+    def rows(self, *sessions):
+        return [
+            (session.distinct_id, session.device_id, session.id, session.start_time, session.last_event_at)
+            for session in sessions
+        ]
+
+    def indexed_session(self):
+        hit = lookup_open_sessions([KEY]).get(KEY)
+        return hit[0] if hit else None
+
+    def test_lookup_is_cold_until_rebuilt(self):
+        self.create_session(10)
+        self.assertIsNone(lookup_open_sessions([KEY]))
+        self.assertEqual(rebuild(), 1)
+        self.assertIsNotNone(lookup_open_sessions([KEY]))
+
+    def test_rebuild_indexes_the_newest_open_session(self):
+        self.create_session(30)
+        newest = self.create_session(20)
+        self.create_session(10, end_time=self.now)
+        rebuild()
+        self.assertEqual(self.indexed_session(), newest.id)
+        self.assertFalse(self.conn.exists(BUILDING_KEY))
+        self.assertFalse(self.conn.exists(REMOVED_KEY))
+
+    def test_remove_only_drops_the_named_session(self):
+        rebuild()
+        old = self.create_session(20)
+        new = self.create_session(10)
+        register_sessions([new])
+        unregister_sessions([old])
+        self.assertEqual(self.indexed_session(), new.id)
+        unregister_sessions([new])
+        self.assertIsNone(self.indexed_session())
+
+    def test_touch_only_moves_activity_forward(self):
+        rebuild()
+        session = self.create_session(10)
+        other = self.create_session(20)
+        register_sessions([session])
+
+        def last_activity():
+            return float(self.conn.hget(INDEX_KEY, session_index._field(*KEY)).decode().split('|')[2])
+
+        touch_sessions({KEY: (session.id, self.now)})
+        self.assertEqual(last_activity(), self.now.timestamp())
+        touch_sessions({KEY: (session.id, self.now - timedelta(minutes=5))})
+        touch_sessions({KEY: (other.id, self.now + timedelta(minutes=5))})
+        self.assertEqual(last_activity(), self.now.timestamp())
+
+    def test_session_ended_during_rebuild_is_not_written_back(self):
+        session = self.create_session(10)
+        snapshot = self.rows(session)
+
+        def rows_read_while_session_ends():
+            # The session ends after the rebuild read it from the database
+            unregister_sessions([session])
+            yield from snapshot
+
+        with mock.patch.object(session_index, 'open_session_rows', rows_read_while_session_ends):
+            rebuild()
+        self.assertIsNone(self.indexed_session())
+
+    def test_session_started_during_rebuild_is_not_overwritten(self):
+        old = self.create_session(20)
+        snapshot = self.rows(old)
+        new = self.create_session(1)
+
+        def rows_read_while_session_starts():
+            register_sessions([new])
+            yield from snapshot
+
+        with mock.patch.object(session_index, 'open_session_rows', rows_read_while_session_starts):
+            rebuild()
+        self.assertEqual(self.indexed_session(), new.id)
+
+    def test_touch_during_rebuild_reaches_the_new_index(self):
+        session = self.create_session(10)
+        snapshot = self.rows(session)
+        touched_at = self.now + timedelta(minutes=1)
+
+        def rows_then_activity():
+            yield from snapshot
+            # The row was merged into the hash being built by now
+            touch_sessions({KEY: (session.id, touched_at)})
+
+        with mock.patch.object(session_index, 'open_session_rows', rows_then_activity), \
+                mock.patch.object(session_index, 'REBUILD_BATCH_SIZE', 1):
+            rebuild()
+        raw = self.conn.hget(INDEX_KEY, session_index._field(*KEY)).decode()
+        self.assertEqual(float(raw.split('|')[2]), touched_at.timestamp())
@@ -0,0 +1,61 @@
+from datetime import timedelta
+
+from django.db.models import Sum
+from django.test import TestCase
+from django.utils import timezone
+
+from apps.analytics.models import Session, SessionAggregate
+from apps.analytics.tasks import close_inactive_sessions
+
+
+class CloseInactiveSessionsTests(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+
+    def create_session(self, minutes_ago, last_event_minutes_ago=None, **kwargs):
+        last_event_at = None
+        if last_event_minutes_ago is not None:
+            last_event_at = self.now - timedelta(minutes=last_event_minutes_ago)
+        return Session.objects.create(
+            distinct_id='user', start_time=self.now - timedelta(minutes=minutes_ago),
+            last_event_at=last_event_at, **kwargs
+        )
+
+    def close(self):
+        with self.settings(EVENT_TRACKING={'SESSION_TIMEOUT_MINUTES': 30}), \
+                self.captureOnCommitCallbacks(execute=True):
+            return close_inactive_sessions()
+
+    def test_sessions_without_last_event_at_are_closed(self):
+        # e.g. created in the admin, which does not maintain last_event_at
+        empty = self.create_session(120)
+        counted = self.create_session(90, events_count=3)
+        recent = self.create_session(10)
+
+        self.assertEqual(self.close(), 'Closed 2 inactive sessions')
+        empty.refresh_from_db()
+        counted.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertEqual(empty.end_time, empty.start_time + timedelta(minutes=1))
+        self.assertEqual(empty.duration, timedelta(minutes=1))
+        self.assertEqual(counted.end_time, counted.start_time)
+        self.assertIsNone(recent.end_time)
+        self.assertEqual(SessionAggregate.objects.aggregate(total=Sum('sessions'))['total'], 2)
+
+    def test_sessions_end_at_their_last_event(self):
+        idle = self.create_session(120, last_event_minutes_ago=45, events_count=2)
+        active = self.create_session(120, last_event_minutes_ago=5, events_count=9)
+
+        self.assertEqual(self.close(), 'Closed 1 inactive sessions')
+        idle.refresh_from_db()
+        active.refresh_from_db()
+        self.assertEqual(idle.end_time, idle.last_event_at)
+        self.assertEqual(idle.duration, timedelta(minutes=75))
+        self.assertIsNone(active.end_time)
+
+    def test_ended_sessions_are_left_alone(self):
+        ended = self.create_session(120, end_time=self.now - timedelta(minutes=100))
+        self.assertEqual(self.close(), 'Closed 0 inactive sessions')
+        ended.refresh_from_db()
+        self.assertEqual(ended.end_time, self.now - timedelta(minutes=100))
@@ -0,0 +1,132 @@
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django_redis import get_redis_connection
+from redis.exceptions import ConnectionError, RedisError
+from rest_framework.test import APIClient
+
+from apps.analytics import throttling
+from apps.analytics.throttling import (
+    BUCKET_PREFIX, RATE_LIMITED_MESSAGE, SHED_KEY, SHEDDING_MESSAGE, Throttled, _decision,
+    async_check_ingest_limits, check_ingest_limits, update_load_shedding,
+)
+
+IP = '10.0.0.1'
+IP_BUCKET = f'{BUCKET_PREFIX}:capture:ip:{IP}'
+HEALTHY = {'db_latency_ms': 1.0, 'backlog': 0}
+
+
+class DecisionTests(SimpleTestCase):
+
+    def test_retry_after(self):
+        self.assertIsNone(_decision([0, 0]))
+        # Wait times are rounded up to whole seconds, and never below one
+        self.assertEqual(_decision([1, 1]), Throttled(429, 1, RATE_LIMITED_MESSAGE))
+        self.assertEqual(_decision([1, 2500]), Throttled(429, 3, RATE_LIMITED_MESSAGE))
+        self.assertEqual(_decision([2, 30]), Throttled(503, 30, SHEDDING_MESSAGE))
+        self.assertEqual(_decision([2, 0]), Throttled(503, 1, SHEDDING_MESSAGE))
+
+
+@override_settings(EVENT_TRACKING={**settings.EVENT_TRACKING, 'RATE_LIMIT_ENABLED': True})
+class FailOpenTests(SimpleTestCase):
+
+    def test_fails_open_without_redis(self):
+        with mock.patch.object(throttling, 'get_redis_connection', side_effect=ConnectionError('refused')), \
+                self.assertLogs('apps.analytics.throttling', 'WARNING'):
+            self.assertIsNone(check_ingest_limits('capture', IP))
+
+    async def test_async_fails_open_without_redis(self):
+        with mock.patch.object(throttling, 'get_async_redis', side_effect=ConnectionError('refused')), \
+                self.assertLogs('apps.analytics.throttling', 'WARNING'):
+            self.assertIsNone(await async_check_ingest_limits('capture', IP))
+
+
+class TokenBucketTests(TestCase):
+    """
+    The bucket script runs against the configured Redis cache.
+    """
+
+    def setUp(self):
+        self.conn = get_redis_connection('default')
+        try:
+            self.conn.ping()
+        except RedisError:
+            self.skipTest('Redis is not available')
+        self.clear()
+        self.addCleanup(self.clear)
+        tracking = {
+            **settings.EVENT_TRACKING,
+            'RATE_LIMIT_ENABLED': True,
+            'RATE_LIMITS': {'capture': {'ip': '3/minute', 'device': '1/minute'}},
+            'SHED_RETRY_AFTER': 30,
+            'SHED_HOLD_SECONDS': 15,
+        }
+        override = self.settings(EVENT_TRACKING=tracking)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def clear(self):
+        keys = self.conn.keys(f'{BUCKET_PREFIX}:*')
+        self.conn.delete(SHED_KEY, *keys)
+
+    def rewind(self, key, milliseconds):
+        # Moves the last refill back instead of waiting for the Redis clock
+        updated = float(self.conn.hget(key, 'ts'))
+        self.conn.hset(key, 'ts', updated - milliseconds)
+
+    def take(self, count):
+        return [check_ingest_limits('capture', IP) for _ in range(count)]
+
+    def test_burst_up_to_capacity(self):
+        self.assertEqual(self.take(3), [None, None, None])
+        # One token of a 3/minute bucket takes 20 seconds to refill
+        self.assertEqual(check_ingest_limits('capture', IP), Throttled(429, 20, RATE_LIMITED_MESSAGE))
+        self.assertIsNone(check_ingest_limits('capture', '10.0.0.2'))
+
+    def test_refill(self):
+        self.take(3)
+        self.rewind(IP_BUCKET, 20000)
+        self.assertIsNone(check_ingest_limits('capture', IP))
+        self.assertIsNotNone(check_ingest_limits('capture', IP))
+
+    def test_refill_is_capped_at_capacity(self):
+        self.take(3)
+        self.rewind(IP_BUCKET, 3600 * 1000)
+        self.assertEqual(self.take(4)[3].status_code, 429)
+
+    def test_refused_request_charges_no_bucket(self):
+        self.assertIsNone(check_ingest_limits('capture', None, ['a', 'b']))
+        self.assertEqual(check_ingest_limits('capture', None, ['b', 'c']).status_code, 429)
+        self.assertIsNone(check_ingest_limits('capture', None, ['c']))
+
+    def test_shed_flag(self):
+        with self.assertLogs('apps.analytics.throttling', 'WARNING'):
+            self.assertTrue(update_load_shedding({'db_latency_ms': 501.0, 'backlog': 0}))
+        self.assertEqual(check_ingest_limits('capture', IP), Throttled(503, 30, SHEDDING_MESSAGE))
+        self.assertLessEqual(self.conn.ttl(SHED_KEY), 15)
+        # Shed requests take no token
+        self.assertFalse(self.conn.exists(IP_BUCKET))
+
+        self.assertFalse(update_load_shedding(HEALTHY))
+        self.assertIsNone(check_ingest_limits('capture', IP))
+        with self.settings(EVENT_TRACKING={**settings.EVENT_TRACKING, 'SHED_BUFFER_BACKLOG': 10}), \
+                self.assertLogs('apps.analytics.throttling', 'WARNING'):
+            self.assertTrue(update_load_shedding({'db_latency_ms': 1.0, 'backlog': 11}))
+
+    def test_capture_view_sends_retry_after(self):
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(username='sdk', email='sdk@example.com'))
+        url = reverse('capture')
+        self.take(3)
+        response = client.post(url, {}, format='json', REMOTE_ADDR=IP)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '20')
+
+        with self.assertLogs('apps.analytics.throttling', 'WARNING'):
+            update_load_shedding({'db_latency_ms': 501.0, 'backlog': 0})
+        response = client.post(url, {}, format='json', REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '30')
@@ -0,0 +1,205 @@
+import json
+import uuid
+
+from django.test import TestCase
+
+from apps.analytics.models import Session
+from apps.analytics.serializers import BatchEventSerializer, EventSerializer, SessionSerializer
+from apps.analytics.validation import validate_batch, validate_event, validate_session
+
+DEVICE = {'device_id': 'device', 'app_version': '1.0', 'os_name': 'iOS', 'os_version': '17'}
+EVENT = {'distinct_id': 'user', 'event_type': 'open', **DEVICE}
+SESSION = {'distinct_id': 'user', **DEVICE}
+EVENT_ID = '6f1c2c4e-1c1a-4b1f-9d3c-7b8b8c6a1e2f'
+
+# Payload changes checked against both schemas; None removes the field
+SHARED_CASES = {
+    'valid': {},
+    'missing distinct_id': {'distinct_id': None},
+    'missing device fields': {'device_id': None, 'os_name': None},
+    'blank string': {'distinct_id': ''},
+    'whitespace string': {'distinct_id': '  '},
+    'padded string': {'distinct_id': '  user  '},
+    'null string': {'device_id': ...},
+    'number as string': {'distinct_id': 5, 'app_version': 1.5},
+    'boolean as string': {'distinct_id': True},
+    'list as string': {'distinct_id': ['user']},
+    'dict as string': {'distinct_id': {'id': 'user'}},
+    'overlong distinct_id': {'distinct_id': 'x' * 201},
+    'distinct_id at limit': {'distinct_id': 'x' * 200},
+    'null character': {'distinct_id': 'us\x00er'},
+    'surrogate character': {'distinct_id': 'us\ud800er'},
+    'non-ascii string': {'distinct_id': 'usér ✓ 日本'},
+    'valid ipv4': {'ip_address': ' 10.0.0.1 '},
+    'valid ipv6': {'ip_address': '2001:DB8::1'},
+    'ipv4-mapped ipv6': {'ip_address': '::ffff:10.0.0.1'},
+    'bad ip': {'ip_address': '10.0.0'},
+    'blank ip': {'ip_address': ''},
+    'number as ip': {'ip_address': 10},
+    'boolean as ip': {'ip_address': True},
+    'list as ip': {'ip_address': ['10.0.0.1']},
+    'null ip': {'ip_address': ...},
+    'boolean strings': {'is_simulator': 'yes', 'is_rooted_device': 0, 'is_vpn_enabled': 'False'},
+    'bad boolean': {'is_simulator': 'maybe'},
+    'list as boolean': {'is_simulator': []},
+    'null boolean': {'is_simulator': ...},
+    'null nullable boolean': {'app_check_result': ...},
+    'numbers': {'latitude': '48.85', 'longitude': 2},
+    'boolean as number': {'latitude': True},
+    'bad number': {'latitude': 'north'},
+    'non-finite numbers': {'latitude': 'nan', 'longitude': '1e999'},
+    'list as number': {'latitude': [48.85]},
+    'null numbers': {'latitude': ..., 'longitude': ...},
+    'unknown fields': {'foo': 1, 'id': 'x', 'events_count': 'x'},
+}
+
+EVENT_CASES = {
+    'missing event_type': {'event_type': None},
+    'overlong event_type': {'event_type': 'x' * 101},
+    'nested properties': {'properties': {'screen': {'name': 'home', 'tags': ['a', None, 1.5]}, 'n': 1}},
+    'list properties': {'properties': [1, {'a': [2]}]},
+    'string properties': {'properties': 'home'},
+    'null properties': {'properties': ...},
+    'null character in properties': {'properties': {'screen': {'name': 'ho\x00me'}}},
+    'null character in property key': {'properties': {'tags': [{'\x00': 1}]}},
+    'surrogate in properties': {'properties': ['\udfff']},
+    'escapes in properties': {'properties': {'path': 'C:\\tmp\\N', 'text': 'a\tb\nc\r', 'raw': '\\u0000'}},
+    'aware timestamp': {'timestamp': '2026-01-01T10:00:00+02:00'},
+    'utc timestamp': {'timestamp': '2026-01-01T10:00:00.123456Z'},
+    'naive timestamp': {'timestamp': '2026-01-01T10:00:00'},
+    'date as timestamp': {'timestamp': '2026-01-01'},
+    'bad timestamp': {'timestamp': 'yesterday'},
+    'impossible timestamp': {'timestamp': '2026-02-30T10:00:00Z'},
+    'number as timestamp': {'timestamp': 1767261600},
+    'null timestamp': {'timestamp': ...},
+    'event_id': {'event_id': EVENT_ID},
+    'braced event_id': {'event_id': '{' + EVENT_ID.upper() + '}'},
+    'integer event_id': {'event_id': 5},
+    'out of range event_id': {'event_id': -1},
+    'bad event_id': {'event_id': 'retry-1'},
+    'float event_id': {'event_id': 1.5},
+    'null event_id': {'event_id': ...},
+    'bad session': {'session': 'abc'},
+    'float session': {'session': 1.5},
+    'null session': {'session': ...},
+}
+
+SESSION_CASES = {
+    'end_time': {'end_time': '2026-01-01T10:00:00Z'},
+    'bad end_time': {'end_time': 'later'},
+    'null end_time': {'end_time': ...},
+}
+
+
+def payload(base, changes):
+    data = dict(base)
+    for name, value in changes.items():
+        if value is None:
+            data.pop(name)
+        else:
+            data[name] = None if value is ... else value
+    return data
+
+
+def plain(value):
+    # ErrorDetail, UUID and datetime values compared as the JSON clients receive
+    return json.loads(json.dumps(value, default=str))
+
+
+class ValidationParityTests(TestCase):
+
+    def assertParity(self, serializer, validate, data, ignore=()):
+        valid = serializer.is_valid()
+        cleaned, errors = validate(data)
+        self.assertEqual(plain(errors), plain(serializer.errors))
+        if valid:
+            expected = {name: value for name, value in serializer.validated_data.items() if name not in ignore}
+            self.assertEqual(plain(cleaned), plain(expected))
+
+    def test_event_parity(self):
+        for name, changes in {**SHARED_CASES, **EVENT_CASES}.items():
+            with self.subTest(name):
+                data = payload(EVENT, changes)
+                self.assertParity(EventSerializer(data=data), validate_event, data)
+
+    def test_session_parity(self):
+        for name, changes in {**SHARED_CASES, **SESSION_CASES}.items():
+            with self.subTest(name):
+                data = payload(SESSION, changes)
+                # The DRF view passes start_time to save(), but the serializer still requires it
+                serializer = SessionSerializer(data={**data, 'start_time': '2026-01-01T09:00:00Z'})
+                self.assertParity(serializer, validate_session, data, ignore=['start_time'])
+
+    def test_existing_session_parity(self):
+        session = Session.objects.create(distinct_id='user', start_time='2026-01-01T09:00:00Z')
+        data = {**EVENT, 'session': str(session.pk)}
+        serializer = EventSerializer(data=data)
+        self.assertTrue(serializer.is_valid())
+        cleaned, errors = validate_event(data)
+        self.assertEqual(errors, {})
+        self.assertEqual(cleaned['session'], serializer.validated_data['session'].pk)
+
+    def test_text_postgres_cannot_store_is_rejected(self):
+        # Parity alone would pass if neither side checked properties
+        message = 'Null characters are not allowed.'
+        data = {**EVENT, 'properties': {'screen': ['home\x00']}}
+        self.assertEqual(validate_event(data)[1], {'properties': [message]})
+        serializer = EventSerializer(data=data)
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors['properties'], [message])
+
+    def test_non_object_parity(self):
+        for data in ([], 'event', 5, None):
+            with self.subTest(data=data):
+                self.assertParity(EventSerializer(data=data), validate_event, data)
+                self.assertParity(SessionSerializer(data=data), validate_session, data)
+
+    def test_batch_parity(self):
+        cases = {
+            'valid': {'batch': [EVENT, {**EVENT, 'properties': {'a': {'b': [1]}}}]},
+            'missing batch': {},
+            'null batch': {'batch': None},
+            'object as batch': {'batch': EVENT},
+            'string as batch': {'batch': 'events'},
+            'empty batch': {'batch': []},
+            'oversized batch': {'batch': [EVENT] * 1001},
+            'invalid items': {'batch': [EVENT, {'event_type': 'open'}, 5, None, {**EVENT, 'ip_address': '10.0.0'}]},
+        }
+        for name, data in cases.items():
+            with self.subTest(name):
+                serializer = BatchEventSerializer(data=data)
+                valid = serializer.is_valid()
+                batch, errors = validate_batch(data, max_size=1000)
+                self.assertEqual(plain(errors), plain(serializer.errors))
+                if valid:
+                    self.assertEqual(plain(batch), plain(serializer.validated_data['batch']))
+
+
+class ValidationDifferenceTests(TestCase):
+    # Differences from the serializers that validation.py documents
+
+    def test_session_existence_is_not_checked(self):
+        session_id = uuid.uuid4()
+        for value in (str(session_id), session_id.int):
+            with self.subTest(value=value):
+                serializer = EventSerializer(data={**EVENT, 'session': value})
+                self.assertFalse(serializer.is_valid())
+                self.assertIn('does not exist', serializer.errors['session'][0])
+                cleaned, errors = validate_event({**EVENT, 'session': value})
+                self.assertEqual(errors, {})
+                self.assertEqual(cleaned['session'], session_id)
+
+    def test_device_strings_are_held_to_column_lengths(self):
+        for name, max_length in (('device_id', 100), ('os_version', 50), ('city', 100)):
+            with self.subTest(name):
+                data = {**EVENT, name: 'x' * (max_length + 1)}
+                self.assertTrue(EventSerializer(data=data).is_valid())
+                self.assertEqual(validate_event(data)[1], {
+                    name: [f'Ensure this field has no more than {max_length} characters.'],
+                })
+                self.assertEqual(validate_session({**SESSION, name: 'x' * max_length})[1], {})
+
+    def test_session_start_time_is_not_read(self):
+        cleaned, errors = validate_session({**SESSION, 'start_time': 'whenever'})
+        self.assertEqual(errors, {})
+        self.assertNotIn('start_time', cleaned)
@@ -0,0 +1,218 @@
+"""
+Rate limiting and load shedding for the public ingestion endpoints.
+
+Each capture request is checked against token buckets keyed by client IP
+and by device_id (EVENT_TRACKING['RATE_LIMITS']). All buckets, plus the
+global load-shedding flag, are evaluated by one Lua script, so a request
+costs a single Redis round-trip and either consumes a token from every
+bucket or from none. Bucket time comes from the Redis clock, so web nodes
+with skewed clocks share the same buckets.
+
+The capture views check the IP bucket before reading the body, and the
+device buckets (with ip=None) once the payload is validated, so a
+flood from one address is refused without parsing it.
+
+Load shedding is driven by the check_ingest_health task, which measures
+database latency and the ingestion buffer backlog every few seconds and
+raises the shed flag while either is above its threshold. While the flag
+is set every capture request is answered with 503 and Retry-After, which
+keeps the backlog from growing and protects latency for the requests that
+are already in flight.
+
+The limiter fails open: if Redis is unreachable, requests are admitted.
+"""
+import logging
+import math
+import time
+from collections import namedtuple
+
+from django.db import connection
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from .buffer import get_async_redis, get_buffer_length, is_buffered_mode
+from .utils import get_tracking_setting
+
+logger = logging.getLogger(__name__)
+
+SHED_KEY = 'analytics:ingest:shed'
+BUCKET_PREFIX = 'analytics:rl'
+
+# At most this many device buckets are charged for one batch
+MAX_DEVICE_KEYS = 10
+
+PERIODS = {'s': 1, 'sec': 1, 'second': 1, 'm': 60, 'min': 60, 'minute': 60,
+           'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+# KEYS[1] is the shed flag, KEYS[2..n] the buckets.
+# ARGV[1] is the cost, then (capacity, tokens per millisecond) for each bucket.
+# Returns {0, 0} when admitted, {1, wait_ms} when rate limited and
+# {2, retry_after_seconds} while load shedding is active.
+TOKEN_BUCKET_SCRIPT = """
+local shed = redis.call('GET', KEYS[1])
+if shed then
+    return {2, tonumber(shed)}
+end
+
+local clock = redis.call('TIME')
+local now = clock[1] * 1000 + math.floor(clock[2] / 1000)
+local cost = tonumber(ARGV[1])
+local wait = 0
+local tokens = {}
+
+for i = 2, #KEYS do
+    local capacity = tonumber(ARGV[2 * i - 2])
+    local rate = tonumber(ARGV[2 * i - 1])
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local available = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    available = math.min(capacity, available + math.max(0, now - updated) * rate)
+    if available < cost then
+        wait = math.max(wait, math.ceil((cost - available) / rate))
+    end
+    tokens[i] = available
+end
+
+if wait > 0 then
+    return {1, wait}
+end
+
+for i = 2, #KEYS do
+    local capacity = tonumber(ARGV[2 * i - 2])
+    local rate = tonumber(ARGV[2 * i - 1])
+    redis.call('HSET', KEYS[i], 'tokens', tokens[i] - cost, 'ts', now)
+    redis.call('PEXPIRE', KEYS[i], math.ceil(capacity / rate) + 1000)
+end
+return {0, 0}
+"""
+
+Throttled = namedtuple('Throttled', ['status_code', 'retry_after', 'message'])
+
+RATE_LIMITED_MESSAGE = 'Rate limit exceeded, retry later'
+SHEDDING_MESSAGE = 'Ingestion is temporarily overloaded, retry later'
+
+
+def parse_rate(rate):
+    """
+    Parse a rate such as '100/minute' into (requests, period in seconds).
+    """
+    count, period = rate.split('/')
+    return int(count), PERIODS[period.strip().lower()]
+
+
+def _script_arguments(scope, ip, device_ids):
+    limits = get_tracking_setting('RATE_LIMITS', {}).get(scope, {})
+    keys = [SHED_KEY]
+    args = [1]
+
+    buckets = []
+    if ip and limits.get('ip'):
+        buckets.append((f'{BUCKET_PREFIX}:{scope}:ip:{ip}', limits['ip']))
+    if limits.get('device'):
+        for device_id in sorted(set(filter(None, device_ids)))[:MAX_DEVICE_KEYS]:
+            buckets.append((f'{BUCKET_PREFIX}:{scope}:device:{device_id}', limits['device']))
+
+    for key, rate in buckets:
+        count, period = parse_rate(rate)
+        keys.append(key)
+        args.extend([count, count / (period * 1000.0)])
+    return keys, args
+
+
+def _decision(result):
+    outcome, value = int(result[0]), int(result[1])
+    if outcome == 1:
+        return Throttled(429, max(1, math.ceil(value / 1000)), RATE_LIMITED_MESSAGE)
+    if outcome == 2:
+        return Throttled(503, max(1, value), SHEDDING_MESSAGE)
+    return None
+
+
+def check_ingest_limits(scope, ip, device_ids=()):
+    """
+    Consume one request from the IP and device buckets for `scope`.
+
+    Args:
+        scope (str): 'capture' or 'batch'
+        ip (str): Client IP address, or None to charge only the device buckets
+        device_ids (iterable): Device ids in the payload
+
+    Returns:
+        Throttled or None: Why the request must be refused, or None to admit it
+    """
+    if not get_tracking_setting('RATE_LIMIT_ENABLED', True):
+        return None
+    keys, args = _script_arguments(scope, ip, device_ids)
+    if ip is None and len(keys) == 1:
+        # Nothing to charge; the IP check already looked at the shed flag
+        return None
+    try:
+        conn = get_redis_connection('default')
+        result = conn.register_script(TOKEN_BUCKET_SCRIPT)(keys=keys, args=args)
+    except RedisError as e:
+        logger.warning(f"Rate limiter unavailable, admitting request: {e}")
+        return None
+    return _decision(result)
+
+
+async def async_check_ingest_limits(scope, ip, device_ids=()):
+    """
+    Async counterpart of check_ingest_limits for the ASGI capture views.
+    """
+    if not get_tracking_setting('RATE_LIMIT_ENABLED', True):
+        return None
+    keys, args = _script_arguments(scope, ip, device_ids)
+    if ip is None and len(keys) == 1:
+        # Nothing to charge; the IP check already looked at the shed flag
+        return None
+    try:
+        script = get_async_redis().register_script(TOKEN_BUCKET_SCRIPT)
+        result = await script(keys=keys, args=args)
+    except RedisError as e:
+        logger.warning(f"Rate limiter unavailable, admitting request: {e}")
+        return None
+    return _decision(result)
+
+
+def measure_ingest_health():
+    """
+    Sample the signals that drive load shedding.
+
+    Returns:
+        dict: Database round-trip latency in milliseconds and buffer backlog
+    """
+    started = time.monotonic()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    db_latency_ms = (time.monotonic() - started) * 1000
+
+    backlog = get_buffer_length() if is_buffered_mode() else 0
+    return {'db_latency_ms': round(db_latency_ms, 1), 'backlog': backlog}
+
+
+def update_load_shedding(health):
+    """
+    Raise or clear the global shed flag from a health sample.
+
+    The flag expires after SHED_HOLD_SECONDS, so shedding stops on its own
+    if the health check itself stops running.
+
+    Returns:
+        bool: Whether load shedding is active
+    """
+    overloaded = (
+        health['backlog'] > get_tracking_setting('SHED_BUFFER_BACKLOG', 500000)
+        or health['db_latency_ms'] > get_tracking_setting('SHED_DB_LATENCY_MS', 500)
+    )
+    conn = get_redis_connection('default')
+    if overloaded:
+        retry_after = get_tracking_setting('SHED_RETRY_AFTER', 30)
+        was_shedding = conn.set(
+            SHED_KEY, retry_after, ex=get_tracking_setting('SHED_HOLD_SECONDS', 15), get=True
+        )
+        if was_shedding is None:
+            logger.warning(f"Load shedding enabled for event ingestion: {health}")
+    elif conn.delete(SHED_KEY):
+        logger.info(f"Load shedding disabled for event ingestion: {health}")
+    return overloaded
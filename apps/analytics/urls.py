@@ -1,7 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
-from . import views
+from . import async_views, views
+from .utils import get_tracking_setting
+
+# ASGI deployments serve event ingestion from the native async views
+ingestion_views = async_views if get_tracking_setting('ASYNC_INGESTION', False) else views
 
 # Create a router for ViewSets
 router = DefaultRouter()
@@ -16,16 +20,17 @@ public_router.register(r'feature-flags', views.FeatureFlagViewSet)
 
 urlpatterns = [
     # Public event capture endpoints
-    path('capture/', views.capture, name='capture'),
-    path('batch/', views.batch_capture, name='batch_capture'),
+    path('capture/', ingestion_views.capture, name='capture'),
+    path('batch/', ingestion_views.batch_capture, name='batch_capture'),
     
     # Session management
-    path('session/start/', views.session_start, name='session_start'),
+    path('session/start/', ingestion_views.session_start, name='session_start'),
     path('session/<uuid:session_id>/end/', views.session_end, name='session_end'),
     
     # Public API (for mobile SDKs)
     path('public/', include(public_router.urls)),
     
     # Admin API (requires authentication)
+    path('admin/dimension-cache/', views.dimension_cache_stats, name='dimension_cache_stats'),
     path('admin/', include(router.urls)),
 ] 
\ No newline at end of file
@@ -1,6 +1,71 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
 from django.utils import timezone
+from redis.exceptions import RedisError
 from .models import Event, Session, DeviceInfo, LocationInfo
-from django.db import models
+from . import session_index
+from .copy_loader import copy_events, copy_new_events, insert_new_events
+from .dedup import record_event_ids, seen_event_ids
+from .dimension_cache import (
+    DEVICE_CACHE_FIELDS, LOCATION_CACHE_FIELDS, device_cache, location_cache,
+    changed_device_fields, changed_location_fields, device_from_cache, location_from_cache,
+)
+from .dimension_upsert import upsert_rows
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+logger = logging.getLogger(__name__)
+
+# Payload keys that are normalized into DeviceInfo / LocationInfo rows
+DEVICE_FIELDS = (
+    'device_id', 'app_version', 'os_name', 'os_version',
+    'is_simulator', 'is_rooted_device', 'is_vpn_enabled',
+)
+LOCATION_FIELDS = ('ip_address', 'city', 'country', 'continent')
+
+
+def get_tracking_setting(key, default=None):
+    """
+    Read a value from the EVENT_TRACKING settings dictionary.
+    """
+    return getattr(settings, 'EVENT_TRACKING', {}).get(key, default)
+
+
+def get_client_ip(request):
+    """
+    Return the originating client IP for a request, honouring X-Forwarded-For.
+    
+    Each of the EVENT_TRACKING['TRUSTED_PROXY_COUNT'] proxies in front of
+    the app appends the address it was connected from, so the client is
+    that many hops from the right; anything further left was sent by the
+    client itself and would let it pick its own rate-limit bucket.
+    """
+    proxies = get_tracking_setting('TRUSTED_PROXY_COUNT', 1)
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if proxies and x_forwarded_for:
+        hops = [hop.strip() for hop in x_forwarded_for.split(',')]
+        return hops[-min(proxies, len(hops))]
+    return request.META.get('REMOTE_ADDR')
+
+
+def split_dimension_data(data):
+    """
+    Pop the device and location keys out of an event or session payload.
+    
+    Args:
+        data (dict): Event or session payload. Modified in place.
+        
+    Returns:
+        tuple: (device_data, location_data) dictionaries
+    """
+    device_data = {field: data.pop(field) for field in DEVICE_FIELDS if field in data}
+    location_data = {field: data.pop(field) for field in LOCATION_FIELDS if field in data}
+    return device_data, location_data
 
 
 def get_or_create_device_info(device_data):
@@ -15,6 +80,10 @@ def get_or_create_device_info(device_data):
                         
     Returns:
         DeviceInfo: The retrieved or created DeviceInfo instance
+    
+    This is resolve_devices for a single device: lookups go through the
+    device cache and the database is only written when the device is new,
+    reports changed attributes or is due for a last_seen refresh.
     """
     if not device_data or 'device_id' not in device_data:
         return None
@@ -22,23 +91,7 @@ def get_or_create_device_info(device_data):
     # Extract required fields
     device_id = device_data.pop('device_id')
     
-    # Set defaults for missing fields
-    defaults = {
-        'app_version': '',
-        'os_name': '',
-        'os_version': '',
-    }
-    
-    # Update defaults with provided values
-    defaults.update(device_data)
-    
-    # Get or create device
-    device, _ = DeviceInfo.objects.get_or_create(
-        device_id=device_id,
-        defaults=defaults
-    )
-    
-    return device
+    return device_from_cache(upsert_devices({device_id: device_data})[device_id])
 
 
 def get_or_create_location_info(location_data):
@@ -62,13 +115,7 @@ def get_or_create_location_info(location_data):
     if not ip_address:
         return None
     
-    # Get or create location
-    location, _ = LocationInfo.objects.get_or_create(
-        ip_address=ip_address,
-        defaults=location_data
-    )
-    
-    return location
+    return location_from_cache(upsert_locations({ip_address: location_data})[ip_address])
 
 
 def find_active_session(distinct_id, device_id, timestamp=None):
@@ -87,22 +134,47 @@ def find_active_session(distinct_id, device_id, timestamp=None):
         timestamp = timezone.now()
     
     # Find session based on distinct_id and device_id where event time falls within session
+    return Session.objects.filter(
+        distinct_id=distinct_id,
+        device_id=device_id,
+        start_time__lte=timestamp,
+    ).filter(
+        # Either session has no end time or event timestamp is before session end
+        models.Q(end_time__isnull=True) | models.Q(end_time__gte=timestamp)
+    ).order_by('-start_time').first()
+
+
+def lookup_indexed_sessions(keys):
+    """
+    Look up the open sessions of (distinct_id, device_id) pairs in the session index.
+    
+    Args:
+        keys (iterable): (distinct_id, device_id) pairs
+        
+    Returns:
+        dict or None: Mapping of pair to (session id, start time) for the
+            pairs with an open session, or None when the index is cold or
+            Redis is unavailable and sessions must be matched in the database
+    """
     try:
-        device = DeviceInfo.objects.get(device_id=device_id)
-        session = Session.objects.filter(
-            distinct_id=distinct_id,
-            device=device,
-            start_time__lte=timestamp,
-        ).filter(
-            # Either session has no end time or event timestamp is before session end
-            models.Q(end_time__isnull=True) | models.Q(end_time__gte=timestamp)
-        ).order_by('-start_time').first()
-        
-        return session
-    except DeviceInfo.DoesNotExist:
+        return session_index.lookup_open_sessions(keys)
+    except RedisError as e:
+        logger.warning(f"Session index unavailable, matching sessions in the database: {e}")
         return None
 
 
+def touch_indexed_sessions(activity):
+    """
+    Advance the last activity of indexed sessions once the transaction commits.
+    
+    Args:
+        activity (dict): Mapping of (distinct_id, device_id) to
+            (session id, latest event timestamp)
+    """
+    if activity:
+        session_index.update_on_commit(session_index.touch_sessions, activity)
+
+
 def create_event(event_data):
     """
     Create an event with proper normalization of device and location data.
@@ -113,53 +185,532 @@ def create_event(event_data):
             Optional device keys: device_id, app_version, os_name, os_version,
                                   is_simulator, is_rooted_device, is_vpn_enabled
             Optional location keys: ip_address, city, country, continent
+            Optional event_id: Client-generated UUID used to drop retries
             Other data: Any other event-specific data
             
     Returns:
         Event: The created event instance
     """
-    # Extract device data from event data
-    device_data = {}
-    for field in ['device_id', 'app_version', 'os_name', 'os_version', 
-                  'is_simulator', 'is_rooted_device', 'is_vpn_enabled']:
-        if field in event_data:
-            device_data[field] = event_data.pop(field)
-            
-    # Extract location data from event data
-    location_data = {}
-    for field in ['ip_address', 'city', 'country', 'continent']:
-        if field in event_data:
-            location_data[field] = event_data.pop(field)
+    # A client-supplied event id makes retries idempotent
+    event_id = event_data.pop('event_id', None)
+    if event_id:
+        if find_duplicate_event_ids([event_id]) or (
+            'timestamp' not in event_data and find_stored_event_ids([event_id])
+        ):
+            # Only retries pay for loading the stored row
+            existing = Event.objects.filter(id=event_id).first()
+            if existing:
+                return existing
+        event_data['id'] = event_id
+    
+    # Extract device and location data from event data
+    device_data, location_data = split_dimension_data(event_data)
             
     # Get or create device and location records
     device = get_or_create_device_info(device_data)
     location = get_or_create_location_info(location_data)
     
     # Check if there's an active session we can associate this event with
-    session = None
-    if device and 'distinct_id' in event_data:
-        session = find_active_session(
-            event_data['distinct_id'], 
-            device.device_id,
-            event_data.get('timestamp', timezone.now())
-        )
+    session = event_data.pop('session', None)
+    session_id = getattr(session, 'pk', session)
+    session_key = None
+    if session_id is None and device and 'distinct_id' in event_data:
+        session_key = (event_data['distinct_id'], device.device_id)
+        timestamp = event_data.get('timestamp', timezone.now())
+        indexed = lookup_indexed_sessions([session_key])
+        if indexed is None or (session_key in indexed and indexed[session_key][1] > timestamp):
+            # Cold index, or an event older than the open session
+            session = find_active_session(*session_key, timestamp)
+            session_id = session.pk if session else None
+        elif session_key in indexed:
+            session_id = indexed[session_key][0]
     
     # Create the event
-    event = Event.objects.create(
-        device=device,
-        location=location,
-        session=session,
-        **event_data
-    )
+    try:
+        with transaction.atomic():
+            event = Event.objects.create(
+                device=device,
+                location=location,
+                session_id=session_id,
+                **event_data
+            )
+    except IntegrityError:
+        # A retry older than the dedup window or racing the first write
+        existing = Event.objects.filter(id=event_id).first() if event_id else None
+        if existing is None:
+            raise
+        return existing
+    if event_id:
+        transaction.on_commit(partial(remember_event_ids, [event_id]))
     
-    # Update event count on session if we found one
-    if session:
-        session.events_count = session.events_count + 1
-        session.save(update_fields=['events_count'])
+    # Update event count and last activity on session if we found one
+    if session_id is not None:
+        record_session_activity({session_id: (1, event.timestamp)})
+        if session_key:
+            touch_indexed_sessions({session_key: (session_id, event.timestamp)})
     
     return event
 
 
+def upsert_devices(device_rows):
+    """
+    Write the devices of a batch and return their cached rows.
+    
+    Devices found in the device cache with the same attributes and a
+    recent last_seen need no database work. The others are written with
+    one INSERT ... ON CONFLICT DO UPDATE that only rewrites rows whose
+    attributes changed or whose last_seen is older than
+    DEVICE_LAST_SEEN_REFRESH_SECONDS. The cache is only updated once the
+    surrounding transaction commits.
+    
+    Args:
+        device_rows (dict): Mapping of device_id to the device attributes
+            seen for it in the batch
+            
+    Returns:
+        dict: Mapping of device_id to its cached column values
+    """
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=get_tracking_setting('DEVICE_LAST_SEEN_REFRESH_SECONDS', 3600))
+    
+    cached = device_cache.get_many(device_rows)
+    pending = {
+        device_id: attributes for device_id, attributes in device_rows.items()
+        if device_id not in cached
+        or changed_device_fields(cached[device_id], attributes)
+        or (cached[device_id].get('last_seen') or stale_before) <= stale_before
+    }
+    if not pending:
+        return cached
+    
+    upsert_rows(
+        DeviceInfo, 'device_id', pending,
+        insert_defaults={'app_version': '', 'os_name': '', 'os_version': ''},
+        touch=('last_seen', now, stale_before),
+    )
+    
+    # Cached devices now hold the reported attributes; the others are read back
+    refreshed = {
+        device_id: {**cached[device_id], **attributes, 'last_seen': now}
+        for device_id, attributes in pending.items()
+        if device_id in cached
+    }
+    missing = [device_id for device_id in pending if device_id not in cached]
+    if missing:
+        refreshed.update(
+            (row['device_id'], row) for row in
+            DeviceInfo.objects.filter(device_id__in=missing).values(*DEVICE_CACHE_FIELDS)
+        )
+    # A rolled-back batch must not leave devices in the cache that were
+    # never stored, or later events would skip the upsert and break the FK
+    transaction.on_commit(partial(device_cache.set_many, refreshed))
+    cached.update(refreshed)
+    return cached
+
+
+def resolve_devices(device_rows):
+    """
+    Make sure a DeviceInfo row exists for every device in a batch.
+    
+    Args:
+        device_rows (dict): Mapping of device_id to the device attributes
+            seen for it in the batch
+            
+    Returns:
+        set: The device_ids that are guaranteed to exist
+    """
+    if not device_rows:
+        return set()
+    
+    upsert_devices(device_rows)
+    return set(device_rows)
+
+
+def upsert_locations(location_rows):
+    """
+    Write the locations of a batch and return their cached rows.
+    
+    Locations found in the location cache with the same attributes need
+    no database work; the others are written with one INSERT ... ON
+    CONFLICT DO UPDATE that only rewrites rows whose attributes changed.
+    The cache is only updated once the surrounding transaction commits.
+    
+    Args:
+        location_rows (dict): Mapping of ip_address to the location
+            attributes seen for it in the batch
+            
+    Returns:
+        dict: Mapping of ip_address to its cached column values
+    """
+    cached = location_cache.get_many(location_rows)
+    pending = {
+        ip: attributes for ip, attributes in location_rows.items()
+        if ip not in cached or changed_location_fields(cached[ip], attributes)
+    }
+    if not pending:
+        return cached
+    
+    upsert_rows(LocationInfo, 'ip_address', pending)
+    
+    refreshed = {
+        ip: {**cached[ip], **attributes}
+        for ip, attributes in pending.items()
+        if ip in cached
+    }
+    missing = [ip for ip in pending if ip not in cached]
+    if missing:
+        # New rows need their primary keys, so read them back
+        refreshed.update(
+            (row['ip_address'], row) for row in
+            LocationInfo.objects.filter(ip_address__in=missing).values(*LOCATION_CACHE_FIELDS)
+        )
+    transaction.on_commit(partial(location_cache.set_many, refreshed))
+    cached.update(refreshed)
+    return cached
+
+
+def resolve_locations(location_rows):
+    """
+    Get or create LocationInfo rows for every IP address in a batch.
+    
+    Args:
+        location_rows (dict): Mapping of ip_address to the location
+            attributes seen for it in the batch
+            
+    Returns:
+        dict: Mapping of ip_address to LocationInfo primary key
+    """
+    if not location_rows:
+        return {}
+    
+    return {ip: values['id'] for ip, values in upsert_locations(location_rows).items()}
+
+
+def find_active_sessions(keys, min_timestamp, max_timestamp):
+    """
+    Load every session that may own an event in a batch.
+    
+    Args:
+        keys (set): (distinct_id, device_id) pairs present in the batch
+        min_timestamp (datetime): Earliest event timestamp in the batch
+        max_timestamp (datetime): Latest event timestamp in the batch
+        
+    Returns:
+        dict: Mapping of (distinct_id, device_id) to candidate sessions,
+            newest first
+    """
+    if not keys:
+        return {}
+    
+    sessions = Session.objects.filter(
+        distinct_id__in={distinct_id for distinct_id, _ in keys},
+        device_id__in={device_id for _, device_id in keys},
+        start_time__lte=max_timestamp,
+    ).filter(
+        models.Q(end_time__isnull=True) | models.Q(end_time__gte=min_timestamp)
+    ).only('id', 'distinct_id', 'device_id', 'start_time', 'end_time').order_by('-start_time')
+    
+    candidates = defaultdict(list)
+    for session in sessions:
+        key = (session.distinct_id, session.device_id)
+        if key in keys:
+            candidates[key].append(session)
+    
+    return candidates
+
+
+def match_session(candidates, timestamp):
+    """
+    Pick the session an event belongs to, mirroring find_active_session.
+    
+    Args:
+        candidates (list): Sessions for the event's user and device, newest first
+        timestamp (datetime): Event timestamp
+        
+    Returns:
+        Session or None: The matching session
+    """
+    for session in candidates:
+        if session.start_time <= timestamp and (
+            session.end_time is None or session.end_time >= timestamp
+        ):
+            return session
+    return None
+
+
+def is_events_table_partitioned():
+    """
+    Whether analytics_event was converted to a partitioned table.
+    """
+    # partitioning imports this module
+    from .partitioning import is_partitioned
+    return connection.vendor == 'postgresql' and is_partitioned()
+
+
+def bulk_create_events(events_data, batch_size=1000):
+    """
+    Create many events with a fixed number of queries.
+    
+    This is the batched counterpart of create_event. Devices and locations
+    for the whole batch are resolved with set-based queries and sessions
+    with one lookup in the session index, the events are written with a
+    single bulk_create, or COPY for large batches, and the session
+    counters are bumped with one UPDATE per chunk of sessions.
+    
+    Args:
+        events_data (list): List of event dictionaries in the format
+            accepted by create_event. The dictionaries are modified in place.
+            'session' may be a Session instance or a session id.
+        batch_size (int): Maximum number of rows per INSERT statement
+            
+    Returns:
+        list: The created Event instances, in input order. Events whose
+            event_id already exists are skipped and not counted towards
+            their session.
+    """
+    if not events_data:
+        return []
+    
+    now = timezone.now()
+    device_rows = {}
+    location_rows = {}
+    rows = []
+    
+    # Drop events whose client-supplied id was already stored or repeats
+    # within the batch, so replays of the same payload are idempotent
+    event_ids = {
+        event_data['event_id'] for event_data in events_data
+        if event_data.get('event_id')
+    }
+    seen_ids = find_duplicate_event_ids(event_ids) if event_ids else set()
+    new_ids = []
+    
+    # Normalize payloads and collect the distinct dimensions of the batch
+    unstamped_ids = []
+    for event_data in events_data:
+        event_id = event_data.pop('event_id', None)
+        if event_id:
+            if str(event_id) in seen_ids:
+                continue
+            seen_ids.add(str(event_id))
+            new_ids.append(event_id)
+            event_data['id'] = event_id
+        
+        device_data, location_data = split_dimension_data(event_data)
+        if 'timestamp' not in event_data:
+            event_data['timestamp'] = now
+            if event_id:
+                unstamped_ids.append(event_id)
+        
+        device_id = device_data.pop('device_id', None)
+        if device_id:
+            device_rows.setdefault(device_id, {}).update(device_data)
+        
+        ip_address = location_data.pop('ip_address', None)
+        if ip_address:
+            location_rows.setdefault(ip_address, {}).update(location_data)
+        
+        rows.append((event_data, device_id, ip_address))
+    
+    stored = find_stored_event_ids(unstamped_ids)
+    if stored:
+        rows = [row for row in rows if str(row[0].get('id')) not in stored]
+        new_ids = [event_id for event_id in new_ids if str(event_id) not in stored]
+    
+    if not rows:
+        return []
+    
+    with transaction.atomic():
+        device_ids = resolve_devices(device_rows)
+        location_ids = resolve_locations(location_rows)
+        
+        # Sessions named explicitly by the client must still exist
+        explicit_session_ids = {
+            str(getattr(session, 'pk', session))
+            for session in (event_data.get('session') for event_data, _, _ in rows)
+            if session
+        }
+        if explicit_session_ids:
+            explicit_session_ids = {
+                str(session_id) for session_id in
+                Session.objects.filter(id__in=explicit_session_ids).values_list('id', flat=True)
+            }
+        
+        session_keys = {
+            (event_data['distinct_id'], device_id)
+            for event_data, device_id, _ in rows
+            if device_id and 'distinct_id' in event_data
+        }
+        indexed = lookup_indexed_sessions(session_keys) if session_keys else {}
+        if indexed is None:
+            # Cold index: match every pair in the database
+            database_keys = session_keys
+            indexed = {}
+        else:
+            # Only events older than their indexed open session need the database
+            database_keys = {
+                (event_data['distinct_id'], device_id)
+                for event_data, device_id, _ in rows
+                if (event_data.get('distinct_id'), device_id) in indexed
+                and event_data['timestamp'] < indexed[(event_data['distinct_id'], device_id)][1]
+            }
+        sessions = {}
+        if database_keys:
+            timestamps = [event_data['timestamp'] for event_data, _, _ in rows]
+            sessions = find_active_sessions(database_keys, min(timestamps), max(timestamps))
+        
+        events = []
+        # Session key of each event matched through the index, else None
+        index_keys = []
+        for event_data, device_id, ip_address in rows:
+            session_id = event_data.pop('session', None)
+            session_id = getattr(session_id, 'pk', session_id)
+            if session_id is not None and str(session_id) not in explicit_session_ids:
+                session_id = None
+            index_key = None
+            if session_id is None and device_id in device_ids:
+                key = (event_data.get('distinct_id'), device_id)
+                hit = indexed.get(key)
+                if hit and hit[1] <= event_data['timestamp']:
+                    session_id = hit[0]
+                    index_key = key
+                elif key in database_keys:
+                    session = match_session(sessions.get(key, ()), event_data['timestamp'])
+                    session_id = session.id if session else None
+            
+            events.append(Event(
+                device_id=device_id if device_id in device_ids else None,
+                location_id=location_ids.get(ip_address),
+                session_id=session_id,
+                **event_data
+            ))
+            index_keys.append(index_key)
+        
+        copy = len(events) >= get_tracking_setting('COPY_MIN_ROWS', 500)
+        if event_ids:
+            # Conflicts are a concurrent writer storing the same event_id or a
+            # retry that arrived after the dedup window; only the rows really
+            # inserted may count towards their sessions
+            inserted = copy_new_events(events) if copy else insert_new_events(events, batch_size=batch_size)
+            to_pk = Event._meta.pk.to_python
+            kept = [
+                (event, index_key) for event, index_key in zip(events, index_keys)
+                if to_pk(event.pk) in inserted
+            ]
+            events = [event for event, _ in kept]
+            index_keys = [index_key for _, index_key in kept]
+        elif copy:
+            copy_events(events)
+        else:
+            Event.objects.bulk_create(events, batch_size=batch_size)
+        
+        session_activity = {}
+        indexed_activity = {}
+        for event, index_key in zip(events, index_keys):
+            if event.session_id is None:
+                continue
+            count, last_event_at = session_activity.get(event.session_id, (0, event.timestamp))
+            session_activity[event.session_id] = (count + 1, max(last_event_at, event.timestamp))
+            if index_key is not None:
+                _, last_event_at = indexed_activity.get(index_key, (event.session_id, event.timestamp))
+                indexed_activity[index_key] = (event.session_id, max(last_event_at, event.timestamp))
+        
+        record_session_activity(session_activity)
+        touch_indexed_sessions(indexed_activity)
+        
+        # Only ids whose rows are committed enter the dedup window, so a
+        # rolled-back or crashed write can still be retried
+        if new_ids:
+            transaction.on_commit(partial(remember_event_ids, new_ids))
+    
+    return events
+
+
+def find_stored_event_ids(event_ids):
+    """
+    Return the ids, among events sent without a timestamp, that are already stored.
+    
+    Such events are stamped with the server time, and the primary key of a
+    partitioned events table is (id, timestamp), so a retry would not
+    conflict with the stored row; its id has to be looked up. On a plain
+    table the primary key alone rejects it.
+    
+    Args:
+        event_ids (iterable): Client-supplied ids of events without a timestamp
+        
+    Returns:
+        set: String form of the ids that are already stored
+    """
+    event_ids = list(event_ids)
+    if not event_ids or not is_events_table_partitioned():
+        return set()
+    return {
+        str(event_id) for event_id in
+        Event.objects.filter(id__in=event_ids).values_list('id', flat=True)
+    }
+
+
+def find_duplicate_event_ids(event_ids):
+    """
+    Return the event ids that were already stored.
+    
+    The Redis dedup window answers without touching the events table; the
+    table is only queried when Redis is unavailable.
+    
+    Args:
+        event_ids (iterable): Client-supplied event ids
+        
+    Returns:
+        set: String form of the ids that are duplicates
+    """
+    try:
+        return seen_event_ids(event_ids)
+    except RedisError as e:
+        logger.warning(f"Dedup window unavailable, checking event ids in the database: {e}")
+    return {
+        str(event_id) for event_id in
+        Event.objects.filter(id__in=list(event_ids)).values_list('id', flat=True)
+    }
+
+
+def remember_event_ids(event_ids):
+    """
+    Add committed event ids to the dedup window.
+    """
+    try:
+        record_event_ids(event_ids)
+    except RedisError as e:
+        # The primary key still rejects the duplicates, just less cheaply
+        logger.warning(f"Could not record {len(event_ids)} event ids in the dedup window: {e}")
+
+
+def record_session_activity(activity, chunk_size=500):
+    """
+    Add event counts to sessions and advance their last_event_at.
+    
+    Sessions are updated with one UPDATE per chunk of sessions; the new
+    values are picked per row with CASE, and last_event_at only moves
+    forward, so late events never rewind it.
+    
+    Args:
+        activity (dict): Mapping of session id to
+            (number of new events, latest new event timestamp)
+        chunk_size (int): Maximum number of sessions per UPDATE
+    """
+    session_ids = sorted(activity, key=str)
+    for offset in range(0, len(session_ids), chunk_size):
+        chunk = session_ids[offset:offset + chunk_size]
+        counts = [When(pk=session_id, then=Value(activity[session_id][0])) for session_id in chunk]
+        latest = [When(pk=session_id, then=Value(activity[session_id][1])) for session_id in chunk]
+        Session.objects.filter(pk__in=chunk).update(
+            events_count=F('events_count') + Case(*counts, output_field=models.IntegerField()),
+            last_event_at=Greatest(
+                Coalesce('last_event_at', 'start_time'),
+                Case(*latest, output_field=models.DateTimeField()),
+            ),
+        )
+
+
 def create_session(session_data):
     """
     Create a session with proper normalization of device and location data.
@@ -175,23 +726,16 @@ def create_session(session_data):
     Returns:
         Session: The created session instance
     """
-    # Extract device data from session data
-    device_data = {}
-    for field in ['device_id', 'app_version', 'os_name', 'os_version', 
-                  'is_simulator', 'is_rooted_device', 'is_vpn_enabled']:
-        if field in session_data:
-            device_data[field] = session_data.pop(field)
-            
-    # Extract location data from session data
-    location_data = {}
-    for field in ['ip_address', 'city', 'country', 'continent']:
-        if field in session_data:
-            location_data[field] = session_data.pop(field)
+    # Extract device and location data from session data
+    device_data, location_data = split_dimension_data(session_data)
             
     # Get or create device and location records
     device = get_or_create_device_info(device_data)
     location = get_or_create_location_info(location_data)
     
+    # A new session is as idle as its start until events arrive
+    session_data.setdefault('last_event_at', session_data.get('start_time'))
+    
     # Create the session
     session = Session.objects.create(
         device=device,
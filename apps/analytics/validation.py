@@ -0,0 +1,421 @@
+"""
+Lightweight validation of ingestion payloads.
+
+The capture endpoints receive plain JSON dicts at high volume. Instead of
+running the ModelSerializer machinery per event, each payload is checked
+against a schema of small converter functions compiled once at import.
+The accepted fields, the cleaned output (the same dict EventSerializer
+puts in validated_data) and the error messages match the serializers, so
+clients see the same 400 responses. The differences are deliberate:
+
+* session: only its format is checked here, and bulk_create_events
+  ignores ids of sessions that do not exist instead of rejecting the event
+* the write-only device and location strings are held to the lengths of
+  their DeviceInfo/LocationInfo columns, which the serializers leave
+  unbounded (an overlong value fails there only when the row is written)
+* start_time is set by the server, so session payloads do not carry it
+"""
+import math
+import uuid
+from datetime import datetime
+
+from django.core.validators import validate_ipv46_address
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.ipv6 import clean_ipv6_address
+
+from .parsers import InvalidItem
+from .utils import get_tracking_setting
+
+REQUIRED = 'This field is required.'
+NULL = 'This field may not be null.'
+BLANK = 'This field may not be blank.'
+INVALID_STRING = 'Not a valid string.'
+MAX_LENGTH = 'Ensure this field has no more than {max_length} characters.'
+NULL_CHARACTERS = 'Null characters are not allowed.'
+SURROGATE_CHARACTERS = 'Surrogate characters are not allowed: U+{code_point:X}.'
+INVALID_BOOLEAN = 'Must be a valid boolean.'
+INVALID_NUMBER = 'A valid number is required.'
+INVALID_IP = 'Enter a valid IPv4 or IPv6 address.'
+INVALID_UUID = 'Must be a valid UUID.'
+INVALID_DATETIME = (
+    'Datetime has wrong format. Use one of these formats instead: '
+    'YYYY-MM-DDThh:mm[:ss[.uuuuuu]][+HH:MM|-HH:MM|Z].'
+)
+# Raised by the model's UUIDField when a session id is not a UUID
+INVALID_PK = '“{pk_value}” is not a valid UUID.'
+NO_DATA = 'No data provided'
+INVALID_OBJECT = 'Invalid data. Expected a dictionary, but got {datatype}.'
+NOT_A_LIST = 'Expected a list of items but got type "{input_type}".'
+LIST_TOO_SHORT = 'Ensure this field has at least {min_length} elements.'
+LIST_TOO_LONG = 'Ensure this field has no more than {max_length} elements.'
+STREAM_TOO_LONG = 'Uploads are limited to {max_events} events; the rest were not stored.'
+
+# Streamed uploads report at most this many rejected events
+MAX_REPORTED_ERRORS = 100
+
+TRUE_VALUES = {True, 1, 'true', 'True', 'TRUE', '1', 'yes', 'Yes', 'YES', 'y', 'Y', 'on', 'On', 'ON', 't', 'T'}
+FALSE_VALUES = {False, 0, 'false', 'False', 'FALSE', '0', 'no', 'No', 'NO', 'n', 'N', 'off', 'Off', 'OFF', 'f', 'F'}
+
+
+class FieldError(Exception):
+    pass
+
+
+def string(max_length=None):
+    def convert(value):
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise FieldError(INVALID_STRING)
+        value = str(value).strip()
+        if not value:
+            raise FieldError(BLANK)
+        if max_length is not None and len(value) > max_length:
+            raise FieldError(MAX_LENGTH.format(max_length=max_length))
+        error = text_error(value)
+        if error:
+            raise FieldError(error)
+        return value
+    return convert
+
+
+def text_error(value):
+    """
+    Return the error for a string PostgreSQL cannot store, or None.
+
+    Text columns and jsonb reject NUL, and lone surrogates cannot be
+    encoded as UTF-8. CharField checks both with its default validators.
+    """
+    if '\x00' in value:
+        return NULL_CHARACTERS
+    if not value.isascii():
+        for char in value:
+            if '\ud800' <= char <= '\udfff':
+                return SURROGATE_CHARACTERS.format(code_point=ord(char))
+    return None
+
+
+def json_text_error(value):
+    """
+    Return the text_error of the first offending key or string in a JSON value.
+    """
+    if isinstance(value, str):
+        return text_error(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            error = (isinstance(key, str) and text_error(key)) or json_text_error(item)
+            if error:
+                return error
+    elif isinstance(value, list):
+        for item in value:
+            error = json_text_error(item)
+            if error:
+                return error
+    return None
+
+
+def boolean(value):
+    try:
+        if value in TRUE_VALUES:
+            return True
+        if value in FALSE_VALUES:
+            return False
+    except TypeError:
+        # Unhashable values such as lists or dicts
+        pass
+    raise FieldError(INVALID_BOOLEAN)
+
+
+def number(value):
+    # Like FloatField, booleans count as 1.0 and 0.0
+    if isinstance(value, str):
+        value = value.strip()
+    try:
+        value = float(value)
+    except (TypeError, ValueError, OverflowError):
+        raise FieldError(INVALID_NUMBER)
+    # float() accepts 'nan', 'inf' and '1e999', which FloatField rejects
+    if not math.isfinite(value):
+        raise FieldError(INVALID_NUMBER)
+    return value
+
+
+def ip_address(value):
+    if not isinstance(value, str):
+        raise FieldError(INVALID_IP)
+    value = value.strip()
+    # IPAddressField is a CharField, so blank values get the blank message
+    if not value:
+        raise FieldError(BLANK)
+    try:
+        validate_ipv46_address(value)
+    except DjangoValidationError:
+        raise FieldError(INVALID_IP)
+    if ':' in value:
+        # Same canonical form as IPAddressField and the database, so that
+        # resolve_locations finds the row again
+        value = clean_ipv6_address(value, unpack_ipv4=True)
+    return value
+
+
+def _to_uuid(value):
+    # Integers are read as the 128-bit value, as both UUIDFields do
+    if isinstance(value, uuid.UUID):
+        return value
+    if isinstance(value, int):
+        return uuid.UUID(int=value)
+    if isinstance(value, str):
+        return uuid.UUID(hex=value)
+    raise ValueError(value)
+
+
+def uuid_value(value):
+    try:
+        return _to_uuid(value)
+    except ValueError:
+        raise FieldError(INVALID_UUID)
+
+
+def date_time(value):
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = parse_datetime(value) if isinstance(value, str) else None
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise FieldError(INVALID_DATETIME)
+    # Like DateTimeField, aware values are converted to the current time zone
+    if timezone.is_naive(parsed):
+        return timezone.make_aware(parsed)
+    return parsed.astimezone(timezone.get_current_timezone())
+
+
+def session_pk(value):
+    # Existence is checked by bulk_create_events for the whole batch at once
+    try:
+        return _to_uuid(value)
+    except ValueError:
+        raise FieldError(INVALID_PK.format(pk_value=value))
+
+
+def json_value(value):
+    error = json_text_error(value)
+    if error:
+        raise FieldError(error)
+    return value
+
+
+def object_error(data):
+    if data is None:
+        return NO_DATA
+    return INVALID_OBJECT.format(datatype=type(data).__name__)
+
+
+class Field:
+    """
+    One schema entry: a converter plus required/null handling.
+    """
+
+    def __init__(self, convert, required=False, allow_null=False):
+        self.convert = convert
+        self.required = required
+        self.allow_null = allow_null
+
+
+class Schema:
+    """
+    Validates plain dicts against a fixed set of fields.
+    """
+
+    def __init__(self, fields):
+        self.fields = tuple(fields.items())
+
+    def validate(self, data):
+        """
+        Validate one payload.
+
+        Args:
+            data: Decoded JSON value for one object
+
+        Returns:
+            tuple: (cleaned data, errors); errors is an empty dict when valid
+        """
+        if not isinstance(data, dict):
+            return None, {'non_field_errors': [object_error(data)]}
+
+        cleaned = {}
+        errors = {}
+        for name, field in self.fields:
+            if name not in data:
+                if field.required:
+                    errors[name] = [REQUIRED]
+                continue
+            value = data[name]
+            if value is None:
+                if field.allow_null:
+                    cleaned[name] = None
+                else:
+                    errors[name] = [NULL]
+                continue
+            try:
+                cleaned[name] = field.convert(value)
+            except FieldError as e:
+                errors[name] = [str(e)]
+        return cleaned, errors
+
+
+DEVICE_SCHEMA_FIELDS = {
+    'device_id': Field(string(100), required=True),
+    'app_version': Field(string(50), required=True),
+    'os_name': Field(string(50), required=True),
+    'os_version': Field(string(50), required=True),
+    'is_simulator': Field(boolean),
+    'is_rooted_device': Field(boolean),
+    'is_vpn_enabled': Field(boolean),
+    'ip_address': Field(ip_address),
+    'city': Field(string(100)),
+    'country': Field(string(100)),
+    'continent': Field(string(100)),
+    'latitude': Field(number, allow_null=True),
+    'longitude': Field(number, allow_null=True),
+    'app_check_result': Field(boolean, allow_null=True),
+}
+
+event_schema = Schema({
+    'event_id': Field(uuid_value),
+    'distinct_id': Field(string(200), required=True),
+    'event_type': Field(string(100), required=True),
+    'properties': Field(json_value),
+    'timestamp': Field(date_time),
+    'session': Field(session_pk, allow_null=True),
+    **DEVICE_SCHEMA_FIELDS,
+})
+
+session_schema = Schema({
+    'distinct_id': Field(string(200), required=True),
+    'end_time': Field(date_time, allow_null=True),
+    **DEVICE_SCHEMA_FIELDS,
+})
+
+
+def validate_event(data):
+    return event_schema.validate(data)
+
+
+def validate_session(data):
+    return session_schema.validate(data)
+
+
+def validate_batch(data, max_size=None):
+    """
+    Validate a batch upload of the form {"batch": [event, ...]}.
+
+    Batches are capped at EVENT_TRACKING['MAX_BATCH_SIZE'] events unless
+    `max_size` is given.
+
+    Returns:
+        tuple: (list of cleaned events, errors) with errors keyed like
+            BatchEventSerializer's, e.g. {'batch': {3: {'event_type': [...]}}}
+    """
+    if not isinstance(data, dict):
+        return None, {'non_field_errors': [object_error(data)]}
+    if 'batch' not in data:
+        return None, {'batch': [REQUIRED]}
+
+    max_size = max_size or get_tracking_setting('MAX_BATCH_SIZE', 1000)
+    batch = data['batch']
+    if batch is None:
+        return None, {'batch': [NULL]}
+    if not isinstance(batch, list):
+        return None, {'batch': [NOT_A_LIST.format(input_type=type(batch).__name__)]}
+    if len(batch) < 1:
+        return None, {'batch': [LIST_TOO_SHORT.format(min_length=1)]}
+    if len(batch) > max_size:
+        return None, {'batch': [LIST_TOO_LONG.format(max_length=max_size)]}
+
+    cleaned_events = []
+    item_errors = {}
+    validate = event_schema.validate
+    for index, item in enumerate(batch):
+        if item is None:
+            # ListField checks its items for null before the child serializer
+            item_errors[index] = [NULL]
+            continue
+        cleaned, errors = validate(item)
+        if errors:
+            item_errors[index] = errors
+        else:
+            cleaned_events.append(cleaned)
+    if item_errors:
+        return None, {'batch': item_errors}
+    return cleaned_events, {}
+
+
+def validate_stream(items, chunk_size=None, max_events=None):
+    """
+    Validate a streamed upload in chunks of MAX_BATCH_SIZE events.
+
+    Invalid events are reported and skipped rather than failing the upload,
+    so each chunk can be stored before the next one is decoded.
+
+    Yields:
+        tuple: (cleaned events of the chunk, errors keyed by position in the
+            upload, number of upload items consumed so far)
+    """
+    chunk_size = chunk_size or get_tracking_setting('MAX_BATCH_SIZE', 1000)
+    max_events = max_events or get_tracking_setting('STREAM_MAX_EVENTS', 100000)
+    validate = event_schema.validate
+
+    chunk = []
+    errors = {}
+    consumed = 0
+    for index, item in enumerate(items):
+        if index >= max_events:
+            errors[index] = {'non_field_errors': [STREAM_TOO_LONG.format(max_events=max_events)]}
+            break
+        consumed = index + 1
+        if isinstance(item, InvalidItem):
+            errors[index] = {'non_field_errors': [item.message]}
+            continue
+        cleaned, item_errors = validate(item)
+        if item_errors:
+            errors[index] = item_errors
+        else:
+            chunk.append(cleaned)
+        if len(chunk) >= chunk_size:
+            yield chunk, errors, consumed
+            chunk, errors = [], {}
+    if chunk or errors:
+        yield chunk, errors, consumed
+
+
+def stream_summary(stored, errors):
+    """
+    Build the response body and status code for a streamed upload.
+
+    Returns:
+        tuple: (payload, HTTP status code)
+    """
+    reported = dict(sorted(errors.items())[:MAX_REPORTED_ERRORS])
+    if not stored:
+        if errors:
+            return {'batch': reported}, 400
+        return {'batch': [LIST_TOO_SHORT.format(min_length=1)]}, 400
+
+    payload = {'status': 'success', 'event_count': stored}
+    if errors:
+        payload['rejected_count'] = len(errors)
+        payload['errors'] = {'batch': reported}
+    return payload, 202
+
+
+def stream_progress(stored, resume_from):
+    """
+    Body fields for an upload interrupted after some chunks were stored.
+
+    The client resends the upload from position `resume_from`; the events
+    before it were stored or rejected already.
+    """
+    return {'event_count': stored, 'resume_from': resume_from}
@@ -1,17 +1,77 @@
+from datetime import datetime, time
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from django.db.models import Count, F
+from django.utils.dateparse import parse_date, parse_datetime
+from django.db import transaction
+from django.db.models import F
 from rest_framework import viewsets, status, mixins
-from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.decorators import api_view, parser_classes, permission_classes, action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import APIException, ValidationError
 
 from .models import Event, Session, FeatureFlag, EventAggregate
 from .serializers import (
-    EventSerializer, BatchEventSerializer, SessionSerializer,
+    EventSerializer, SessionSerializer,
     FeatureFlagSerializer, EventAggregateSerializer
 )
-from .tasks import process_event, process_event_batch
+from .aggregation import estimate_unique_users
+from .buffer import BufferFull, enqueue_events, is_buffered_mode
+from .dashboard_queries import get_event_counts
+from .dimension_cache import cache_stats
+from .export import EXPORT_FORMATS, ExportUnavailable, aiter_chunks, export_rows, stream_export
+from .feature_flags import get_snapshot
+from .pagination import KeysetPagination
+from .parsers import BATCH_PARSER_CLASSES, EventStream
+from .rollup_cube import DIMENSIONS, breakdown
+from .session_aggregation import record_ended_sessions
+from .throttling import check_ingest_limits
+from .utils import bulk_create_events, get_client_ip
+from .validation import stream_progress, stream_summary, validate_batch, validate_event, validate_stream
+
+
+def parse_range_param(value):
+    """
+    Parse an ISO date or datetime query parameter into an aware datetime.
+    """
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            parsed_date = parse_date(value)
+            if parsed_date is None:
+                return None
+            parsed = datetime.combine(parsed_date, time.min)
+    except ValueError:
+        return None
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def buffer_full_response(progress=None):
+    """
+    Ask the client to retry later when the ingestion buffer is saturated.
+    
+    Args:
+        progress (dict, optional): stream_progress of a partly stored upload
+    """
+    response = Response({'error': 'Event buffer is full, retry later', **(progress or {})},
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    response['Retry-After'] = '30'
+    return response
+
+
+def throttled_response(throttled):
+    """
+    Refuse a capture request that hit a rate limit or arrived while shedding load.
+    """
+    response = Response({'error': throttled.message}, status=throttled.status_code)
+    response['Retry-After'] = str(throttled.retry_after)
+    return response
 
 
 @api_view(['POST'])
@@ -19,35 +79,107 @@ def capture(request):
     """
     Public endpoint to capture events from mobile apps.
     """
-    serializer = EventSerializer(data=request.data, context={'request': request})
-    if serializer.is_valid():
-        # Save the event
-        event = serializer.save()
-        
-        # Queue for background processing
-        process_event.delay(str(event.id))
-        
+    # The IP bucket is charged before the body is even parsed
+    client_ip = get_client_ip(request)
+    throttled = check_ingest_limits('capture', client_ip)
+    if throttled:
+        return throttled_response(throttled)
+    
+    # Plain-dict validation; no serializer machinery or queries per event
+    event_data, errors = validate_event(request.data)
+    if errors:
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    throttled = check_ingest_limits('capture', None, [event_data['device_id']])
+    if throttled:
+        return throttled_response(throttled)
+    if not event_data.get('ip_address'):
+        event_data['ip_address'] = client_ip
+    
+    if is_buffered_mode():
+        # Append to the write-behind buffer; the flusher stores it
+        try:
+            enqueue_events([event_data])
+        except BufferFull:
+            return buffer_full_response()
         return Response({'status': 'success'}, status=status.HTTP_202_ACCEPTED)
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Save the event; process_pending_events picks it up
+    bulk_create_events([event_data])
+    
+    return Response({'status': 'success'}, status=status.HTTP_202_ACCEPTED)
 
 
 @api_view(['POST'])
+@parser_classes(BATCH_PARSER_CLASSES)
 def batch_capture(request):
     """
     Public endpoint to capture multiple events at once.
+    
+    Accepts a JSON {"batch": [...]} object, or NDJSON / msgpack streams that
+    are stored chunk by chunk; any of them may be gzip or zstd encoded.
     """
-    serializer = BatchEventSerializer(data=request.data, context={'request': request})
-    if serializer.is_valid():
-        # Save all events
-        result = serializer.save()
-        
-        # Queue batch for processing
-        event_ids = [str(event.id) for event in result['events']]
-        process_event_batch.delay(event_ids)
-        
-        return Response({'status': 'success', 'event_count': len(event_ids)}, 
+    # Checked before request.data decodes the body
+    throttled = check_ingest_limits('batch', get_client_ip(request))
+    if throttled:
+        return throttled_response(throttled)
+    
+    if isinstance(request.data, EventStream):
+        # Device ids are only known while decoding, so streams are limited per IP
+        return capture_event_stream(request.data)
+    
+    batch, errors = validate_batch(request.data)
+    if errors:
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    throttled = check_ingest_limits('batch', None, [event['device_id'] for event in batch])
+    if throttled:
+        return throttled_response(throttled)
+    
+    if is_buffered_mode():
+        try:
+            enqueue_events(batch)
+        except BufferFull:
+            return buffer_full_response()
+        return Response({'status': 'success', 'event_count': len(batch)},
                       status=status.HTTP_202_ACCEPTED)
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Save all events; process_pending_events picks them up
+    events = bulk_create_events(batch)
+    
+    return Response({'status': 'success', 'event_count': len(events)}, 
+                  status=status.HTTP_202_ACCEPTED)
+
+
+def capture_event_stream(events):
+    """
+    Validate and store a streamed upload one MAX_BATCH_SIZE chunk at a time.
+    
+    Chunks are committed as they go, so a failure part-way through reports
+    how far the upload got (see stream_progress) for the client to resume.
+    """
+    stored = 0
+    resume_from = 0
+    rejected = {}
+    try:
+        for batch, errors, consumed in validate_stream(events):
+            if batch:
+                if is_buffered_mode():
+                    try:
+                        enqueue_events(batch)
+                    except BufferFull:
+                        return buffer_full_response(stream_progress(stored, resume_from))
+                else:
+                    bulk_create_events(batch)
+                stored += len(batch)
+            rejected.update(errors)
+            resume_from = consumed
+    except APIException as e:
+        # The rest of the body could not be decoded, e.g. a truncated gzip
+        return Response({'detail': e.detail, **stream_progress(stored, resume_from)}, status=e.status_code)
+    
+    payload, status_code = stream_summary(stored, rejected)
+    return Response(payload, status=status_code)
 
 
 @api_view(['POST'])
@@ -67,18 +199,36 @@ def session_end(request, session_id):
     """
     Endpoint to end an existing session.
     """
-    try:
-        session = Session.objects.get(id=session_id)
-    except Session.DoesNotExist:
-        return Response({'error': 'Session not found'}, status=status.HTTP_404_NOT_FOUND)
-    
-    session.end_time = timezone.now()
-    session.calculate_duration()
-    session.save()
+    with transaction.atomic():
+        # Locked so the session closer cannot end it concurrently
+        try:
+            session = Session.objects.select_for_update().get(id=session_id)
+        except Session.DoesNotExist:
+            return Response({'error': 'Session not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        # Ending is idempotent: a session that already ended keeps the
+        # end it was counted with in its SessionAggregate row
+        if session.end_time is None:
+            session.end_time = timezone.now()
+            session.calculate_duration()
+            session.save()
+            record_ended_sessions([session.pk])
     
     return Response(SessionSerializer(session).data)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def dimension_cache_stats(request):
+    """
+    Admin API: hit/miss counters of the DeviceInfo and LocationInfo caches.
+    
+    Totals are summed over all web and worker processes, which is what
+    DIMENSION_CACHE_LOCAL_SIZE and the TTLs should be sized against.
+    """
+    return Response(cache_stats())
+
+
 class FeatureFlagViewSet(mixins.ListModelMixin,
                        mixins.RetrieveModelMixin,
                        viewsets.GenericViewSet):
@@ -101,22 +251,17 @@ class FeatureFlagViewSet(mixins.ListModelMixin,
         if not distinct_id:
             return Response({'error': 'distinct_id parameter is required'}, 
                           status=status.HTTP_400_BAD_REQUEST)
-            
-        # In a real implementation, you would calculate which
-        # flags apply to this user based on rollout percentage
-        # For simplicity, we're just returning all active flags
-        flags = self.get_queryset()
-        
-        # Convert to dictionary for easier consumption by SDK
-        flags_dict = {
-            flag.key: {
-                'active': flag.active,
-                'name': flag.name,
-                'rollout_percentage': flag.rollout_percentage
-            } for flag in flags
-        }
         
-        return Response(flags_dict)
+        # Served from the in-memory flag snapshot, without a database query
+        snapshot = get_snapshot()
+        etag = snapshot.etag(distinct_id)
+        if etag in request.headers.get('If-None-Match', ''):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            # 'enabled' reflects the user's deterministic rollout bucket
+            response = Response(snapshot.evaluate(distinct_id))
+        response['ETag'] = etag
+        return response
 
 
 # Admin-only analytics views
@@ -128,10 +273,23 @@ class EventViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = EventSerializer
     permission_classes = [IsAuthenticated, IsAdminUser]
     filterset_fields = ['event_type', 'distinct_id', 'device_id']
+    # Keyset pages on (timestamp, id) without COUNT(*) or OFFSET
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
         queryset = Event.objects.all()
         
+        # Load only what the (possibly sparse) response needs
+        fields = self.get_serializer().requested_fields
+        related = [
+            name for name, field in (('device', 'device_info'), ('location', 'location_info'))
+            if fields is None or field in fields
+        ]
+        if related:
+            queryset = queryset.select_related(*related)
+        if fields is not None and 'properties' not in fields:
+            queryset = queryset.defer('properties')
+        
         # Filter by date range
         start_date = self.request.query_params.get('start_date')
         end_date = self.request.query_params.get('end_date')
@@ -143,16 +301,56 @@ class EventViewSet(viewsets.ReadOnlyModelViewSet):
             
         return queryset
     
+    @action(detail=False, methods=['GET'])
+    def export(self, request):
+        """
+        Stream every matching event as NDJSON, CSV or Parquet.
+        
+        Takes the same filters as the list; choose the encoding with
+        ?output=ndjson|csv|parquet. Rows are read with a server-side cursor,
+        so memory use does not depend on the size of the export, under
+        WSGI and ASGI alike.
+        """
+        export_format = request.query_params.get('output', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({'output': [f"Choose one of: {', '.join(EXPORT_FORMATS)}"]})
+        
+        rows = export_rows(self.filter_queryset(self.get_queryset()))
+        try:
+            content = stream_export(rows, export_format)
+        except ExportUnavailable as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if isinstance(request._request, ASGIRequest):
+            # ASGI would otherwise buffer a sync iterator in full
+            content = aiter_chunks(content)
+        content_type, extension = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="events-{timezone.now():%Y%m%dT%H%M%S}.{extension}"'
+        )
+        return response
+    
     @action(detail=False, methods=['GET'])
     def event_counts(self, request):
         """
         Get event counts grouped by event type.
+        
+        Optional start and end query parameters (ISO date or datetime, end
+        exclusive) limit the range; by default all events are counted.
+        Answered from aggregates plus the not-yet-aggregated tail, and cached.
         """
-        counts = Event.objects.values('event_type') \
-                     .annotate(count=Count('id')) \
-                     .order_by('-count')
+        start = parse_range_param(request.query_params.get('start'))
+        end = parse_range_param(request.query_params.get('end'))
+        if (request.query_params.get('start') and start is None) or \
+                (request.query_params.get('end') and end is None):
+            return Response({'error': 'start and end must be ISO dates or datetimes'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        if start and end and start >= end:
+            return Response({'error': 'start must precede end'},
+                          status=status.HTTP_400_BAD_REQUEST)
         
-        return Response(counts)
+        return Response(get_event_counts(start, end))
 
 
 class SessionViewSet(viewsets.ReadOnlyModelViewSet):
@@ -181,4 +379,59 @@ class EventAggregateViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = EventAggregate.objects.all()
     serializer_class = EventAggregateSerializer
     permission_classes = [IsAuthenticated, IsAdminUser]
-    filterset_fields = ['event_type', 'date'] 
\ No newline at end of file
+    filterset_fields = ['event_type', 'date']
+    
+    @action(detail=False, methods=['GET'])
+    def unique_users(self, request):
+        """
+        Estimate unique users over a time range by merging aggregate sketches.
+        
+        Query parameters: start and end (ISO date or datetime, end exclusive)
+        and optionally one or more event_type values.
+        """
+        start = parse_range_param(request.query_params.get('start'))
+        end = parse_range_param(request.query_params.get('end'))
+        if start is None or end is None or start >= end:
+            return Response({'error': 'start and end parameters are required and start must precede end'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        event_types = request.query_params.getlist('event_type')
+        sketch = estimate_unique_users(start, end, event_types)
+        
+        return Response({
+            'start': start,
+            'end': end,
+            'event_types': event_types,
+            'unique_users': sketch.count(),
+            'standard_error': round(sketch.standard_error, 4),
+        })
+    
+    @action(detail=False, methods=['GET'])
+    def breakdown(self, request):
+        """
+        Count events over a time range grouped by one or more dimensions.
+        
+        Query parameters: start and end (ISO date or datetime, end exclusive),
+        one or more dimension values (e.g. os_name, app_version, country), an
+        optional limit, and any dimension as a filter (e.g. event_type=purchase).
+        Answered from the smallest rollup cube that covers the request.
+        """
+        start = parse_range_param(request.query_params.get('start'))
+        end = parse_range_param(request.query_params.get('end'))
+        if start is None or end is None or start >= end:
+            return Response({'error': 'start and end parameters are required and start must precede end'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        dimensions = request.query_params.getlist('dimension')
+        filters = {
+            name: request.query_params[name] for name in DIMENSIONS if name in request.query_params
+        }
+        if 'is_simulator' in filters:
+            filters['is_simulator'] = filters['is_simulator'].lower() in ('1', 'true')
+        try:
+            limit = int(request.query_params['limit']) if 'limit' in request.query_params else None
+            rows = breakdown(dimensions, start, end, filters, limit=limit)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(rows)
@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 from celery import Celery
 from celery.schedules import crontab
 
@@ -16,6 +17,22 @@ app.autodiscover_tasks()
 
 # Define scheduled tasks
 app.conf.beat_schedule = {
+    'flush-event-buffer': {
+        'task': 'apps.analytics.tasks.flush_event_buffer',
+        'schedule': timedelta(seconds=5),  # Drain the ingestion buffer every 5 seconds
+    },
+    'process-pending-events': {
+        'task': 'apps.analytics.tasks.process_pending_events',
+        'schedule': timedelta(seconds=10),  # Claim unprocessed events in chunks
+    },
+    'check-ingest-health': {
+        'task': 'apps.analytics.tasks.check_ingest_health',
+        'schedule': timedelta(seconds=5),  # Drives load shedding on the capture endpoints
+    },
+    'warm-session-index': {
+        'task': 'apps.analytics.tasks.warm_session_index',
+        'schedule': timedelta(minutes=1),  # Rebuilds the open session index when it goes cold
+    },
     'close-inactive-sessions': {
         'task': 'apps.analytics.tasks.close_inactive_sessions',
         'schedule': crontab(minute='*/10'),  # Run every 10 minutes
@@ -26,12 +43,20 @@ app.conf.beat_schedule = {
     },
     'aggregate-hourly-events': {
         'task': 'apps.analytics.tasks.aggregate_hourly_events',
-        'schedule': crontab(minute=5),  # Run 5 minutes past every hour
+        'schedule': crontab(minute='*/5'),  # Incremental, run every 5 minutes
+    },
+    'aggregate-rollup-cubes': {
+        'task': 'apps.analytics.tasks.aggregate_rollup_cubes',
+        'schedule': crontab(minute='*/5'),  # Incremental, run every 5 minutes
     },
     'cleanup-old-events': {
         'task': 'apps.analytics.scheduled_tasks.cleanup_old_events',
         'schedule': crontab(hour=2, minute=0),  # Run at 2:00 AM every day
     },
+    'create-event-partitions': {
+        'task': 'apps.analytics.scheduled_tasks.create_event_partitions',
+        'schedule': crontab(hour=0, minute=30),  # Run at 12:30 AM every day
+    },
     'generate-daily-report': {
         'task': 'apps.analytics.scheduled_tasks.generate_daily_report',
         'schedule': crontab(hour=6, minute=0),  # Run at 6:00 AM every day
@@ -201,5 +201,65 @@ CELERY_TASK_TIME_LIMIT = 30 * 60
 EVENT_TRACKING = {
     'SESSION_TIMEOUT_MINUTES': 30,
     'MAX_BATCH_SIZE': 1000,
+    # NDJSON/msgpack uploads are stored in MAX_BATCH_SIZE chunks up to this many events
+    'STREAM_MAX_EVENTS': 100000,
+    'BATCH_MAX_DECOMPRESSED_BYTES': 200 * 1024 * 1024,  # Cap on gzip/zstd bodies after decoding
     'RETENTION_DAYS': 365,  # How long to keep raw event data
+    # 'sync' writes events to Postgres inside the request, 'buffered' appends
+    # them to a Redis stream drained by the flush_event_buffer task
+    'INGESTION_MODE': os.environ.get('INGESTION_MODE', 'sync'),
+    'BUFFER_STREAM_KEY': 'analytics:event_buffer',
+    'BUFFER_MAX_LENGTH': 1000000,  # Reject new events with 503 beyond this backlog
+    'BUFFER_FLUSH_CHUNK_SIZE': 5000,
+    'BUFFER_CLAIM_IDLE_SECONDS': 300,  # Redeliver entries a crashed flusher left pending
+    # Batches of at least this many events are written with COPY instead of INSERT
+    'COPY_MIN_ROWS': 500,
+    # Serve /capture/, /batch/ and /session/start/ from async views (run under ASGI)
+    'ASYNC_INGESTION': os.environ.get('ASYNC_INGESTION', '0') == '1',
+    'BUFFER_REDIS_MAX_CONNECTIONS': 100,  # Pool size of the async buffer client
+    # Reverse proxies (nginx) that append to X-Forwarded-For; the client IP is read that many hops from the right
+    'TRUSTED_PROXY_COUNT': int(os.environ.get('TRUSTED_PROXY_COUNT', '1')),
+    # Token buckets for the public capture endpoints, keyed by client IP and device_id
+    'RATE_LIMIT_ENABLED': os.environ.get('RATE_LIMIT_ENABLED', '1') == '1',
+    'RATE_LIMITS': {
+        'capture': {'ip': '100/minute', 'device': '100/minute'},
+        'batch': {'ip': '20/minute', 'device': '20/minute'},
+    },
+    # Answer capture requests with 503 while the buffer backlog or DB latency is too high
+    'SHED_BUFFER_BACKLOG': 500000,
+    'SHED_DB_LATENCY_MS': 500,
+    'SHED_RETRY_AFTER': 30,
+    'SHED_HOLD_SECONDS': 15,  # Shedding lapses if check_ingest_health stops running
+    # Hours a stored event_id is remembered in Redis to drop SDK retries and redeliveries
+    'DEDUP_WINDOW_HOURS': 2,
+    # Open sessions are rebuilt into the Redis session index this often, repairing any drift
+    'SESSION_INDEX_REBUILD_SECONDS': 3600,
+    # Per-process LRU in front of the Redis cache for DeviceInfo/LocationInfo
+    'DIMENSION_CACHE_LOCAL_SIZE': 10000,
+    'DIMENSION_CACHE_LOCAL_TTL': 300,
+    'DIMENSION_CACHE_SHARED_TTL': 3600,
+    # Each process adds its cache hit/miss counts to the shared totals this often
+    'DIMENSION_CACHE_STATS_FLUSH_SECONDS': 60,
+    # Known devices rewrite DeviceInfo.last_seen at most this often
+    'DEVICE_LAST_SEEN_REFRESH_SECONDS': 3600,
+    # How often each process checks whether feature flags changed
+    'FEATURE_FLAG_CHECK_SECONDS': 5,
+    # Events younger than this are left for the next aggregation run
+    'AGGREGATION_LAG_SECONDS': 60,
+    # Aggregation re-scans events created this far behind its checkpoint; must exceed
+    # the longest transaction that writes events (bulk COPY loads, buffer flushes)
+    'AGGREGATION_RESCAN_SECONDS': 900,
+    'DASHBOARD_CACHE_SECONDS': 60,
+    'EVENT_COUNTS_CACHE_SECONDS': 60,  # For event_counts ranges that include not-yet-aggregated events
+    # Hourly rollup cubes of event counts, name -> dimensions (see apps.analytics.rollup_cube);
+    # a breakdown is answered from the cube with the fewest dimensions that covers it
+    'ROLLUP_CUBES': {
+        'os': ['event_type', 'os_name'],
+        'app_version': ['event_type', 'app_version'],
+        'country': ['event_type', 'country'],
+        'device': ['event_type', 'os_name', 'app_version', 'is_simulator'],
+    },
+    # Range partitioning of analytics_event ('day' or 'month'), see partition_events
+    'PARTITION_INTERVAL': os.environ.get('EVENT_PARTITION_INTERVAL', 'month'),
+    'PARTITION_PREMAKE': 3,  # Future partitions kept ready ahead of time
 }
\ No newline at end of file